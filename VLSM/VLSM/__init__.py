@@ -1,3 +1,4 @@
 from .map_generator import generate_map
+from .vlsm import Subnet, VLSMPlan, allocate
 
-__all__ = ["generate_map"]
+__all__ = ["generate_map", "Subnet", "VLSMPlan", "allocate"]
@@ -0,0 +1,397 @@
+import ipaddress
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+Networks = Iterable[Union[str, ipaddress.IPv4Network, ipaddress.IPv6Network]]
+
+# Rows are parsed in chunks so the per-character scratch matrices stay small
+CHUNK_ROWS = 16384
+# Characters examined per row; longer strings take the ipaddress fallback
+_WIDTH = 48
+_V4_MAX = 15
+_V6_MAX = 39
+
+# Hex digit values by character code, 0xFF for anything else
+_HEX = np.full(256, 0xFF, dtype=np.uint8)
+_HEX[np.frombuffer(b"0123456789", dtype=np.uint8)] = np.arange(10)
+_HEX[np.frombuffer(b"abcdef", dtype=np.uint8)] = np.arange(10, 16)
+_HEX[np.frombuffer(b"ABCDEF", dtype=np.uint8)] = np.arange(10, 16)
+
+_DOT, _COLON, _PERCENT, _SLASH = ord("."), ord(":"), ord("%"), ord("/")
+
+# Special-purpose ranges. "private" follows RFC 1918 / RFC 4193, the other
+# categories their IANA registries; "bogon" is everything that should never
+# appear as a source address on the public internet.
+CATEGORIES: Dict[str, Tuple[str, ...]] = {
+    "private": ("10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16", "fc00::/7"),
+    "loopback": ("127.0.0.0/8", "::1/128"),
+    "link_local": ("169.254.0.0/16", "fe80::/10"),
+    "multicast": ("224.0.0.0/4", "ff00::/8"),
+    "reserved": (
+        "240.0.0.0/4", "::/8", "100::/8", "200::/7", "400::/6", "800::/5", "1000::/4", "4000::/3",
+        "6000::/3", "8000::/3", "a000::/3", "c000::/3", "e000::/4", "f000::/5", "f800::/6", "fe00::/9",
+    ),
+    "bogon": (
+        "0.0.0.0/8", "10.0.0.0/8", "100.64.0.0/10", "127.0.0.0/8", "169.254.0.0/16", "172.16.0.0/12",
+        "192.0.0.0/24", "192.0.2.0/24", "192.168.0.0/16", "198.18.0.0/15", "198.51.100.0/24",
+        "203.0.113.0/24", "224.0.0.0/4", "240.0.0.0/4",
+        # IPv6: everything outside global unicast, plus the non-routable parts inside it
+        "::/3", "4000::/2", "8000::/1", "2001:2::/48", "2001:10::/28", "2001:db8::/32", "3fff::/20",
+    ),
+}
+
+
+class AddressBatch:
+    """
+    Parsed addresses as columns: `version` (0 for invalid, 4 or 6) as uint8 and the
+    address as two uint64 halves, `hi` and `lo` (IPv4 in the low half of `lo`).
+    """
+
+    __slots__ = ("version", "hi", "lo")
+
+    def __init__(self, version: np.ndarray, hi: np.ndarray, lo: np.ndarray):
+        self.version = version
+        self.hi = hi
+        self.lo = lo
+
+    def __len__(self) -> int:
+        return len(self.version)
+
+    @property
+    def valid(self) -> np.ndarray:
+        return self.version != 0
+
+    @property
+    def is_ipv4(self) -> np.ndarray:
+        return self.version == 4
+
+    @property
+    def is_ipv6(self) -> np.ndarray:
+        return self.version == 6
+
+    def ipv4(self) -> np.ndarray:
+        """
+        uint32 values of all rows (0 where the row is not IPv4).
+        """
+        return np.where(self.is_ipv4, self.lo, 0).astype(np.uint32)
+
+    def __getitem__(self, selection) -> "AddressBatch":
+        return AddressBatch(self.version[selection], self.hi[selection], self.lo[selection])
+
+    def to_strings(self) -> List[Optional[str]]:
+        """
+        Formats the rows back to strings (None for invalid rows); Python-level, for output only.
+        """
+        result: List[Optional[str]] = []
+        for version, hi, lo in zip(self.version.tolist(), self.hi.tolist(), self.lo.tolist()):
+            if version == 4:
+                result.append(str(ipaddress.IPv4Address(lo)))
+            elif version == 6:
+                result.append(str(ipaddress.IPv6Address((hi << 64) | lo)))
+            else:
+                result.append(None)
+        return result
+
+
+def _as_strings(addresses) -> np.ndarray:
+    arr = np.asarray(addresses)
+    if arr.dtype.kind not in "SU":
+        arr = np.asarray([str(a) for a in arr.ravel()])
+    return arr.ravel()
+
+
+def _char_columns(arr: np.ndarray) -> np.ndarray:
+    """
+    Column-major uint8 character matrix (width x rows) of a chunk of strings,
+    zero-padded. Non-ASCII characters map to 0xFF, which no parser accepts.
+    """
+    if arr.dtype.kind == "S":
+        return np.ascontiguousarray(arr.view(np.uint8).reshape(len(arr), arr.dtype.itemsize).T)
+    codes = arr.view(np.uint32).reshape(len(arr), arr.dtype.itemsize // 4).T
+    return np.minimum(codes, 0xFF).astype(np.uint8, order="C")
+
+
+def _octet_ok(octet: np.ndarray, digits: np.ndarray) -> np.ndarray:
+    # 1-3 digits, at most 255, no leading zero
+    return (
+        (digits >= 1) & (digits <= 3) & (octet <= 255)
+        & ((digits == 1) | ((digits == 2) & (octet >= 10)) | ((digits == 3) & (octet >= 100)))
+    )
+
+
+def _parse_v4(c: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Dotted quads from a (width x rows) character matrix, one column at a time:
+    digits accumulate into the current octet, each dot validates it and shifts
+    it into the result. Updates are masked arithmetic rather than np.where, which
+    keeps every step a branch-free pass over a column.
+    """
+    rows = c.shape[1]
+    ok = c[0] != 0
+    ended = np.zeros(rows, dtype=bool)
+    dots = np.zeros(rows, dtype=np.uint8)
+    digits = np.zeros(rows, dtype=np.uint8)
+    octet = np.zeros(rows, dtype=np.uint16)
+    value = np.zeros(rows, dtype=np.uint32)
+    for j in range(min(c.shape[0], _V4_MAX + 1)):
+        ch = c[j]
+        pad = ch == 0
+        d = ch - np.uint8(48)  # wraps around for anything below '0'
+        digit = d <= 9
+        dot = ch == _DOT
+        ok &= (digit | dot | pad) & (~ended | pad)
+        dm = digit.view(np.uint8)
+        octet = octet * (dm * np.uint8(9) + np.uint8(1)) + d * dm
+        digits += dm
+        ok &= ~dot | _octet_ok(octet, digits)
+        cm = dot.view(np.uint8)
+        value = value * (cm.astype(np.uint32) * np.uint32(255) + np.uint32(1)) + octet * cm
+        keep = np.uint8(1) - cm
+        octet *= keep
+        digits *= keep
+        dots += cm
+        ended |= pad
+    if c.shape[0] > _V4_MAX + 1:
+        ok &= ~np.any(c[_V4_MAX + 1:] != 0, axis=0)
+    ok &= (dots == 3) & _octet_ok(octet, digits)
+    value = (value << np.uint32(8)) | octet
+    return (value * ok).astype(np.uint64), ok
+
+
+def _shift_left(hi: np.ndarray, lo: np.ndarray, bits: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-row 128-bit left shift by 0..128 bits.
+    """
+    bits = bits.astype(np.uint64)
+    small = bits < 64
+    s = np.where(small, bits, 0)
+    carry = np.where(s == 0, 0, lo >> (np.uint64(64) - np.maximum(s, 1)))
+    new_hi = np.where(small, (hi << s) | carry, np.where(bits < 128, lo << (bits - np.uint64(64)) % np.uint64(64), 0))
+    new_lo = np.where(small, lo << s, 0)
+    return new_hi.astype(np.uint64), new_lo.astype(np.uint64)
+
+
+def _shift_right(hi: np.ndarray, lo: np.ndarray, bits: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-row 128-bit right shift by 0..128 bits.
+    """
+    bits = bits.astype(np.uint64)
+    small = bits < 64
+    s = np.where(small, bits, 0)
+    carry = np.where(s == 0, 0, hi << (np.uint64(64) - np.maximum(s, 1)))
+    new_lo = np.where(small, (lo >> s) | carry, np.where(bits < 128, hi >> (bits - np.uint64(64)) % np.uint64(64), 0))
+    new_hi = np.where(small, hi >> s, 0)
+    return new_hi.astype(np.uint64), new_lo.astype(np.uint64)
+
+
+def _parse_v6(c: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Colon-hex addresses from a (width x rows) character matrix, one column at a
+    time. Groups are shifted into a 128-bit accumulator as they complete; the
+    groups after "::" end up right-aligned and the ones before it are moved
+    into place once at the end.
+    """
+    rows = c.shape[1]
+    width = c.shape[0]
+    ok = np.ones(rows, dtype=bool)
+    ended = np.zeros(rows, dtype=bool)
+    zone = np.zeros(rows, dtype=bool)
+    hi = np.zeros(rows, dtype=np.uint64)
+    lo = np.zeros(rows, dtype=np.uint64)
+    group = np.zeros(rows, dtype=np.uint32)
+    digits = np.zeros(rows, dtype=np.uint8)
+    groups = np.zeros(rows, dtype=np.uint8)
+    double = np.zeros(rows, dtype=bool)
+    before_double = np.zeros(rows, dtype=np.uint8)
+    prev_colon = np.zeros(rows, dtype=bool)
+    prev2_colon = np.zeros(rows, dtype=bool)
+    blank = np.zeros(rows, dtype=np.uint8)
+    for j in range(width + 1):
+        ch = c[j] if j < width else blank
+        # a zone index ("fe80::1%eth0") ends the address part; it must be non-empty
+        # and contain neither "%" nor "/"
+        percent = ch == _PERCENT
+        ok &= ~(zone & (percent | (ch == _SLASH)))
+        opens = percent & ~zone
+        if j + 1 < width:
+            ok &= ~opens | (c[j + 1] != 0)
+        else:
+            ok &= ~opens
+        zone |= opens
+        pad = (ch == 0) | zone
+        h = _HEX.take(ch)
+        hexdigit = (h <= 15) & ~zone
+        colon = (ch == _COLON) & ~zone
+        ok &= (ended | pad | hexdigit | colon) & (~ended | pad)
+        if j > _V6_MAX:
+            ok &= ended | pad
+        hm = hexdigit.view(np.uint8)
+        group = group * (hm * np.uint8(15) + np.uint8(1)) + h * hm
+        digits += hm
+        ok &= digits <= 4
+
+        second = colon & prev_colon  # the second colon of "::"
+        ok &= ~(second & double)
+        before_double += groups * second.view(np.uint8)
+        double |= second
+        # an empty field is only allowed before the "::" at the very start
+        lone = colon & ~second & (digits == 0)
+        if j == 0 and width > 1:
+            ok &= ~lone | (c[1] == _COLON)
+        elif j > 0:
+            ok &= ~lone
+        end = pad & ~ended
+        # the string may end with "::", otherwise its last field must be non-empty
+        ok &= ~(end & (digits == 0)) | (prev_colon & prev2_colon)
+        commit = (colon | end) & (digits > 0)
+        # per-element shift counts make numpy's shifts branchy; multiply by 1 or 2**16 instead
+        cm = commit.view(np.uint8).astype(np.uint64)
+        scale = cm * np.uint64(0xFFFF) + np.uint64(1)
+        hi = hi * scale + (lo >> np.uint64(48)) * cm
+        lo = lo * scale + group * cm
+        groups += commit.view(np.uint8)
+        keep = (~(commit | colon)).view(np.uint8)
+        group *= keep
+        digits *= keep
+        prev2_colon = prev_colon
+        prev_colon = colon
+        ended |= pad
+    ok &= np.where(double, groups <= 7, groups == 8)
+
+    # acc = left groups followed by right groups; move the left ones up past the gap
+    right = (groups.astype(np.int16) - before_double).clip(0) * 16
+    right = np.where(double, right, 128)
+    left_hi, left_lo = _shift_right(hi, lo, right)
+    left_hi, left_lo = _shift_left(left_hi, left_lo, np.where(double, 128 - before_double.astype(np.int16) * 16, 0))
+    mask_hi, mask_lo = _shift_left(np.zeros(rows, np.uint64), np.ones(rows, np.uint64), right)
+    keep_hi = np.where(right >= 128, np.uint64(0xFFFFFFFFFFFFFFFF), np.where(right > 64, mask_hi - np.uint64(1), 0))
+    keep_lo = np.where(right >= 64, np.uint64(0xFFFFFFFFFFFFFFFF), mask_lo - np.uint64(1))
+    hi = np.where(ok, left_hi | (hi & keep_hi), 0).astype(np.uint64)
+    lo = np.where(ok, left_lo | (lo & keep_lo), 0).astype(np.uint64)
+    return hi, lo, ok
+
+
+def _fallback(text) -> Tuple[int, int, int]:
+    if isinstance(text, bytes):
+        text = text.decode("ascii", "replace")
+    try:
+        address = ipaddress.ip_address(str(text))
+    except ValueError:
+        return 0, 0, 0
+    value = int(address)
+    return address.version, value >> 64, value & 0xFFFFFFFFFFFFFFFF
+
+
+def parse(addresses: Union[Sequence[str], np.ndarray]) -> AddressBatch:
+    """
+    Parses and validates a batch of IPv4/IPv6 strings (or bytes) with array operations.
+
+    Validation is as strict as ipaddress.ip_address(): octets above 255, leading
+    zeros, bad group counts or misplaced "::" are rejected. IPv6 zone indexes are
+    accepted and dropped. Only rare forms (IPv6 with an embedded dotted quad,
+    strings longer than 48 characters) are handed to ipaddress one by one.
+    """
+    arr = _as_strings(addresses)
+    n = len(arr)
+    version = np.zeros(n, dtype=np.uint8)
+    hi = np.zeros(n, dtype=np.uint64)
+    lo = np.zeros(n, dtype=np.uint64)
+    slow = []
+    for start in range(0, n, CHUNK_ROWS):
+        c = _char_columns(arr[start:start + CHUNK_ROWS])
+        if c.shape[0] > _WIDTH:
+            too_long = np.any(c[_WIDTH:] != 0, axis=0)
+            c = c[:_WIDTH]
+        else:
+            too_long = np.zeros(c.shape[1], dtype=bool)
+        # numpy pads to the longest string in the whole input; drop the all-padding tail
+        used = np.flatnonzero(c.any(axis=1))
+        c = c[:used[-1] + 1 if len(used) else 1]
+        has_colon = np.any(c == _COLON, axis=0)
+        tricky = too_long | (has_colon & np.any(c == _DOT, axis=0))
+        slow.append(np.flatnonzero(tricky) + start)
+
+        v4 = np.flatnonzero(~has_colon & ~tricky)
+        if len(v4):
+            value, ok = _parse_v4(c.take(v4, axis=1))
+            rows = v4[ok] + start
+            version[rows] = 4
+            lo[rows] = value[ok]
+
+        v6 = np.flatnonzero(has_colon & ~tricky)
+        if len(v6):
+            v6_hi, v6_lo, ok = _parse_v6(c.take(v6, axis=1))
+            rows = v6[ok] + start
+            version[rows] = 6
+            hi[rows] = v6_hi[ok]
+            lo[rows] = v6_lo[ok]
+
+    slow_rows = np.concatenate(slow) if slow else np.zeros(0, dtype=np.int64)
+    for i in slow_rows.tolist():
+        version[i], hi[i], lo[i] = _fallback(arr[i])
+    return AddressBatch(version, hi, lo)
+
+
+def _networks(networks: Networks) -> List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]:
+    return [n if isinstance(n, (ipaddress.IPv4Network, ipaddress.IPv6Network)) else ipaddress.ip_network(n)
+            for n in networks]
+
+
+def in_networks(batch: AddressBatch, networks: Networks) -> np.ndarray:
+    """
+    Boolean mask of the rows inside any of `networks` (CIDR strings or ipaddress networks).
+
+    Networks are grouped by prefix length; each group costs one mask-and-isin pass
+    over the batch, so the work is O(rows x distinct prefix lengths) regardless of
+    how many networks there are.
+    """
+    mask = np.zeros(len(batch), dtype=bool)
+    by_length: Dict[Tuple[int, int], List[int]] = {}
+    for network in _networks(networks):
+        by_length.setdefault((network.version, network.prefixlen), []).append(int(network.network_address))
+
+    for (version, prefixlen), starts in by_length.items():
+        rows = batch.version == version
+        if not rows.any():
+            continue
+        if version == 4:
+            netmask = np.uint64((0xFFFFFFFF << (32 - prefixlen)) & 0xFFFFFFFF)
+            keys = batch.lo & netmask
+            mask |= rows & np.isin(keys, np.array(starts, dtype=np.uint64))
+        elif prefixlen <= 64:
+            netmask = np.uint64((0xFFFFFFFFFFFFFFFF << (64 - prefixlen)) & 0xFFFFFFFFFFFFFFFF)
+            mask |= rows & np.isin(batch.hi & netmask, np.array([s >> 64 for s in starts], dtype=np.uint64))
+        else:
+            netmask = np.uint64((0xFFFFFFFFFFFFFFFF << (128 - prefixlen)) & 0xFFFFFFFFFFFFFFFF)
+            net_hi = np.array([s >> 64 for s in starts], dtype=np.uint64)
+            net_lo = np.array([s & 0xFFFFFFFFFFFFFFFF for s in starts], dtype=np.uint64)
+            candidates = np.flatnonzero(rows & np.isin(batch.hi, net_hi))
+            if len(candidates):
+                # compare both halves at once as 16-byte keys
+                keys = np.stack([batch.hi[candidates], batch.lo[candidates] & netmask], axis=1)
+                nets = np.stack([net_hi, net_lo], axis=1)
+                hit = np.isin(keys.view("V16").ravel(), nets.view("V16").ravel())
+                mask[candidates[hit]] = True
+    return mask
+
+
+def classify(batch: AddressBatch, categories: Sequence[str] = tuple(CATEGORIES)) -> Dict[str, np.ndarray]:
+    """
+    One boolean mask per category ("private", "loopback", "link_local", "multicast",
+    "reserved", "bogon"), plus "global": valid and not a bogon.
+    """
+    masks = {name: in_networks(batch, CATEGORIES[name]) for name in categories}
+    bogon = masks["bogon"] if "bogon" in masks else in_networks(batch, CATEGORIES["bogon"])
+    masks["global"] = batch.valid & ~bogon
+    return masks
+
+
+def filter_global(addresses: Union[Sequence[str], np.ndarray]) -> np.ndarray:
+    """
+    The valid, publicly routable entries of `addresses`, e.g. to drop private and
+    special ranges before any geolocation lookup.
+    """
+    addresses = np.asarray(addresses)
+    batch = parse(addresses)
+    return addresses[batch.valid & ~in_networks(batch, CATEGORIES["bogon"])]
@@ -0,0 +1,259 @@
+import heapq
+import ipaddress
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+Requirement = Union[int, Tuple[str, int]]
+
+
+class Subnet:
+    """
+    One allocated subnet. Addresses are kept as integers; the ipaddress objects and
+    strings are only built when asked for.
+    """
+
+    __slots__ = ("version", "network_int", "prefixlen", "requested_hosts", "name")
+
+    def __init__(self, version: int, network_int: int, prefixlen: int, requested_hosts: int, name: Optional[str] = None):
+        self.version = version
+        self.network_int = network_int
+        self.prefixlen = prefixlen
+        self.requested_hosts = requested_hosts
+        self.name = name
+
+    @property
+    def _bits(self) -> int:
+        return 32 if self.version == 4 else 128
+
+    @property
+    def size(self) -> int:
+        return 1 << (self._bits - self.prefixlen)
+
+    def _address(self, value: int) -> str:
+        return str(ipaddress.IPv4Address(value) if self.version == 4 else ipaddress.IPv6Address(value))
+
+    @property
+    def network(self) -> Union[ipaddress.IPv4Network, ipaddress.IPv6Network]:
+        if self.version == 4:
+            return ipaddress.IPv4Network((self.network_int, self.prefixlen))
+        return ipaddress.IPv6Network((self.network_int, self.prefixlen))
+
+    @property
+    def broadcast(self) -> Optional[str]:
+        """
+        Broadcast address (IPv4 only; IPv6 has no broadcast and returns None).
+        """
+        if self.version != 4:
+            return None
+        return self._address(self.network_int + self.size - 1)
+
+    @property
+    def usable_hosts(self) -> int:
+        if self.version == 4 and self.prefixlen < 31:
+            return self.size - 2
+        return self.size
+
+    @property
+    def first_host(self) -> str:
+        offset = 1 if self.version == 4 and self.prefixlen < 31 else 0
+        return self._address(self.network_int + offset)
+
+    @property
+    def last_host(self) -> str:
+        offset = 2 if self.version == 4 and self.prefixlen < 31 else 1
+        return self._address(self.network_int + self.size - offset)
+
+    @property
+    def waste(self) -> int:
+        return self.usable_hosts - self.requested_hosts
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "name": self.name,
+            "requested_hosts": self.requested_hosts,
+            "network": str(self.network),
+            "prefixlen": self.prefixlen,
+            "broadcast": self.broadcast,
+            "first_host": self.first_host,
+            "last_host": self.last_host,
+            "usable_hosts": self.usable_hosts,
+            "waste": self.waste,
+        }
+
+    def __repr__(self) -> str:
+        label = f"{self.name}: " if self.name is not None else ""
+        return f"<Subnet {label}{self.network} hosts={self.requested_hosts} waste={self.waste}>"
+
+
+class VLSMPlan:
+    """
+    Incremental VLSM allocator over one parent prefix (IPv4 or IPv6).
+
+    Free space is kept as a buddy allocator: one free set per prefix length, plus a
+    min-heap so the lowest address is handed out first. Allocating splits the
+    smallest free block that fits; releasing merges a block with its buddy for as
+    long as the buddy is free. Both cost O(address bits), however many subnets the
+    plan already holds.
+
+    IPv4 subnets reserve the network and broadcast addresses, so a requirement of
+    `h` hosts gets the smallest block of at least h + 2 addresses. IPv6 subnets use
+    every address but are never smaller than `ipv6_min_subnet` (a /64 by default,
+    as SLAAC needs).
+    """
+
+    def __init__(self, parent: str, ipv6_min_subnet: int = 64):
+        self.parent = ipaddress.ip_network(parent, strict=True)
+        self.version = self.parent.version
+        self.bits = self.parent.max_prefixlen
+        self.max_prefixlen = self.bits if self.version == 4 else ipv6_min_subnet
+        if self.parent.prefixlen > self.max_prefixlen:
+            raise ValueError(f"{self.parent} is smaller than the minimum subnet /{self.max_prefixlen}")
+        self._free: Dict[int, set] = {}
+        self._heaps: Dict[int, List[int]] = {}
+        self._allocated: Dict[Tuple[int, int], Subnet] = {}
+        self._add_free(int(self.parent.network_address), self.parent.prefixlen)
+
+    # -- free lists -----------------------------------------------------------
+
+    def _add_free(self, block: int, prefixlen: int) -> None:
+        self._free.setdefault(prefixlen, set()).add(block)
+        heapq.heappush(self._heaps.setdefault(prefixlen, []), block)
+
+    def _pop_free(self, prefixlen: int) -> Optional[int]:
+        free = self._free.get(prefixlen)
+        if not free:
+            return None
+        heap = self._heaps[prefixlen]
+        while True:
+            block = heapq.heappop(heap)
+            if block in free:  # skip entries already merged away or reserved
+                free.remove(block)
+                return block
+
+    def _take_free(self, block: int, prefixlen: int) -> bool:
+        free = self._free.get(prefixlen)
+        if free and block in free:
+            free.remove(block)
+            heap = self._heaps[prefixlen]
+            if len(heap) > 2 * len(free) + 64:
+                self._heaps[prefixlen] = heap = sorted(free)
+            return True
+        return False
+
+    # -- sizing ---------------------------------------------------------------
+
+    def prefixlen_for(self, hosts: int) -> int:
+        """
+        Longest prefix length whose subnet holds `hosts` usable addresses.
+        """
+        if hosts < 1:
+            raise ValueError(f"host count must be positive, got {hosts}")
+        needed = hosts + 2 if self.version == 4 else hosts
+        prefixlen = self.bits - (needed - 1).bit_length()
+        return min(prefixlen, self.max_prefixlen)
+
+    # -- allocation -----------------------------------------------------------
+
+    def allocate(self, hosts: int, name: Optional[str] = None) -> Subnet:
+        """
+        Allocates the lowest free subnet large enough for `hosts` hosts.
+        Raises ValueError when no free block is big enough.
+        """
+        prefixlen = self.prefixlen_for(hosts)
+        for level in range(prefixlen, self.parent.prefixlen - 1, -1):
+            block = self._pop_free(level)
+            if block is not None:
+                break
+        else:
+            raise ValueError(f"no room in {self.parent} for {hosts} hosts (/{prefixlen})")
+        # split down, returning each upper half to its free list
+        while level < prefixlen:
+            level += 1
+            self._add_free(block + (1 << (self.bits - level)), level)
+        return self._record(block, prefixlen, hosts, name)
+
+    def allocate_many(self, requirements: Iterable[Requirement]) -> List[Subnet]:
+        """
+        Allocates every requirement (a host count or a (name, hosts) pair), largest
+        first, which packs the blocks without fragmentation. Returns the subnets in
+        allocation order.
+        """
+        items = [req if isinstance(req, tuple) else (None, req) for req in requirements]
+        items.sort(key=lambda item: item[1], reverse=True)
+        return [self.allocate(hosts, name) for name, hosts in items]
+
+    def reserve(self, network: str, name: Optional[str] = None, hosts: Optional[int] = None) -> Subnet:
+        """
+        Marks an existing subnet of the plan as used, e.g. when importing a plan.
+        Raises ValueError if it is outside the parent or overlaps an allocation.
+        """
+        net = ipaddress.ip_network(network, strict=True)
+        if net.version != self.version or not net.subnet_of(self.parent):
+            raise ValueError(f"{net} is not inside {self.parent}")
+        target, prefixlen = int(net.network_address), net.prefixlen
+        for level in range(prefixlen, self.parent.prefixlen - 1, -1):
+            block = target & ~((1 << (self.bits - level)) - 1)
+            if self._take_free(block, level):
+                break
+        else:
+            raise ValueError(f"{net} overlaps an allocated subnet")
+        while level < prefixlen:
+            level += 1
+            half = 1 << (self.bits - level)
+            if target >= block + half:
+                self._add_free(block, level)
+                block += half
+            else:
+                self._add_free(block + half, level)
+        usable = net.num_addresses - 2 if self.version == 4 and prefixlen < 31 else net.num_addresses
+        return self._record(block, prefixlen, usable if hosts is None else hosts, name)
+
+    def release(self, subnet: Union[Subnet, str]) -> None:
+        """
+        Returns a subnet to the free space, merging it with free buddies.
+        """
+        if isinstance(subnet, Subnet):
+            key = (subnet.network_int, subnet.prefixlen)
+        else:
+            net = ipaddress.ip_network(subnet, strict=True)
+            key = (int(net.network_address), net.prefixlen)
+        if self._allocated.pop(key, None) is None:
+            raise ValueError(f"{subnet} is not allocated in {self.parent}")
+        block, level = key
+        while level > self.parent.prefixlen:
+            buddy = block ^ (1 << (self.bits - level))
+            if not self._take_free(buddy, level):
+                break
+            block = min(block, buddy)
+            level -= 1
+        self._add_free(block, level)
+
+    def _record(self, block: int, prefixlen: int, hosts: int, name: Optional[str]) -> Subnet:
+        subnet = Subnet(self.version, block, prefixlen, hosts, name)
+        self._allocated[(block, prefixlen)] = subnet
+        return subnet
+
+    # -- reporting ------------------------------------------------------------
+
+    @property
+    def subnets(self) -> List[Subnet]:
+        """
+        Allocated subnets in address order.
+        """
+        return [self._allocated[key] for key in sorted(self._allocated)]
+
+    def free_blocks(self) -> List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]:
+        network = ipaddress.IPv4Network if self.version == 4 else ipaddress.IPv6Network
+        blocks = sorted((block, level) for level, free in self._free.items() for block in free)
+        return [network((block, level)) for block, level in blocks]
+
+    @property
+    def free_addresses(self) -> int:
+        return sum(len(free) << (self.bits - level) for level, free in self._free.items())
+
+
+def allocate(parent: str, requirements: Iterable[Requirement], ipv6_min_subnet: int = 64) -> List[Subnet]:
+    """
+    One-shot VLSM: allocates `requirements` (host counts or (name, hosts) pairs)
+    inside `parent`, largest first, and returns the subnets.
+    """
+    return VLSMPlan(parent, ipv6_min_subnet=ipv6_min_subnet).allocate_many(requirements)
@@ -0,0 +1,98 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# the startup and benchmark tests import their helpers from benchmarks/
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "benchmarks"))
+
+
+def ipapi_response(path):
+    """
+    ipapi.co stand-in: echoes the address in the path; "bad" is an API error and "down" a 503.
+    """
+    ip = path.strip("/").split("/")[0]
+    if ip == "bad":
+        return 200, {"ip": ip, "error": True, "reason": "Invalid IP Address"}
+    if ip == "down":
+        return 503, {}
+    return 200, {"ip": ip, "city": "Testville", "version": "IPv4"}
+
+
+def fixed_response(body, status=200):
+    """
+    The same answer for every path: a dict is sent as JSON, a str as text/plain.
+    """
+    return lambda path: (status, body)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out or was cancelled, which several tests do on purpose
+
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        time.sleep(self.server.delay)
+        status, body = self.server.respond(self.path)
+        if isinstance(body, str):
+            content_type, body = "text/plain", body.encode()
+        else:
+            content_type, body = "application/json", json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _TestServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, respond, delay, ssl_context):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.respond = respond
+        self.delay = delay
+        self.hits = []
+        self.connections = 0
+        if ssl_context is not None:
+            self.socket = ssl_context.wrap_socket(self.socket, server_side=True)
+        scheme, host = ("https", "localhost") if ssl_context is not None else ("http", "127.0.0.1")
+        self.base_url = f"{scheme}://{host}:{self.server_address[1]}"
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+
+@pytest.fixture
+def http_server():
+    """
+    Starts local HTTP servers for the test: http_server(respond=ipapi_response,
+    delay=0.0, ssl_context=None) returns one whose `base_url`, `hits` (request
+    paths) and `connections` (accepted connections) tests can check. `respond(path)`
+    returns (status, body). Servers are shut down and closed after the test.
+    """
+    servers = []
+
+    def start(respond=ipapi_response, delay=0.0, ssl_context=None):
+        server = _TestServer(respond, delay, ssl_context)
+        servers.append(server)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
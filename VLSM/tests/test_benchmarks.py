@@ -0,0 +1,37 @@
+import suite
+from network import get_ip_info, get_ip_info_many
+from scheduler import RequestScheduler
+from stand_in import StandInServer
+
+
+def test_stand_in_mimics_ipapi_errors_and_limits():
+    with StandInServer(rate_limit=(4, 60)) as server:
+        scheduler = RequestScheduler(limits={}, penalty=0)
+        own = get_ip_info(scheduler=scheduler, base_url=server.base_url)
+        assert own["public_ip"] == "203.0.113.10" and own["asn"].startswith("AS")
+        results = dict(get_ip_info_many(["192.0.2.1", "nonsense", "192.0.2.2", "192.0.2.3"], concurrency=1,
+                                        base_url=server.base_url, scheduler=scheduler))
+        assert results["192.0.2.1"]["country_code"] in {"NZ", "NL", "US", "JP", "BR"}
+        assert results["nonsense"]["error"] == "Failed to retrieve data: Invalid IP Address"
+        assert "429" in results["192.0.2.3"]["error"]
+        assert server.stats()["rate_limited"] == 1
+
+    with StandInServer(error_rate=1.0) as server:
+        data = get_ip_info("192.0.2.1", scheduler=RequestScheduler(limits={}), base_url=server.base_url)
+        assert "503" in data["error"]
+
+
+def test_regressions_respect_direction_and_tolerance():
+    baseline = {"safe_json_loads_us": 4.0, "bulk_lookups_per_s": 1000.0}
+    assert suite.compare({"safe_json_loads_us": 4.4, "bulk_lookups_per_s": 1500.0}, baseline) == []
+    regressions = suite.compare({"safe_json_loads_us": 6.0, "bulk_lookups_per_s": 600.0}, baseline)
+    assert [name for name, *_ in regressions] == ["safe_json_loads_us", "bulk_lookups_per_s"]
+    (_, value, reference, change), = suite.compare({"safe_json_loads_us": 4.4}, baseline, tolerance=0.05)
+    assert (value, reference) == (4.4, 4.0) and abs(change - 0.1) < 1e-9
+
+
+def test_quick_run_writes_known_metrics():
+    results = suite.run(only=["parsing", "lookups"], quick=True)
+    assert set(results["metrics"]) == {"safe_json_loads_us", "get_ip_info_p50_ms", "get_ip_info_p95_ms",
+                                       "bulk_lookups_per_s"}
+    assert all(value > 0 for value in results["metrics"].values())
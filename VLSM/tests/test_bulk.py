@@ -0,0 +1,20 @@
+from network import get_ip_info_many
+
+
+def test_bulk_lookup_ordered_and_pooled(http_server):
+    server = http_server()
+    ips = [f"10.0.0.{i}" for i in range(50)]
+    results = list(get_ip_info_many(ips, concurrency=4, base_url=server.base_url))
+    assert [ip for ip, _ in results] == ips
+    assert all(data["public_ip"] == ip for ip, data in results)
+    # keep-alive: one connection per worker, not one per lookup
+    assert server.connections <= 4
+
+
+def test_bulk_lookup_errors_are_per_ip(http_server):
+    server = http_server()
+    results = dict(get_ip_info_many(["1.1.1.1", "bad", "down"], concurrency=2, ordered=False,
+                                    base_url=server.base_url))
+    assert results["1.1.1.1"]["city"] == "Testville"
+    assert "error" in results["bad"]
+    assert "503" in results["down"]["error"]
@@ -0,0 +1,59 @@
+from unittest.mock import patch
+
+from ip_cache import IPInfoCache
+from network import get_ip_info
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_and_negative_ttl():
+    clock = FakeClock()
+    cache = IPInfoCache(ttl=60, negative_ttl=5, clock=clock)
+    cache.put("1.1.1.1", {"ip": "1.1.1.1"})
+    cache.put("2.2.2.2", {"error": "Failed to retrieve data: boom"})
+    clock.now += 10
+    assert cache.get("1.1.1.1") == {"ip": "1.1.1.1"}
+    assert cache.get("2.2.2.2") is None
+    clock.now += 60
+    assert cache.get("1.1.1.1") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_lru_eviction():
+    cache = IPInfoCache(max_entries=2)
+    cache.put("a", {"ip": "a"})
+    cache.put("b", {"ip": "b"})
+    cache.get("a")
+    cache.put("c", {"ip": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_cache_survives_restart(tmp_path):
+    path = str(tmp_path / "ipinfo.sqlite3")
+    cache = IPInfoCache(path)
+    cache.put("8.8.8.8", {"ip": "8.8.8.8", "city": "Mountain View"})
+    cache.close()
+
+    reopened = IPInfoCache(path)
+    assert reopened.get("8.8.8.8")["city"] == "Mountain View"
+    assert reopened.stats()["disk_hits"] == 1
+    reopened.close()
+
+
+def test_get_ip_info_uses_cache():
+    cache = IPInfoCache()
+    with patch("network.urllib.request.urlopen") as mock_urlopen:
+        mock_urlopen.return_value.__enter__.return_value.read.return_value = b'{"ip": "123.45.67.89"}'
+        first = get_ip_info(cache=cache)
+        second = get_ip_info(cache=cache)
+    assert first == second
+    assert mock_urlopen.call_count == 1
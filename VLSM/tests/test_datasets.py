@@ -0,0 +1,169 @@
+import threading
+import time
+
+import pytest
+
+from datasets import Dataset, _RangeMap, open_dataset
+from enrich import enrich
+from geo_offline import GeoDatabase, build_database
+from network import get_ip_info_many
+from prefix_trie import PrefixTrie, build_trie
+from ui import IPInfoApp
+
+
+def build_geo(directory, version, rows):
+    source = directory / f"{version}.csv"
+    source.write_text("network,city,latitude,longitude\n" + "".join(f"{row}\n" for row in rows))
+    build_database(str(source), str(directory / f"{version}.vgeo"))
+
+
+def test_range_map_splits_what_it_covers():
+    ranges = _RangeMap()
+    ranges.assign(10, 20, "a")
+    ranges.assign(30, 40, "b")
+    ranges.assign(15, 35, "c")
+    assert list(zip(ranges.starts, ranges.ends, ranges.values)) == [(10, 14, "a"), (15, 35, "c"), (36, 40, "b")]
+    ranges.assign(17, 18, None)
+    assert ranges.find(17) == (True, None) and ranges.find(19) == (True, "c")
+    assert ranges.find(9) == (False, None) and ranges.find(41) == (False, None)
+
+
+def test_geo_deltas_and_version_swaps(tmp_path):
+    build_geo(tmp_path, "2026-10-05", ["1.0.0.0/8,One,1.5,2.5", "2.0.0.0/8,Two,,", "2001:db8::/32,Six,,"])
+    (tmp_path / "2026-10-05.vgeo.tmp123").write_bytes(b"half written")
+    events = []
+    with Dataset(str(tmp_path), interval=0) as dataset:
+        dataset.add_callback(events.append)
+        assert dataset.version == "2026-10-05" and dataset.lookup("1.2.3.4")["city"] == "One"
+        assert not dataset.reload()
+
+        (tmp_path / "2026-10-05+1.delta").write_text(
+            "network,city,action\n1.2.3.0/24,Changed,\n2.0.0.0/9,,remove\n9.0.0.0/8,Nine,add\n"
+        )
+        (tmp_path / "2026-10-05+2.delta").write_text("start_ip,end_ip,city\n2001:db8::,2001:db8::ff,Six-b\n")
+        assert dataset.reload() and dataset.version == "2026-10-05+2"
+        assert dataset.lookup("1.2.3.4") == {
+            "city": "Changed", "region": "", "country_name": "", "latitude": None, "longitude": None,
+            "timezone": "", "org": "", "asn": "", "ip": "1.2.3.4", "public_ip": "1.2.3.4", "version": "IPv4",
+        }
+        assert dataset.lookup("1.2.4.4")["latitude"] == 1.5
+        assert "error" in dataset.lookup("2.1.1.1") and dataset.lookup("2.200.1.1")["city"] == "Two"
+        assert dataset.lookup("9.9.9.9")["city"] == "Nine"
+        assert dataset.lookup("2001:db8::1")["city"] == "Six-b" and dataset.lookup("2001:db8::1:0")["city"] == "Six"
+        assert "error" in dataset.lookup("bogus")
+        assert [data["city"] for _, data in get_ip_info_many(["1.2.3.4", "9.9.9.9"], offline=dataset)] == [
+            "Changed", "Nine",
+        ]
+
+        with dataset.snapshot() as pinned:
+            build_geo(tmp_path, "2026-10-12", ["1.0.0.0/8,Uno,,"])
+            assert dataset.reload() and dataset.version == "2026-10-12"
+            # the lease keeps the old version mapped and consistent
+            assert pinned.lookup("1.2.3.4")["city"] == "Changed"
+            assert dataset.lookup("1.2.3.4")["city"] == "Uno"
+            assert not pinned.base._mmap.closed
+        assert pinned.base._mmap.closed
+        assert [(e["previous"], e["version"]) for e in events] == [
+            ("2026-10-05", "2026-10-05+2"), ("2026-10-05+2", "2026-10-12"),
+        ]
+
+        # a broken delta is reported and the current version stays
+        (tmp_path / "2026-10-12+1.delta").write_text("network,city\nnot-a-network,Bad\n")
+        assert not dataset.reload() and dataset.lookup("1.2.3.4")["city"] == "Uno"
+        current = dataset._current.view.base
+    assert current._mmap.closed
+
+
+def test_prefix_deltas_keep_longest_match(tmp_path):
+    (tmp_path / "routes.txt").write_text(
+        "1.0.0.0/8 AS1 Wide\n1.2.0.0/16 AS2 Middle\n1.2.3.0/24 AS3 Narrow\n2001:db8::/32 AS6 Six\n"
+    )
+    build_trie(str(tmp_path / "routes.txt"), str(tmp_path / "v1.vpfx"))
+    (tmp_path / "v1+1.delta").write_text(
+        "# withdrawn, changed and new routes\n- 1.2.3.0/24\n+ 1.2.0.0/16 AS20 Middle2\n1.2.3.128/25 AS4\n"
+        "-2001:db8::/32\n2001:db8:1::/48,AS7,Seven\n"
+    )
+    with Dataset(str(tmp_path), interval=0) as dataset:
+        assert dataset.version == "v1+1"
+        assert dataset.lookup("1.2.3.4") == {"network": "1.2.0.0/16", "asn": "AS20", "org": "Middle2"}
+        assert dataset.lookup("1.2.3.200") == {"network": "1.2.3.128/25", "asn": "AS4", "org": ""}
+        assert dataset.lookup("1.9.9.9")["asn"] == "AS1"
+        assert dataset.lookup("2001:db8:1::1")["asn"] == "AS7"
+        assert "error" in dataset.lookup("2001:db8:2::1") and "error" in dataset.lookup("8.8.8.8")
+        with PrefixTrie(str(tmp_path / "v1.vpfx")) as trie:
+            assert [plen for _, plen, _ in trie.covering(int.from_bytes(bytes([1, 2, 3, 4]), "big"))] == [8, 16, 24]
+
+        records = list(enrich(["1.2.3.200"], prefixes=dataset, offline=_NoGeo()))
+        assert records[0]["asn"] == "AS4"
+
+
+class _NoGeo:
+    def lookup_many(self, ips):
+        for ip in ips:
+            yield ip, {"ip": ip, "asn": "AS0"}
+
+
+def test_lookups_during_reloads_never_fail_or_mix(tmp_path):
+    build_geo(tmp_path, "v00", ["10.0.0.0/8,V00,,", "11.0.0.0/8,V00,,"])
+    errors = []
+    stop = threading.Event()
+    with Dataset(str(tmp_path), interval=0) as dataset:
+        def reader():
+            while not stop.is_set():
+                with dataset.snapshot() as view:
+                    first, second = view.lookup("10.1.1.1")["city"], view.lookup("11.1.1.1")["city"]
+                if first != second.split("/")[0]:
+                    errors.append((first, second))
+
+        threads = [threading.Thread(target=reader) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            for n in range(1, 15):
+                build_geo(tmp_path, f"v{n:02}", [f"10.0.0.0/8,V{n:02},,", f"11.0.0.0/8,V{n:02},,"])
+                (tmp_path / f"v{n:02}+1.delta").write_text(f"network,city\n11.0.0.0/8,V{n:02}/delta\n")
+                dataset.reload()
+                time.sleep(0.005)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        assert errors == []
+        assert dataset.version == "v14+1"
+        assert dataset._current.base.versions == 1
+
+
+def test_watcher_picks_up_new_versions(tmp_path):
+    build_geo(tmp_path, "1", ["1.0.0.0/8,Old,,"])
+    swapped = threading.Event()
+    with open_dataset(str(tmp_path), interval=0.02) as dataset:
+        dataset.add_callback(lambda event: swapped.set())
+        build_geo(tmp_path, "2", ["1.0.0.0/8,New,,"])
+        assert swapped.wait(5)
+        assert dataset.lookup("1.1.1.1")["city"] == "New"
+    with open_dataset(str(tmp_path / "1.vgeo")) as database:
+        assert isinstance(database, GeoDatabase)
+
+
+def test_files_are_told_apart_by_magic_and_kinds_checked(tmp_path, monkeypatch, capsys):
+    (tmp_path / "routes.txt").write_text("1.0.0.0/8 AS1 One\n")
+    build_trie(str(tmp_path / "routes.txt"), str(tmp_path / "routes.bin"))
+    build_geo(tmp_path, "1", ["1.0.0.0/8,One,,"])
+    with open_dataset(str(tmp_path / "routes.bin")) as trie:
+        assert isinstance(trie, PrefixTrie)
+    with pytest.raises(ValueError, match="not a .vgeo or .vpfx build"):
+        open_dataset(str(tmp_path / "routes.txt"))
+    with pytest.raises(ValueError, match="not .vpfx"):
+        open_dataset(str(tmp_path / "1.vgeo"), extension=".vpfx")
+    with pytest.raises(ValueError, match="holds .vgeo builds, not .vpfx"):
+        open_dataset(str(tmp_path), interval=0, extension=".vpfx")
+
+    monkeypatch.setenv("VLSM_PREFIX_TABLE", str(tmp_path))
+    assert IPInfoApp._open_prefix_table() is None
+    assert "Prefix table error" in capsys.readouterr().out
+    monkeypatch.setenv("VLSM_PREFIX_TABLE", str(tmp_path / "routes.bin"))
+    table = IPInfoApp._open_prefix_table()
+    try:
+        assert table.annotate({"ip": "1.2.3.4"})["asn"] == "AS1"
+    finally:
+        table.close()
@@ -0,0 +1,58 @@
+import csv
+import io
+import json
+
+from enrich import extract_ip, run
+from geo_offline import GeoDatabase, build_database
+from network import RECORD_FIELDS
+
+ACCESS_LOG = """\
+8.8.8.8 - - [10/Oct/2026:13:55:36 +0000] "GET / HTTP/1.1" 200 2326 "-" "curl/8.0"
+1.0.0.7 - - [10/Oct/2026:13:55:37 +0000] "GET /a HTTP/1.1" 404 12 "-" "curl/8.0"
+8.8.8.8 - - [10/Oct/2026:13:55:38 +0000] "GET /b HTTP/1.1" 200 99 "-" "curl/8.0"
+garbage line without an address
+"""
+
+
+def test_extract_ip_formats():
+    assert extract_ip("203.0.113.9\n") == "203.0.113.9"
+    assert extract_ip('2001:db8::1 - - [x] "GET / HTTP/1.1" 200 1') == "2001:db8::1"
+    assert extract_ip("ts=1 client=198.51.100.4 status=200") == "198.51.100.4"
+    assert extract_ip("999.1.1.1 - - [x]") is None
+    assert extract_ip("") is None
+
+
+def make_db(tmp_path):
+    csv_path = tmp_path / "ranges.csv"
+    csv_path.write_text(
+        "network,city,country_name,asn\n"
+        "8.8.8.0/24,Mountain View,United States,15169\n"
+        "1.0.0.0/24,Sydney,Australia,13335\n"
+    )
+    build_database(str(csv_path), str(tmp_path / "ranges.vgeo"))
+    return GeoDatabase(str(tmp_path / "ranges.vgeo"))
+
+
+def test_pipeline_dedupes_and_writes_jsonl(tmp_path):
+    log = tmp_path / "access.log"
+    log.write_text(ACCESS_LOG)
+    out = io.StringIO()
+    with make_db(tmp_path) as db:
+        progress = run([str(log)], out, offline=db)
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [r["public_ip"] for r in records] == ["8.8.8.8", "1.0.0.7"]
+    assert records[0]["city"] == "Mountain View"
+    assert set(RECORD_FIELDS) <= set(records[0])
+    assert (progress.lines, progress.addresses, progress.duplicates) == (4, 3, 1)
+
+
+def test_pipeline_csv_uses_record_schema(tmp_path):
+    log = tmp_path / "ips.txt"
+    log.write_text("1.0.0.1\n9.9.9.9\n")
+    out = io.StringIO()
+    with make_db(tmp_path) as db:
+        progress = run([str(log)], out, fmt="csv", offline=db)
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert list(rows[0]) == list(RECORD_FIELDS)
+    assert rows[0]["country"] == "Australia"
+    assert progress.errors == 1
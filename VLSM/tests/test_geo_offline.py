@@ -0,0 +1,52 @@
+from geo_offline import GeoDatabase, build_database
+from network import get_ip_info
+
+CSV = """network,city,subdivision_1_name,country_name,latitude,longitude,time_zone,org,autonomous_system_number
+1.0.0.0/24,Sydney,New South Wales,Australia,-33.86,151.2,Australia/Sydney,Cloudflare,13335
+8.8.8.0/24,Mountain View,California,United States,37.4,-122.07,America/Los_Angeles,Google LLC,15169
+2001:4860::/32,Mountain View,California,United States,37.4,-122.07,America/Los_Angeles,Google LLC,15169
+2606:4700::/32,San Francisco,California,United States,37.77,-122.4,America/Los_Angeles,Cloudflare,13335
+"""
+
+
+def build(tmp_path):
+    csv_path = tmp_path / "ranges.csv"
+    csv_path.write_text(CSV)
+    db_path = str(tmp_path / "ranges.vgeo")
+    counts = build_database(str(csv_path), db_path)
+    assert counts["ipv4_ranges"] == 2 and counts["ipv6_ranges"] == 2
+    return GeoDatabase(db_path)
+
+
+def test_ipv4_and_ipv6_lookups(tmp_path):
+    with build(tmp_path) as db:
+        data = db.lookup("8.8.8.8")
+        assert data["city"] == "Mountain View"
+        assert data["region"] == "California"
+        assert data["timezone"] == "America/Los_Angeles"
+        assert data["asn"] == "AS15169"
+        assert data["latitude"] == 37.4
+        assert db.lookup("1.0.0.255")["country_name"] == "Australia"
+        assert db.lookup("2606:4700::1111")["city"] == "San Francisco"
+        assert db.lookup("2001:4860:4860::8888")["org"] == "Google LLC"
+
+
+def test_misses_follow_error_contract(tmp_path):
+    with build(tmp_path) as db:
+        assert "error" in db.lookup("9.9.9.9")
+        assert "error" in db.lookup("::1")
+        assert "error" in db.lookup("not-an-ip")
+        assert "error" in get_ip_info(offline=db)
+        assert get_ip_info("1.0.0.1", offline=db)["city"] == "Sydney"
+
+
+def test_batch_lookups_match_single_lookups(tmp_path):
+    with build(tmp_path) as db:
+        ipv4 = ["8.8.8.8", "9.9.9.9", "1.0.0.1", "8.8.8.8"]
+        assert db.lookup_batch(ipv4) == [db.lookup(ip) for ip in ipv4]
+        mixed = ["2606:4700::1111", "not-an-ip", "1.0.0.1"]
+        assert db.lookup_batch(mixed) == [db.lookup(ip) for ip in mixed]
+        assert db.lookup_batch([]) == []
+        first, second = db.lookup_batch(["8.8.8.8", "8.8.8.8"])
+        first["city"] = "Elsewhere"
+        assert second["city"] == db.lookup("8.8.8.8")["city"] == "Mountain View"
@@ -0,0 +1,63 @@
+import csv
+import io
+import json
+
+from history import COLUMNS, HistoryStore
+from network import to_record
+from records import IPRecord, IPRecordBatch
+
+
+def sample(i):
+    return {
+        "ip": f"10.0.{i // 256}.{i % 256}",
+        "city": "Testville",
+        "country_name": "New Zealand" if i % 2 else "Netherlands",
+        "country_code": "NZ" if i % 2 else "NL",
+        "latitude": -41.3,
+        "longitude": "N/A",
+        "asn": f"AS{64500 + i % 3}",
+    }
+
+
+def test_range_queries_use_filters(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    assert store.append_many((sample(i) for i in range(1000)), batch_size=300) == 1000
+    store.append_many(sample(i) | {"timestamp": 1000 + i} for i in range(100))
+    try:
+        window = list(store.query(start=1010, end=1020))
+        assert [r["timestamp"] for r in window] == [float(t) for t in range(1010, 1020)]
+        assert window[0]["country"] == "Netherlands (NL)"
+        assert window[0]["latitude"] == -41.3 and window[0]["longitude"] is None
+        assert store.count(start=1000, end=1100, country="NZ") == 50
+        assert store.count(start=1000, end=1100, asn="AS64500") == 34
+        assert [r["public_ip"] for r in store.query(ip="10.0.0.5", end=2000)] == ["10.0.0.5"]
+        assert next(store.query(newest_first=True, end=2000))["timestamp"] == 1099.0
+        plan = store._db.execute("EXPLAIN QUERY PLAN SELECT * FROM lookups WHERE asn = ? AND timestamp >= ?",
+                                 ("AS64500", 0)).fetchall()
+        assert "USING INDEX" in " ".join(str(row) for row in plan)
+    finally:
+        store.close()
+
+
+def test_streaming_export():
+    store = HistoryStore()
+    store.append_many(sample(i) | {"timestamp": 1000 + i} for i in range(10))
+    out = io.StringIO()
+    assert store.export(out, "csv", start=1005) == 5
+    rows = list(csv.reader(io.StringIO(out.getvalue())))
+    assert tuple(rows[0]) == COLUMNS
+    assert len(rows) == 6
+    out = io.StringIO()
+    assert store.export(out, "jsonl") == 10
+    assert json.loads(out.getvalue().splitlines()[3])["public_ip"] == "10.0.0.3"
+
+
+def test_record_shaped_input_keeps_country_code():
+    store = HistoryStore()
+    record = to_record(sample(1))
+    assert record["country"] == "New Zealand (NZ)"
+    store.append(record, timestamp=1)
+    store.append_many(IPRecordBatch([sample(3), sample(4)]), timestamp=2)
+    store.append(IPRecord.from_dict(sample(5)), timestamp=3)
+    assert store.count(country="NZ") == 3 and store.count(country="NL") == 1
+    assert [r["country_code"] for r in store.query()] == ["NZ", "NZ", "NL", "NZ"]
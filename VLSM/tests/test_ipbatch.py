@@ -0,0 +1,63 @@
+import ipaddress
+import os
+import random
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from VLSM.ipbatch import classify, filter_global, in_networks, parse
+
+
+def reference(text):
+    try:
+        address = ipaddress.ip_address(text)
+    except ValueError:
+        return 0, 0, 0
+    return address.version, int(address) >> 64, int(address) & 0xFFFFFFFFFFFFFFFF
+
+
+def mangled(rng):
+    if rng.random() < 0.5:
+        text = ".".join(str(rng.choice([rng.randrange(256), rng.randrange(1000), 0])) for _ in range(4))
+    else:
+        address = ipaddress.IPv6Address(rng.getrandbits(128) & rng.choice([(1 << 128) - 1, 0xFFFF, ~0 << 64]))
+        text = rng.choice([str(address), address.exploded, str(address).upper()])
+    edit = rng.randrange(12)
+    if edit == 0:
+        text = "0" + text
+    elif edit == 1:
+        text = text.replace(".", "..", 1).replace(":", ":::", 1)
+    elif edit == 2:
+        text += rng.choice([".", ":", "%eth0", "%", ":1"])
+    elif edit == 3:
+        text = text[1:]
+    return text
+
+
+def test_parse_matches_ipaddress():
+    rng = random.Random(17)
+    samples = [mangled(rng) for _ in range(20000)] + [
+        "", "::", ":::", "999.1.1.1", "01.2.3.4", "1.2.3", "1:2:3:4:5:6:7::", "::1:2:3:4:5:6:7",
+        "1::2::3", "::ffff:192.0.2.1", "fe80::1%a%b", "1.2.3.4%x", "é.1.1.1", "1" * 60,
+    ]
+    batch = parse(samples)
+    got = list(zip(batch.version.tolist(), batch.hi.tolist(), batch.lo.tolist()))
+    assert got == [reference(text) for text in samples]
+    assert parse(np.array([b"10.0.0.1", b"::1"])).to_strings() == ["10.0.0.1", "::1"]
+
+
+def test_classify_and_cidr_membership():
+    batch = parse(["10.1.2.3", "8.8.8.8", "127.0.0.1", "169.254.1.1", "224.0.0.5", "240.0.0.1",
+                   "fd00::1", "2001:db8::1", "2606:4700::1111", "ff02::1", "fe80::1", "bogus"])
+    masks = classify(batch)
+    assert masks["private"].tolist() == [True] + [False] * 5 + [True] + [False] * 5
+    assert np.flatnonzero(masks["loopback"]).tolist() == [2]
+    assert np.flatnonzero(masks["link_local"]).tolist() == [3, 10]
+    assert np.flatnonzero(masks["multicast"]).tolist() == [4, 9]
+    assert np.flatnonzero(masks["global"]).tolist() == [1, 8]
+    assert in_networks(batch, ["8.8.8.0/24", "2606:4700::/32", "2001:db8::1/128"]).tolist() == [
+        False, True, False, False, False, False, False, True, True, False, False, False,
+    ]
+    assert filter_global(["10.0.0.1", "1.1.1.1", "::1", "not an ip"]).tolist() == ["1.1.1.1"]
@@ -0,0 +1,78 @@
+import errno
+import socket
+import struct
+import time
+from unittest.mock import Mock, patch
+
+import local_addrs
+import network
+from local_addrs import LocalAddressProvider, preferred_address
+
+
+def _newaddr(family, raw, prefixlen, scope, index, label=None):
+    attrs = struct.pack("=HH", 4 + len(raw), local_addrs._IFA_LOCAL) + raw
+    if label:
+        name = label.encode() + b"\0"
+        attr = struct.pack("=HH", 4 + len(name), local_addrs._IFA_LABEL) + name
+        attrs += attr + b"\0" * (local_addrs._align4(len(attr)) - len(attr))
+    return local_addrs._IFADDRMSG.pack(family, prefixlen, 0x80, scope, index) + attrs
+
+
+def test_parse_rtnetlink_address_message():
+    msg = _newaddr(socket.AF_INET, socket.inet_aton("10.1.2.3"), 24, 0, 2, label="eth0")
+    entry = local_addrs._parse_newaddr(msg, 0, len(msg))
+    assert entry == {
+        "family": "IPv4", "address": "10.1.2.3", "prefixlen": 24,
+        "interface": "eth0", "scope": "global", "flags": ["permanent"],
+    }
+
+
+def test_preferred_address_ranks_scope_and_flags():
+    entries = [
+        {"family": "IPv6", "address": "::1", "scope": "host", "flags": []},
+        {"family": "IPv6", "address": "fe80::1%eth0", "scope": "link", "flags": []},
+        {"family": "IPv6", "address": "2001:db8::dead", "scope": "global", "flags": ["deprecated"]},
+        {"family": "IPv6", "address": "2001:db8::7e3", "scope": "global", "flags": ["temporary"]},
+        {"family": "IPv6", "address": "2001:db8::1", "scope": "global", "flags": ["permanent"]},
+    ]
+    assert preferred_address(entries, "IPv6") == "2001:db8::1"
+    assert preferred_address(entries[:2], "IPv6") == "fe80::1%eth0"
+    assert preferred_address(entries, "IPv4") is None
+
+
+def test_provider_caches_until_change():
+    provider = LocalAddressProvider()
+    provider._monitor = None
+    provider.ttl = 3600
+    calls = []
+    with patch.object(LocalAddressProvider, "_load", staticmethod(lambda: calls.append(1) or [])):
+        provider.addresses()
+        provider.addresses()
+        assert len(calls) == 1
+        provider.invalidate()
+        provider.addresses()
+        assert len(calls) == 2
+    provider.close()
+
+
+def test_broken_monitor_socket_falls_back_to_ttl():
+    provider = LocalAddressProvider()
+    provider.close()
+    provider._monitor = monitor = Mock()
+    monitor.recv.side_effect = [OSError(errno.ENOBUFS, "No buffer space"), BlockingIOError()]
+    assert provider._changed() and provider._monitor is monitor
+    monitor.recv.side_effect = OSError(errno.EBADF, "Bad file descriptor")
+    assert provider._changed()
+    assert provider._monitor is None and monitor.close.called
+    provider._loaded_at = time.monotonic()
+    assert not provider._changed()
+
+
+def test_get_local_ips_needs_no_route():
+    entries = [
+        {"family": "IPv4", "address": "192.0.2.10", "prefixlen": 24, "interface": "eth0", "scope": "global", "flags": []},
+        {"family": "IPv6", "address": "fd00::10", "prefixlen": 64, "interface": "eth0", "scope": "global", "flags": []},
+    ]
+    with patch("network.get_local_addresses", return_value=entries), \
+            patch("network.socket.socket", side_effect=OSError("Network is unreachable")):
+        assert network.get_local_ips() == {"local_ipv4": "192.0.2.10", "local_ipv6": "fd00::10"}
@@ -0,0 +1,142 @@
+import asyncio
+import http.client
+import json
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from ip_cache import IPInfoCache
+from lookup_service import LookupService
+from scheduler import RequestScheduler
+
+
+@contextmanager
+def running(**options):
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    options.setdefault("scheduler", RequestScheduler(limits={}))
+    service = LookupService(concurrency=2, **options)
+    asyncio.run_coroutine_threadsafe(service.start(port=0), loop).result(5)
+    try:
+        yield service
+    finally:
+        asyncio.run_coroutine_threadsafe(service.close(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+
+
+def request(conn, method, path, body=None, headers=None):
+    conn.request(method, path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    return response.status, response.getheader("Content-Type"), response.read()
+
+
+def test_lookups_share_the_cache_over_keep_alive(http_server):
+    upstream = http_server()
+    with running(base_url=upstream.base_url) as service:
+        conn = http.client.HTTPConnection("127.0.0.1", service.port, timeout=5)
+        status, content_type, body = request(conn, "GET", "/lookup/1.1.1.1")
+        assert (status, content_type) == (200, "application/json")
+        assert json.loads(body)["city"] == "Testville"
+        sock = conn.sock
+        assert json.loads(request(conn, "GET", "/lookup/1.1.1.1")[2]) == json.loads(body)
+        assert conn.sock is sock  # the client connection was kept alive
+
+        status, _, body = request(conn, "GET", "/lookup/not-an-ip")
+        assert status == 400 and "Invalid IP address" in json.loads(body)["error"]
+        assert request(conn, "GET", "/nowhere")[0] == 404
+        assert request(conn, "POST", "/lookup/1.1.1.1")[0] == 405
+
+        stats = json.loads(request(conn, "GET", "/stats")[2])
+        assert stats["cache"]["hits"] == 1 and stats["cache"]["misses"] == 1
+        assert stats["routes"]["lookup"]["requests"] == 3
+        assert stats["statuses"] == {"200": 2, "400": 1, "404": 1, "405": 1}
+        assert upstream.connections == 1
+
+
+def test_batch_streams_ndjson(http_server):
+    base_url = http_server().base_url
+    with running(base_url=base_url) as service:
+        conn = http.client.HTTPConnection("127.0.0.1", service.port, timeout=5)
+        ips = [f"10.0.0.{i}" for i in range(20)] + ["bogus", "down"]
+        status, content_type, body = request(conn, "POST", "/batch", json.dumps(ips))
+        assert (status, content_type) == (200, "application/x-ndjson")
+        lines = [json.loads(line) for line in body.decode().splitlines()]
+        assert [line["query"] for line in lines] == ips
+        assert all(line["public_ip"] == ip for line, ip in zip(lines[:20], ips))
+        assert "Invalid IP address" in lines[20]["error"] and "error" in lines[21]
+
+        body = request(conn, "POST", "/batch?ordered=0", "10.0.0.1\n\n10.0.0.99\n",
+                       {"Content-Type": "text/plain"})[2]
+        assert sorted(json.loads(line)["query"] for line in body.decode().splitlines()) == ["10.0.0.1", "10.0.0.99"]
+        assert request(conn, "POST", "/batch", "[1, 2]")[0] == 400
+        assert request(conn, "GET", "/batch")[0] == 405
+        # the first batch already cached 10.0.0.1
+        assert service.stats()["cache"]["hits"] >= 1
+
+
+def test_self_local_and_failures():
+    with running(base_url="http://127.0.0.1:1") as service:
+        conn = http.client.HTTPConnection("127.0.0.1", service.port, timeout=5)
+        status, _, body = request(conn, "GET", "/self")
+        assert status == 502 and "error" in json.loads(body)
+        status, _, body = request(conn, "GET", "/local")
+        local = json.loads(body)
+        assert status == 200 and {"local_ipv4", "local_ipv6", "interfaces"} <= set(local)
+        assert request(conn, "GET", "/metrics")[0] == 404
+
+        conn = http.client.HTTPConnection("127.0.0.1", service.port, timeout=5)
+        status, _, _ = request(conn, "GET", "/stats", headers={"Connection": "close"})
+        assert status == 200 and conn.sock is None
+
+
+def test_malformed_chunk_size_is_a_bad_request():
+    with running(base_url="http://127.0.0.1:1") as service:
+        with socket.create_connection(("127.0.0.1", service.port), timeout=5) as sock:
+            sock.sendall(b"POST /batch HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n")
+            response = sock.makefile("rb")
+            assert response.readline().split()[1] == b"400"
+            assert b"Invalid chunk size" in response.read()
+
+
+class _RecordingCache(IPInfoCache):
+    def get(self, key, memory_only=False):
+        try:
+            on_loop = asyncio.get_running_loop() is not None
+        except RuntimeError:
+            on_loop = False
+        self.reads.append((memory_only, on_loop))
+        return super().get(key, memory_only)
+
+
+def test_persistent_cache_is_read_off_the_event_loop(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    seed = IPInfoCache(path)
+    seed.put("1.1.1.1", {"ip": "1.1.1.1", "city": "Cached"})
+    seed.close()
+    cache = _RecordingCache(path)
+    cache.reads = []
+    try:
+        with running(base_url="http://127.0.0.1:1", cache=cache) as service:
+            conn = http.client.HTTPConnection("127.0.0.1", service.port, timeout=5)
+            for _ in range(2):
+                assert json.loads(request(conn, "GET", "/lookup/1.1.1.1")[2])["city"] == "Cached"
+        assert cache.disk_hits == 1 and cache.memory_hits == 1
+        # the loop only ever looked at memory; the SQLite read ran on a worker thread
+        assert cache.reads == [(True, True), (False, False), (True, True)]
+    finally:
+        cache.close()
+
+
+def test_throttled_answers_are_not_shared(http_server):
+    upstream = http_server()
+    host = upstream.base_url.split("//")[1]
+    scheduler = RequestScheduler(limits={host: ((1, 0.3),)}, interactive_wait=0.01)
+    assert scheduler.acquire(host)
+    with running(base_url=upstream.base_url, scheduler=scheduler) as service:
+        conn = http.client.HTTPConnection("127.0.0.1", service.port, timeout=5)
+        status, _, body = request(conn, "GET", "/lookup/1.1.1.1")
+        assert "no request slot" in json.loads(body)["error"]
+        time.sleep(0.35)
+        assert json.loads(request(conn, "GET", "/lookup/1.1.1.1")[2])["city"] == "Testville"
+        assert upstream.hits == ["/1.1.1.1/json/"]
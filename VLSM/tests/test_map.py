@@ -7,4 +7,62 @@ parent_dir = os.path.dirname(current_dir)
 
 sys.path.append(parent_dir)
 
+import pytest
+
 from VLSM.map_generator import generate_map
+
+from VLSM.map_generator import aggregate_points, generate_map_many, geohash
+
+
+def test_geohash_known_value():
+    assert geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+
+def test_aggregate_points_counts_cells_and_top_asns():
+    points = [{"latitude": 40.71, "longitude": -74.0, "asn": "AS701"}] * 3
+    points += [{"lat": 40.72, "lon": -74.01, "asn": "AS7922"}]
+    points += [(48.85, 2.35), {"latitude": "N/A", "longitude": None}]
+    cells = aggregate_points(points, precision=4)
+    assert [cell["count"] for cell in cells] == [4, 1]
+    assert cells[0]["top"][0] == ("AS701", 3)
+    assert aggregate_points(points, precision=4, max_cells=1)[0]["count"] == 4
+
+
+def test_generate_map_many_is_bounded(tmp_path):
+    points = [(i % 90, (i * 7) % 180, f"AS{i % 5}") for i in range(5000)]
+    out = generate_map_many(points, str(tmp_path / "many.html"), max_cells=50)
+    assert out == str(tmp_path / "many.html")
+    assert os.path.getsize(out) < 200_000
+    assert generate_map_many(points, str(tmp_path / "heat.html"), mode="heatmap") is not None
+    with pytest.raises(ValueError):
+        generate_map_many(points, str(tmp_path / "dots.html"), mode="dots")
+
+
+def test_map_cache_reuses_rendered_file(tmp_path):
+    from VLSM.map_generator import MapCache, generate_map
+
+    cache = MapCache(str(tmp_path), precision=3)
+    first = generate_map(40.712776, -74.005974, tooltip="Public IP: 1.2.3.4", cache=cache)
+    again = generate_map(40.71281, -74.00601, tooltip="Public IP: 1.2.3.4", cache=cache)
+    other = generate_map(40.712776, -74.005974, tooltip="Public IP: 5.6.7.8", cache=cache)
+    assert first == again != other
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".render-")]
+
+
+def test_map_cache_cleanup_bounds_file_count(tmp_path):
+    from VLSM.map_generator import MapCache, generate_map
+
+    cache = MapCache(str(tmp_path), max_files=2)
+    for i in range(4):
+        assert generate_map(10 + i, 20, cache=cache)
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_map_cache_never_evicts_the_file_it_returns(tmp_path):
+    from VLSM.map_generator import MapCache, generate_map
+
+    cache = MapCache(str(tmp_path), max_bytes=1)
+    first = generate_map(10, 20, cache=cache)
+    second = generate_map(11, 20, cache=cache)
+    assert os.path.exists(second) and not os.path.exists(first)
@@ -0,0 +1,149 @@
+import asyncio
+import shutil
+import ssl
+import subprocess
+import urllib.request
+
+import pytest
+
+import metrics
+from ip_cache import IPInfoCache
+from network import get_ip_info, get_ip_info_many
+from network_async import _open_connection, _read_response, get_ip_info_async
+from scheduler import RequestScheduler
+
+
+@pytest.fixture
+def registry():
+    registry = metrics.enable(metrics.Metrics())
+    try:
+        yield registry
+    finally:
+        metrics.disable()
+
+
+def phases(registry, operation):
+    return {
+        dict(series["labels"])["phase"]: series["count"]
+        for series in registry.snapshot()["histograms"]
+        if series["metric"] == metrics.PHASE_SECONDS and series["labels"]["operation"] == operation
+    }
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = metrics.Histogram((1, 2, 4))
+    for value in (0.5, 1, 1.5, 3, 3, 10):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 2, 1]
+    assert histogram.count == 6 and histogram.sum == 19 and histogram.last == 10
+    assert histogram.quantile(0.5) == 2.0
+    assert histogram.quantile(1.0) == 4
+    assert metrics.Histogram((1,)).quantile(0.5) == 0.0
+
+
+def test_disabled_hooks_record_nothing():
+    assert not metrics.enabled()
+    assert metrics.phase("lookup", "dns") is metrics.phase("map", "render")
+    with metrics.phase("lookup", "dns"):
+        pass
+    metrics.error("lookup", "api")
+    assert metrics.get_metrics() is None
+
+
+def test_bulk_lookups_record_phases_bytes_and_errors(registry, http_server):
+    events = []
+    registry.add_callback(events.append)
+    results = dict(get_ip_info_many(["8.8.8.8", "bad", "down"], concurrency=1, base_url=http_server().base_url,
+                                    scheduler=RequestScheduler(limits={})))
+    assert "error" in results["bad"] and "error" in results["down"]
+    recorded = phases(registry, "lookup")
+    assert recorded["total"] == 3
+    assert recorded["dns"] == recorded["connect"] == 1  # one keep-alive connection
+    assert recorded["server"] == recorded["read"] == 3
+    assert recorded["parse"] == 2
+    assert "tls" not in recorded
+    assert registry.histogram(metrics.RESPONSE_BYTES, operation="lookup").count == 2
+    assert registry.counter(metrics.ERRORS, operation="lookup", **{"class": "api"}) == 1
+    assert registry.counter(metrics.ERRORS, operation="lookup", **{"class": "http_503"}) == 1
+    assert {event["metric"] for event in events} == {metrics.PHASE_SECONDS, metrics.RESPONSE_BYTES, metrics.ERRORS}
+    assert registry.summary().startswith("lookup ")
+    assert "2 errors" in registry.summary()
+
+
+@pytest.mark.skipif(shutil.which("openssl") is None, reason="needs the openssl command")
+def test_https_connection_times_the_tls_handshake(registry, http_server, tmp_path):
+    cert, key = tmp_path / "cert.pem", tmp_path / "key.pem"
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+                    "-addext", "subjectAltName=DNS:localhost", "-keyout", str(key), "-out", str(cert)],
+                   check=True, capture_output=True)
+    server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(cert, key)
+    server = http_server(ssl_context=server_context)
+
+    async def fetch():
+        reader, writer = await _open_connection("localhost", server.server_address[1],
+                                                ssl.create_default_context(cafile=str(cert)), 0)
+        try:
+            writer.write(b"GET /1.1.1.1/json/ HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            return await _read_response(reader)
+        finally:
+            writer.close()
+
+    status, _, body = asyncio.run(fetch())
+    assert status == 200 and b"Testville" in body
+    recorded = phases(registry, "lookup")
+    assert recorded["dns"] == recorded["connect"] == recorded["tls"] == 1
+
+
+def test_single_and_async_lookups_and_cache_hits(registry, http_server):
+    base_url = http_server().base_url
+    cache = IPInfoCache()
+    scheduler = RequestScheduler(limits={})
+    for _ in range(2):
+        assert get_ip_info("1.1.1.1", cache=cache, scheduler=scheduler, base_url=base_url)["public_ip"] == "1.1.1.1"
+    assert asyncio.run(get_ip_info_async("9.9.9.9", base_url=base_url))["public_ip"] == "9.9.9.9"
+    assert get_ip_info("10.0.0.1", scheduler=scheduler, base_url="http://127.0.0.1:1")["error"]
+    recorded = phases(registry, "lookup")
+    assert recorded["total"] == 3
+    assert recorded["dns"] == recorded["connect"] == 3
+    assert recorded["server"] == recorded["read"] == recorded["parse"] == 2
+    assert registry.counter(metrics.CACHE_REQUESTS, cache="ip_cache", result="miss") == 1
+    assert registry.counter(metrics.CACHE_REQUESTS, cache="ip_cache", result="memory") == 1
+    assert registry.counter(metrics.ERRORS, operation="lookup", **{"class": "refused"}) == 1
+    assert "cache 1/2 hits" in registry.summary()
+
+
+def test_prometheus_text_file_and_endpoint(registry, tmp_path):
+    registry.observe(metrics.PHASE_SECONDS, 0.003, operation="lookup", phase="dns")
+    registry.inc(metrics.ERRORS, operation="lookup", **{"class": "timeout"})
+    text = registry.to_prometheus()
+    assert "# TYPE vlsm_phase_seconds histogram" in text
+    assert 'vlsm_phase_seconds_bucket{operation="lookup",phase="dns",le="0.0025"} 0' in text
+    assert 'vlsm_phase_seconds_bucket{operation="lookup",phase="dns",le="0.005"} 1' in text
+    assert 'vlsm_phase_seconds_bucket{operation="lookup",phase="dns",le="+Inf"} 1' in text
+    assert 'vlsm_phase_seconds_count{operation="lookup",phase="dns"} 1' in text
+    assert 'vlsm_errors_total{class="timeout",operation="lookup"} 1' in text
+
+    path = tmp_path / "textfile" / "vlsm.prom"
+    registry.write_prometheus(str(path))
+    assert path.read_text() == text
+
+    server = registry.serve(port=0)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert response.read().decode() == text
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_enable_from_env():
+    try:
+        assert metrics.enable_from_env({}) is None
+        assert metrics.enable_from_env({"VLSM_METRICS": "0"}) is None
+        registry = metrics.enable_from_env({"VLSM_METRICS_FILE": "/tmp/vlsm.prom"})
+        assert registry is metrics.get_metrics() is metrics.enable_from_env({"VLSM_METRICS": "1"})
+    finally:
+        metrics.disable()
@@ -0,0 +1,47 @@
+from conftest import fixed_response
+from monitor import IPMonitor, get_public_ip
+
+
+def test_get_public_ip_skips_bad_endpoints(http_server):
+    url = http_server(fixed_response("203.0.113.7\n")).base_url + "/"
+    assert get_public_ip(["http://127.0.0.1:9/", url], timeout=1) == "203.0.113.7"
+    assert get_public_ip(["http://127.0.0.1:9/"], timeout=1) is None
+
+
+def test_geolocates_only_on_change_and_backs_off(http_server):
+    addresses = ["203.0.113.7"]
+    url = http_server(lambda path: (200, addresses[0] + "\n")).base_url + "/"
+    lookups = []
+    events = []
+    monitor = IPMonitor(
+        on_change=events.append,
+        endpoints=[url],
+        min_interval=10,
+        max_interval=40,
+        backoff=2,
+        lookup=lambda ip: lookups.append(ip) or {"ip": ip, "city": "Testville"},
+    )
+    for _ in range(5):
+        monitor.check()
+    assert lookups == ["203.0.113.7"]
+    assert events[0]["previous"] is None
+    assert monitor.interval == 40
+
+    addresses[0] = "198.51.100.1"
+    event = monitor.check()
+    assert event["previous"] == "203.0.113.7" and event["info"]["city"] == "Testville"
+    assert lookups == ["203.0.113.7", "198.51.100.1"]
+    assert monitor.interval == 10
+    assert 9 <= monitor.next_delay() <= 11
+    assert monitor.stats()["checks"] == 6
+
+
+def test_failed_lookup_is_retried_on_the_next_check(http_server):
+    url = http_server(fixed_response("203.0.113.7\n")).base_url + "/"
+    answers = [{"error": "Failed to retrieve data: HTTP Error 503"}, {"ip": "203.0.113.7", "city": "Testville"}]
+    events = []
+    monitor = IPMonitor(on_change=events.append, endpoints=[url], min_interval=10, lookup=lambda ip: answers.pop(0))
+    assert monitor.check() is None
+    assert monitor.current is None and events == [] and monitor.stats()["failures"] == 1
+    assert monitor.check()["info"]["city"] == "Testville"
+    assert monitor.current == "203.0.113.7" and monitor.stats()["lookups"] == 2
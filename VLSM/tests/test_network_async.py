@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+from conftest import fixed_response
+from ip_cache import IPInfoCache
+from network_async import discover, get_ip_info_async
+from scheduler import get_scheduler
+
+PAYLOAD = {"ip": "203.0.113.7", "city": "Testville", "version": "IPv4"}
+
+
+def test_lookups_run_concurrently(http_server):
+    base_url = http_server(fixed_response(PAYLOAD), delay=0.3).base_url
+
+    async def three():
+        return await asyncio.gather(*(get_ip_info_async("1.1.1.1", base_url=base_url) for _ in range(3)))
+
+    started = time.perf_counter()
+    results = asyncio.run(three())
+    elapsed = time.perf_counter() - started
+    assert all(r["public_ip"] == "203.0.113.7" for r in results)
+    assert elapsed < 0.8
+
+
+def test_discover_merges_and_respects_deadlines(http_server):
+    base_url = http_server(fixed_response(PAYLOAD), delay=2.0).base_url
+    started = time.perf_counter()
+    merged = discover(base_url=base_url, timeout=0.2)
+    assert time.perf_counter() - started < 1.5
+    assert "timed out" in merged["errors"]["IPv4"]
+    assert "IPv6" in merged["errors"]
+    assert "error" in merged
+    assert "local_ipv4" in merged
+
+
+def test_discover_reports_public_ipv4(http_server):
+    merged = discover(base_url=http_server(fixed_response(PAYLOAD)).base_url)
+    assert merged["public_ipv4"] == "203.0.113.7"
+    assert merged["city"] == "Testville"
+    assert "error" not in merged
+
+
+def test_slot_wait_and_request_share_one_deadline(http_server):
+    base_url = http_server(fixed_response(PAYLOAD), delay=1.0).base_url
+    host = base_url.split("//")[1]
+    scheduler = get_scheduler()
+    scheduler.set_limits(host, ((1, 1.0),))
+    try:
+        assert scheduler.acquire(host)
+        started = time.perf_counter()
+        merged = discover(base_url=base_url, timeout=1.5)
+        # one family gets a slot after ~1s and has only the rest of its 1.5s left for the request
+        assert time.perf_counter() - started < 1.8
+        assert sorted(merged["errors"]) == ["IPv4", "IPv6"]
+    finally:
+        scheduler.set_limits(host, ())
+
+
+def test_failed_self_lookups_are_not_cached(http_server):
+    cache = IPInfoCache()
+    failed = discover(base_url=http_server(fixed_response({}, status=503)).base_url, cache=cache)
+    assert "HTTP Error 503" in failed["errors"]["IPv4"]
+    merged = discover(base_url=http_server(fixed_response(PAYLOAD)).base_url, cache=cache)
+    assert merged["public_ipv4"] == "203.0.113.7"
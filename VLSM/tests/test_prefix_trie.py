@@ -0,0 +1,107 @@
+import ipaddress
+import random
+
+from enrich import enrich
+from geo_offline import GeoDatabase, build_database
+from prefix_trie import PrefixTrie, build_trie, parse_line
+
+TABLE = """# prefix  origin  org
+0.0.0.0/0 AS64496 Default
+1.0.0.0/24 AS13335 Cloudflare, Inc.
+1.0.0.0/16,64500,Example Transit
+1.0.0.128/25 AS64501
+8.8.8.0\t24\t15169_36040
+2001:4860::/32 AS15169 Google LLC
+2001:4860:4860::/48 AS15169 Google LLC
+2606:4700::/32 AS13335 Cloudflare, Inc.
+1.0.0.0/24 AS13335 Cloudflare
+"""
+
+
+def build(tmp_path, text=TABLE):
+    source = tmp_path / "pfx2as.txt"
+    source.write_text(text)
+    path = str(tmp_path / "pfx2as.vpfx")
+    counts = build_trie(str(source), path)
+    return PrefixTrie(path), counts
+
+
+def test_line_formats():
+    assert parse_line("1.0.0.0/24 AS13335 Cloudflare, Inc.") == ("1.0.0.0/24", 13335, "Cloudflare, Inc.")
+    assert parse_line("1.0.0.0/24,13335,Cloudflare, Inc.") == ("1.0.0.0/24", 13335, "Cloudflare, Inc.")
+    assert parse_line("8.8.8.0\t24\t15169_36040") == ("8.8.8.0/24", 15169, "")
+    assert parse_line("  # comment") is None and parse_line("") is None
+
+
+def test_longest_prefix_match_and_queries(tmp_path):
+    trie, counts = build(tmp_path)
+    with trie:
+        assert counts["ipv4_prefixes"] == 5 and counts["ipv6_prefixes"] == 3
+        # the later line for 1.0.0.0/24 replaced the earlier one
+        assert trie.lookup("1.0.0.1") == {"network": "1.0.0.0/24", "asn": "AS13335", "org": "Cloudflare"}
+        assert trie.lookup("1.0.0.200")["asn"] == "AS64501"
+        assert trie.lookup("1.0.9.9") == {"network": "1.0.0.0/16", "asn": "AS64500", "org": "Example Transit"}
+        assert trie.lookup("8.8.8.8")["asn"] == "AS15169"
+        assert trie.lookup("9.9.9.9")["network"] == "0.0.0.0/0"
+        assert trie.lookup("2001:4860:4860::8888")["network"] == "2001:4860:4860::/48"
+        assert "error" in trie.lookup("2a00::1")
+        assert "error" in trie.lookup("bogus")
+
+        assert [r["network"] for r in trie.covered("1.0.0.0/16")] == ["1.0.0.0/16", "1.0.0.0/24", "1.0.0.128/25"]
+        assert [r["network"] for r in trie.covered("1.0.0.0/23")] == ["1.0.0.0/24", "1.0.0.128/25"]
+        assert trie.covered("10.0.0.0/8") == []
+        assert [r["network"] for r in trie.announced_by("AS15169")] == [
+            "8.8.8.0/24", "2001:4860::/32", "2001:4860:4860::/48",
+        ]
+        assert [r["network"] for r in trie.announced_by(13335)] == ["1.0.0.0/24", "2606:4700::/32"]
+        assert trie.announced_by("AS1") == []
+
+
+def test_matches_brute_force(tmp_path):
+    rng = random.Random(21)
+    routes = {}
+    for _ in range(1500):
+        if rng.random() < 0.6:
+            network = ipaddress.ip_network((rng.getrandbits(32) & rng.choice([~0, ~0 << 16, ~0 << 24]) & 0xFFFFFFFF,
+                                            rng.randint(0, 32)), strict=False)
+        else:
+            network = ipaddress.ip_network((rng.getrandbits(128) & (~0 << rng.choice([0, 96])) & ((1 << 128) - 1),
+                                            rng.randint(0, 128)), strict=False)
+        routes[network] = rng.randint(1, 20)
+    trie, _ = build(tmp_path, "".join(f"{network} AS{asn}\n" for network, asn in routes.items()))
+    with trie:
+        networks = list(routes)
+        for _ in range(1500):
+            network = rng.choice(networks)
+            if rng.random() < 0.5:
+                ip = network.network_address + rng.randrange(min(network.num_addresses, 1 << 64))
+            else:
+                ip = ipaddress.ip_address(rng.getrandbits(network.max_prefixlen))
+            covering = [n for n in networks if n.version == ip.version and ip in n]
+            got = trie.lookup(str(ip))
+            if covering:
+                best = max(covering, key=lambda n: n.prefixlen)
+                assert got == {"network": str(best), "asn": f"AS{routes[best]}", "org": ""}
+            else:
+                assert "error" in got
+        for network in rng.sample(networks, 50):
+            query = network.supernet(min(network.prefixlen, rng.randint(0, 6)))
+            expected = sorted((n for n in networks if n.version == query.version and n.subnet_of(query)),
+                              key=lambda n: (n.network_address, n.prefixlen))
+            assert [r["network"] for r in trie.covered(str(query))] == [str(n) for n in expected]
+
+
+def test_annotate_feeds_lookup_results(tmp_path):
+    trie, _ = build(tmp_path)
+    geo_csv = tmp_path / "geo.csv"
+    geo_csv.write_text("network,city,org,autonomous_system_number\n1.0.0.0/8,Sydney,APNIC Labs,4608\n")
+    build_database(str(geo_csv), str(tmp_path / "geo.vgeo"))
+    with trie, GeoDatabase(str(tmp_path / "geo.vgeo")) as geo:
+        ips = ["1.0.0.1", "1.0.0.200", "1.0.9.9", "2.0.0.1"]
+        records = {r["public_ip"]: r for r in enrich(ips, prefixes=trie, offline=geo)}
+        assert (records["1.0.0.1"]["asn"], records["1.0.0.1"]["org"]) == ("AS13335", "Cloudflare")
+        assert (records["1.0.9.9"]["asn"], records["1.0.9.9"]["org"]) == ("AS64500", "Example Transit")
+        # the table has no org for 1.0.0.128/25, so the geolocation org is kept
+        assert (records["1.0.0.200"]["asn"], records["1.0.0.200"]["org"]) == ("AS64501", "APNIC Labs")
+        assert "error" in records["2.0.0.1"]
+        assert trie.annotate({"public_ip": "N/A", "asn": "AS1"}) == {"public_ip": "N/A", "asn": "AS1"}
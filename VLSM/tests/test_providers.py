@@ -0,0 +1,142 @@
+import http.client
+import json
+import time
+
+from conftest import fixed_response
+from ip_cache import IPInfoCache
+from network import get_ip_info, get_ip_info_many
+from providers import HedgedResolver, Provider, ProviderStats, normalize_ip_api, normalize_ipapi, normalize_ipinfo
+from test_lookup_service import request, running
+
+
+def make_provider(name, base_url, normalize=normalize_ipapi):
+    return Provider(name, base_url + "/{ip}/json/", base_url + "/json/", normalize, timeout=5)
+
+
+IPAPI_PAYLOAD = {"ip": "203.0.113.7", "city": "Slowville", "version": "IPv4", "asn": "AS64500"}
+IP_API_PAYLOAD = {"status": "success", "query": "203.0.113.7", "city": "Fastville", "countryCode": "NZ",
+                  "lat": -41.3, "lon": 174.8, "as": "AS64501 Example Net"}
+
+
+def test_normalizers_share_the_schema():
+    ipinfo = normalize_ipinfo({"ip": "198.51.100.1", "loc": "1.5,2.5", "org": "AS64502 Example", "country": "NL"})
+    assert ipinfo["latitude"] == 1.5 and ipinfo["asn"] == "AS64502" and ipinfo["org"] == "Example"
+    assert ipinfo["country_code"] == "NL" and ipinfo["country_name"] == "N/A"
+    ip_api = normalize_ip_api(IP_API_PAYLOAD)
+    assert ip_api["public_ip"] == "203.0.113.7" and ip_api["asn"] == "AS64501" and ip_api["longitude"] == 174.8
+    assert "error" in normalize_ip_api({"status": "fail", "message": "reserved range"})
+
+
+def test_hedge_returns_fast_provider(http_server):
+    slow_url = http_server(fixed_response(IPAPI_PAYLOAD), delay=1.5).base_url
+    fast_url = http_server(fixed_response(IP_API_PAYLOAD)).base_url
+    resolver = HedgedResolver([make_provider("slow", slow_url), make_provider("fast", fast_url, normalize_ip_api)],
+                              initial_hedge=0.1)
+    try:
+        started = time.perf_counter()
+        data = resolver.lookup("203.0.113.7")
+        assert time.perf_counter() - started < 1.0
+        assert data["provider"] == "fast"
+        assert data["city"] == "Fastville"
+    finally:
+        resolver.close()
+
+
+def test_errors_hedge_immediately_and_breaker_ejects(http_server):
+    broken = http_server(fixed_response({"error": True, "reason": "RateLimited"}, status=429))
+    good_url = http_server(fixed_response(IPAPI_PAYLOAD)).base_url
+    resolver = HedgedResolver([make_provider("broken", broken.base_url), make_provider("good", good_url)],
+                              initial_hedge=5.0, failure_threshold=1, cooldown=60)
+    try:
+        for _ in range(6):
+            started = time.perf_counter()
+            assert resolver.lookup("203.0.113.7")["provider"] == "good"
+            assert time.perf_counter() - started < 1.0
+        snapshot = resolver.snapshot()
+        assert snapshot["broken"]["state"] == "open"
+        assert snapshot["good"]["error_rate"] == 0.0
+        assert len(broken.hits) == 1
+    finally:
+        resolver.close()
+
+
+def test_fast_failure_hedges_while_another_request_is_pending(http_server):
+    slow_url = http_server(fixed_response(IPAPI_PAYLOAD), delay=2.0).base_url
+    broken_url = http_server(fixed_response({}, status=503)).base_url
+    good_url = http_server(fixed_response(IP_API_PAYLOAD)).base_url
+    resolver = HedgedResolver([make_provider("slow", slow_url), make_provider("broken", broken_url),
+                               make_provider("good", good_url, normalize_ip_api)], initial_hedge=0.5)
+    try:
+        started = time.perf_counter()
+        assert resolver.lookup("203.0.113.7")["provider"] == "good"
+        # one hedge delay to reach "broken", whose error moves straight on to "good"
+        assert time.perf_counter() - started < 0.9
+    finally:
+        resolver.close()
+
+def test_all_providers_failing_returns_error(http_server):
+    broken_url = http_server(fixed_response({}, status=503)).base_url
+    resolver = HedgedResolver([make_provider("a", broken_url), make_provider("b", broken_url)], initial_hedge=0.1)
+    try:
+        data = resolver.lookup("203.0.113.7")
+        assert data["error"].startswith("All providers failed")
+        assert "HTTP Error 503" in data["error"]
+    finally:
+        resolver.close()
+
+
+def test_breaker_half_open_trial():
+    now = [0.0]
+    stats = ProviderStats(failure_threshold=2, cooldown=10, clock=lambda: now[0])
+    stats.record(0.1, False)
+    assert stats.state == "closed"
+    stats.record(0.1, False)
+    assert stats.state == "open" and not stats.allow()
+    now[0] = 11
+    assert stats.allow() and not stats.allow()  # a single trial request
+    stats.record(0.05, True)
+    assert stats.state == "closed"
+    assert stats.percentile(0.95) == 0.05
+
+
+class _Scripted(Provider):
+    def __init__(self, name, answers):
+        super().__init__(name, "http://unused/{ip}", "http://unused/", normalize_ipapi)
+        self.answers = answers
+
+    def fetch(self, ip=None):
+        return self.answers.pop(0)
+
+
+def test_throttled_trial_gives_back_the_half_open_slot():
+    now = [0.0]
+    provider = _Scripted("a", [{"error": "local rate limit reached", "throttled": True}, {"ip": "203.0.113.7"}])
+    resolver = HedgedResolver([provider], initial_hedge=0.1)
+    stats = resolver.stats["a"] = ProviderStats(failure_threshold=1, cooldown=10, clock=lambda: now[0])
+    try:
+        stats.record(0.1, False)
+        now[0] = 11
+        assert "local rate limit" in resolver.lookup("203.0.113.7")["error"]
+        assert stats.state == "half-open"
+        assert resolver.lookup("203.0.113.7")["ip"] == "203.0.113.7"  # the trial slot was released
+        assert stats.state == "closed"
+    finally:
+        resolver.close()
+
+
+def test_lookups_can_go_through_a_resolver(http_server):
+    down_url = http_server(fixed_response({}, status=503)).base_url
+    good = http_server(fixed_response(IP_API_PAYLOAD))
+    resolver = HedgedResolver([make_provider("down", down_url), make_provider("good", good.base_url, normalize_ip_api)],
+                              initial_hedge=5.0)
+    cache = IPInfoCache()
+    try:
+        assert get_ip_info("203.0.113.7", resolver=resolver, cache=cache)["provider"] == "good"
+        results = dict(get_ip_info_many(["203.0.113.7", "198.51.100.1"], resolver=resolver, cache=cache))
+        assert {data["city"] for data in results.values()} == {"Fastville"}
+        assert len(good.hits) == 2  # the first address came from the cache
+        with running(resolver=resolver) as service:
+            conn = http.client.HTTPConnection("127.0.0.1", service.port, timeout=5)
+            assert json.loads(request(conn, "GET", "/lookup/192.0.2.1")[2])["provider"] == "good"
+    finally:
+        resolver.close()
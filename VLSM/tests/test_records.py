@@ -0,0 +1,63 @@
+import csv
+import io
+import json
+import sys
+
+from network import RECORD_FIELDS, to_record
+from records import IPRecord, IPRecordBatch, parse_address
+
+IPAPI = {
+    "ip": "203.0.113.7", "city": "Wellington", "region": "Wellington", "country": "NZ",
+    "country_name": "New Zealand", "country_code": "NZ", "latitude": -41.3, "longitude": 174.8,
+    "timezone": "Pacific/Auckland", "org": "Example Net", "asn": "AS64500", "version": "IPv4",
+}
+
+
+def test_record_normalizes_every_shape():
+    record = IPRecord.from_dict(IPAPI)
+    assert record.as_record() == to_record(IPAPI)
+    assert to_record(record) == to_record(IPAPI)
+    # the RECORD_FIELDS form and the ip-api.com style keys parse to the same record
+    assert IPRecord.from_dict(to_record(IPAPI)) == record
+    alt = {"public_ip": "203.0.113.7", "lat": "-41.3", "lon": "174.8", "country": "New Zealand (NZ)",
+           "city": "Wellington", "regionName": "Wellington", "timezone": "Pacific/Auckland",
+           "org": "Example Net", "asn": "AS64500"}
+    assert IPRecord.from_dict(alt) == record
+    assert record.address == 0xCB007107
+    local = IPRecord.from_dict({"local_ipv4": "192.0.2.2", "local_ipv6": "fe80::1%eth0", "error": "boom"})
+    assert local.as_record()["local_ipv6"] == "fe80::1%eth0"
+    assert local.public_ip == "N/A" and local.error == "boom"
+    # to_record() goes through the same normalizer, so both shapes flatten alike
+    assert to_record(alt) == to_record(IPAPI)
+    # only canonical dotted quads are addresses, not inet_aton shorthand
+    assert parse_address("127.1") == (0, None, None)
+    assert parse_address("127.0.0.1") == (4, 0x7F000001, None)
+
+
+def test_strings_are_interned():
+    a = IPRecord.from_dict(dict(IPAPI))
+    b = IPRecord.from_dict(json.loads(json.dumps(IPAPI)))
+    assert a.timezone is b.timezone and a.asn is b.asn
+    assert not hasattr(a, "__dict__")
+
+
+def test_batch_round_trip_and_writers():
+    rows = [dict(IPAPI, ip=f"10.0.0.{i}", city=f"City{i % 3}") for i in range(100)]
+    rows.append({"ip": "2001:db8::1", "error": "Failed to retrieve data: nope"})
+    batch = IPRecordBatch(rows)
+    assert len(batch) == 101
+    assert batch[5] == IPRecord.from_dict(rows[5])
+    assert batch[-1].public_ip == "2001:db8::1" and batch[-1].latitude is None
+    assert len(batch.codes("city")[1]) == 4  # missing + 3 distinct cities
+
+    out = io.StringIO()
+    batch.write_csv(out)
+    parsed = list(csv.reader(io.StringIO(out.getvalue())))
+    assert tuple(parsed[0]) == RECORD_FIELDS
+    assert parsed[1] == [str(v) for v in to_record(rows[0]).values()]
+
+    out = io.StringIO()
+    batch.write_jsonl(out)
+    assert json.loads(out.getvalue().splitlines()[7]) == to_record(rows[7])
+    assert batch.nbytes == 101 * 73  # 1 + 2 * 8 + 2 * 8 + 10 * 4 bytes per record
+    assert sys.getsizeof(batch[0]) < sys.getsizeof(rows[0])
@@ -0,0 +1,115 @@
+import math
+
+import numpy as np
+
+from records import IPRecordBatch
+from reverse_geocode import CityIndex, KDTree, unit_vectors
+
+GEONAMES = [
+    # geonameid, name, asciiname, alternatenames, lat, lon, class, code, country, cc2, admin1, ... timezone
+    ["2147714", "Sydney", "Sydney", "", "-33.86785", "151.20732", "P", "PPLA", "AU", "", "02"],
+    ["2158177", "Melbourne", "Melbourne", "", "-37.814", "144.96332", "P", "PPLA", "AU", "", "07"],
+    ["5128581", "New York City", "New York City", "", "40.71427", "-74.00597", "P", "PPL", "US", "", "NY"],
+    ["2643743", "London", "London", "", "51.50853", "-0.12574", "P", "PPLC", "GB", "", "ENG"],
+    ["4031574", "Nuku'alofa", "Nuku'alofa", "", "-21.13938", "-175.2018", "P", "PPLC", "TO", "", "02"],
+]
+TIMEZONES = {"AU": "Australia/Sydney", "US": "America/New_York", "GB": "Europe/London", "TO": "Pacific/Tongatapu"}
+
+
+def write_geonames(tmp_path):
+    lines = []
+    for row in GEONAMES:
+        fields = row + [""] * (17 - len(row)) + [TIMEZONES[row[8]], "2024-01-01"]
+        lines.append("\t".join(fields))
+    (tmp_path / "cities.txt").write_text("\n".join(lines) + "\n")
+    (tmp_path / "admin1.txt").write_text(
+        "AU.02\tNew South Wales\tNew South Wales\t2155400\nAU.07\tVictoria\tVictoria\t2145234\n"
+        "US.NY\tNew York\tNew York\t5128638\n"
+    )
+    (tmp_path / "countries.txt").write_text(
+        "#ISO\tISO3\tISO-Numeric\tfips\tCountry\n"
+        "AU\tAUS\t036\tAS\tAustralia\nUS\tUSA\t840\tUS\tUnited States\nGB\tGBR\t826\tUK\tUnited Kingdom\n"
+    )
+    return CityIndex.from_gazetteer(
+        str(tmp_path / "cities.txt"), str(tmp_path / "admin1.txt"), str(tmp_path / "countries.txt")
+    )
+
+
+def test_tree_matches_brute_force():
+    rng = np.random.default_rng(22)
+    for count in (1, 7, 33, 2000):
+        points = unit_vectors(rng.uniform(-90, 90, count), rng.uniform(-180, 180, count))
+        tree = KDTree(points, leaf_size=8)
+        queries = unit_vectors(rng.uniform(-90, 90, 1000), rng.uniform(-180, 180, 1000))
+        expected = ((queries[:, None, :] - points[None, :, :]) ** 2).sum(axis=2)
+        distance, index = tree.query(queries)
+        assert np.allclose(distance, expected.min(axis=1))
+        assert np.allclose(expected[np.arange(1000), index], distance)
+        distance, index = tree.query(queries, bound=0.01)
+        assert ((index == -1) == (expected.min(axis=1) > 0.01)).all()
+
+
+def test_geonames_reverse_and_labels(tmp_path):
+    index = write_geonames(tmp_path)
+    assert len(index) == 5
+    place = index.reverse(-33.9, 151.1)
+    assert (place["city"], place["region"], place["country_name"], place["country_code"], place["timezone"]) == (
+        "Sydney", "New South Wales", "Australia", "AU", "Australia/Sydney",
+    )
+    assert 5 < place["distance_km"] < 15
+    # across the antimeridian, and region/country names falling back to codes
+    assert index.reverse(-21.0, 179.9, max_km=600)["city"] == "Nuku'alofa"
+    assert index.label(-21.1, 184.8) == "Nuku'alofa, 02, TO"
+    assert index.label(51.5, 0.0) == "London, ENG, United Kingdom"
+    assert "error" in index.reverse(0.0, 0.0)
+    assert index.reverse(0.0, 0.0, max_km=None)["city"] == "London"
+    assert index.label(0.0, 0.0) is None
+
+    indices, distances = index.nearest([40.7, math.nan, 95.0, -37.8], [-74.0, 0.0, 0.0, 145.0])
+    assert indices.tolist() == [2, -1, -1, 1]
+    assert np.isnan(distances[1:3]).all()
+
+    index.save(str(tmp_path / "cities.npz"))
+    loaded = CityIndex.load(str(tmp_path / "cities.npz"))
+    assert loaded.reverse(-33.9, 151.1) == place
+
+
+def test_csv_gazetteer_and_fill(tmp_path):
+    (tmp_path / "places.csv").write_text(
+        "name,region_name,country,country_code,lat,lng,time_zone\n"
+        "Zürich,Zurich,Switzerland,CH,47.36667,8.55,Europe/Zurich\n"
+        "Geneva,Geneva,Switzerland,CH,46.20222,6.14569,Europe/Zurich\n"
+        "Broken,,,,north,east,\n"
+    )
+    index = CityIndex.from_gazetteer(str(tmp_path / "places.csv"))
+    assert len(index) == 2
+    records = [
+        {"public_ip": "1.1.1.1", "latitude": 47.4, "longitude": 8.5, "city": "N/A", "country_name": "Schweiz"},
+        {"public_ip": "2.2.2.2", "lat": "46.2", "lon": "6.1"},
+        {"public_ip": "3.3.3.3", "latitude": "N/A", "longitude": "N/A"},
+        {"public_ip": "4.4.4.4", "latitude": -33.9, "longitude": 151.1},
+    ]
+    filled = list(index.fill(records, chunk=3))
+    assert filled[0]["city"] == "Zürich" and filled[0]["country_name"] == "Schweiz"
+    assert filled[0]["timezone"] == "Europe/Zurich"
+    assert filled[1]["city"] == "Geneva" and filled[1]["region"] == "Geneva"
+    assert "city" not in filled[2] and "city" not in filled[3]
+    assert next(index.fill([dict(records[0])], overwrite=True))["country_name"] == "Switzerland"
+
+
+def test_fill_batch_writes_codes(tmp_path):
+    index = write_geonames(tmp_path)
+    batch = IPRecordBatch([
+        {"ip": "1.1.1.1", "latitude": -33.87, "longitude": 151.2},
+        {"ip": "8.8.8.8", "latitude": 40.7, "longitude": -74.0, "city": "Manhattan"},
+        {"ip": "9.9.9.9"},
+        {"ip": "4.4.4.4", "latitude": 0.0, "longitude": 0.0},
+    ])
+    assert index.fill_batch(batch) == 2
+    assert batch.column("city") == ["Sydney", "Manhattan", None, None]
+    assert batch.column("country_name") == ["Australia", "United States", None, None]
+    assert batch[0].timezone == "Australia/Sydney" and batch[1].region == "New York"
+    assert index.fill_batch(batch, overwrite=True) == 2
+    assert batch.column("city")[1] == "New York City"
+    batch.append({"ip": "5.5.5.5", "city": "Sydney"})
+    assert batch.column("city")[-1] == "Sydney" and batch.codes("city")[1].count("Sydney") == 1
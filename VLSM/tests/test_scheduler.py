@@ -0,0 +1,144 @@
+import threading
+import time
+
+import pytest
+
+from ip_cache import IPInfoCache
+from network import get_ip_info, get_ip_info_many
+from scheduler import BATCH, INTERACTIVE, RequestScheduler, SlotTimeout
+
+
+def test_token_bucket_paces_requests():
+    scheduler = RequestScheduler(limits={"api.test": ((5, 0.5),)})
+    started = time.perf_counter()
+    for _ in range(10):
+        assert scheduler.acquire("api.test")
+    # 5 burst tokens, then 5 more at 10/s
+    assert 0.4 < time.perf_counter() - started < 1.0
+    assert not scheduler.acquire("api.test", timeout=0)
+    assert scheduler.acquire("unlimited.test", timeout=0)
+
+
+def test_interactive_jumps_ahead_of_batch():
+    scheduler = RequestScheduler(limits={"api.test": ((1, 0.1),)})
+    assert scheduler.acquire("api.test")
+    order = []
+
+    def worker(name, priority):
+        scheduler.acquire("api.test", priority)
+        order.append(name)
+
+    threads = [threading.Thread(target=worker, args=(f"batch{i}", BATCH)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.02)
+    interactive = threading.Thread(target=worker, args=("ui", INTERACTIVE))
+    interactive.start()
+    for thread in threads + [interactive]:
+        thread.join()
+    assert order[0] == "ui"
+
+
+def test_singleflight_coalesces_concurrent_calls():
+    scheduler = RequestScheduler(limits={})
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"ip": "203.0.113.7"}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(scheduler.do("k", fetch))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [{"ip": "203.0.113.7"}] * 5
+    assert scheduler.stats()["coalesced"] == 4
+
+
+def test_rate_limited_result_pauses_host():
+    scheduler = RequestScheduler(limits={}, penalty=30)
+    scheduler.do("k", lambda: {"error": "HTTP Error 429"}, host="api.test", rate_limited=lambda d: "429" in d["error"])
+    assert not scheduler.acquire("api.test", timeout=0.05)
+    assert scheduler.stats()["penalties"] == 1
+
+
+def test_bulk_lookup_respects_quota(http_server):
+    base_url = http_server().base_url
+    host = base_url.split("//")[1]
+    scheduler = RequestScheduler(limits={host: ((4, 0.2),)})
+    started = time.perf_counter()
+    results = list(get_ip_info_many([f"10.0.0.{i}" for i in range(12)], concurrency=4, base_url=base_url,
+                                    scheduler=scheduler))
+    assert len(results) == 12
+    # 4 burst tokens, then 8 more at 20/s
+    assert time.perf_counter() - started >= 0.35
+
+
+def test_interactive_callers_give_up_on_an_empty_quota(http_server):
+    server = http_server()
+    host = server.base_url.split("//")[1]
+    scheduler = RequestScheduler(limits={host: ((1, 86400.0),)}, interactive_wait=0.2)
+    assert scheduler.acquire(host)
+    started = time.perf_counter()
+    with pytest.raises(SlotTimeout):
+        scheduler.do("k", lambda: {}, host=host, priority=INTERACTIVE)
+    data = get_ip_info("1.1.1.1", scheduler=scheduler, base_url=server.base_url)
+    assert time.perf_counter() - started < 1.0
+    assert data["throttled"] and "no request slot" in data["error"]
+    assert server.hits == []
+    assert not scheduler.acquire(host, BATCH, timeout=0)
+
+
+def test_throttled_lookups_are_not_cached(http_server):
+    server = http_server()
+    host = server.base_url.split("//")[1]
+    scheduler = RequestScheduler(limits={host: ((1, 0.3),)}, interactive_wait=0.01)
+    cache = IPInfoCache()
+    assert scheduler.acquire(host)
+    assert get_ip_info("1.1.1.1", cache=cache, scheduler=scheduler, base_url=server.base_url)["throttled"]
+    time.sleep(0.35)
+    assert get_ip_info("1.1.1.1", cache=cache, scheduler=scheduler, base_url=server.base_url)["city"] == "Testville"
+    assert server.hits == ["/1.1.1.1/json/"]
+
+
+def test_interactive_follower_of_a_stalled_batch_call_gives_up():
+    scheduler = RequestScheduler(limits={"api.test": ((1, 86400.0),)}, interactive_wait=0.2)
+    assert scheduler.acquire("api.test")
+    errors = []
+
+    def batch_leader():
+        try:
+            scheduler.do("k", dict, host="api.test", priority=BATCH, timeout=1.0)
+        except SlotTimeout as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=batch_leader)
+    leader.start()
+    time.sleep(0.05)
+    started = time.perf_counter()
+    with pytest.raises(SlotTimeout):
+        scheduler.do("k", dict, host="api.test", priority=INTERACTIVE)
+    assert time.perf_counter() - started < 0.5
+    leader.join()
+    assert len(errors) == 1  # the leader itself still waits its own (BATCH) timeout
+
+
+def test_interactive_follower_moves_its_batch_call_up_the_queue():
+    scheduler = RequestScheduler(limits={"api.test": ((1, 0.3),)})
+    assert scheduler.acquire("api.test")
+    order = []
+    other = threading.Thread(target=lambda: scheduler.acquire("api.test", BATCH) and order.append("other"))
+    other.start()
+    time.sleep(0.02)
+    leader = threading.Thread(target=lambda: scheduler.do("k", lambda: order.append("k"), host="api.test"))
+    leader.start()
+    time.sleep(0.02)
+    scheduler.do("k", dict, host="api.test", priority=INTERACTIVE)
+    for thread in (leader, other):
+        thread.join()
+    assert order == ["k", "other"]
+    assert scheduler.stats()["coalesced"] == 1
@@ -0,0 +1,20 @@
+import pytest
+
+import startup
+
+
+@pytest.fixture(scope="module")
+def folium_ms():
+    pytest.importorskip("folium")
+    return min(startup.measure_import("folium")[0] for _ in range(3))
+
+
+# Absolute import times are machine dependent; the budgets are checked by
+# benchmarks/startup.py and tracked by the imports group of benchmarks/suite.py.
+# Here each entry point only has to start up well ahead of folium alone.
+@pytest.mark.parametrize("module", ["network", "VLSM", "ui"])
+def test_import_skips_heavy_dependencies(module, folium_ms):
+    elapsed, imported = min((startup.measure_import(module) for _ in range(3)), key=lambda run: run[0])
+    heavy = {name for name in imported if name.split(".")[0] in startup.HEAVY_MODULES}
+    assert not heavy, f"importing {module} pulled in {sorted(heavy)}"
+    assert elapsed * 2 < folium_ms, f"importing {module} took {elapsed:.0f} ms, folium alone {folium_ms:.0f} ms"
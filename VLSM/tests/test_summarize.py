@@ -0,0 +1,53 @@
+import ipaddress
+import os
+import random
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from records import IPRecordBatch
+from VLSM.summarize import collapse, collapse_by, summarize_records
+
+
+def test_collapse_matches_ipaddress():
+    rng = random.Random(18)
+    for _ in range(100):
+        bits = rng.choice([32, 128])
+        base = rng.getrandbits(bits)
+        items = []
+        for _ in range(rng.randrange(1, 50)):
+            value = (base + rng.randrange(-300, 300)) % (1 << bits)
+            prefixlen = rng.choice([bits, bits, bits - 1, bits - 2, bits - 8])
+            address = ipaddress.IPv4Address(value) if bits == 32 else ipaddress.IPv6Address(value)
+            items.append(f"{address}/{prefixlen}")
+        networks = (ipaddress.ip_network(item, strict=False) for item in items)
+        assert collapse(items).to_strings() == [str(n) for n in ipaddress.collapse_addresses(networks)]
+    assert collapse(["255.255.255.254", "255.255.255.255", "::/1", "8000::/1", "bad", "10.0.0.0/33"]).to_strings() == [
+        "255.255.255.254/31", "::/0",
+    ]
+
+
+def test_overcoverage_budget():
+    addresses = ["10.0.0.0", "10.0.0.1", "10.0.0.2", "10.0.0.4", "10.0.0.5", "10.0.0.6", "2001:db8::1", "2001:db8::2",
+                 "2001:db8::3"]
+    assert len(collapse(addresses)) == 6
+    loose = collapse(addresses, overcoverage=0.5)
+    assert loose.to_strings() == ["10.0.0.0/29", "2001:db8::/126"]
+    assert loose.covered.tolist() == [6.0, 3.0]
+    assert loose.overcoverage <= 0.5
+    assert collapse(addresses, overcoverage=0.2).to_strings() == [
+        "10.0.0.0/31", "10.0.0.2/32", "10.0.0.4/31", "10.0.0.6/32", "2001:db8::1/128", "2001:db8::2/127",
+    ]
+
+
+def test_grouped_by_attribute():
+    groups = collapse_by(["10.0.0.0", "10.0.0.1", "10.0.0.2", "10.0.0.3"], ["a", "a", "b", "b"])
+    assert {key: p.to_strings() for key, p in groups.items()} == {"a": ["10.0.0.0/31"], "b": ["10.0.0.2/31"]}
+
+    records = IPRecordBatch(
+        {"ip": f"192.0.2.{i}", "asn": "AS64500" if i < 128 else "AS64501"} for i in range(256)
+    )
+    records.append({"ip": "2001:db8::1", "asn": "AS64500"})
+    by_asn = summarize_records(records, by="asn")
+    assert by_asn["AS64500"].to_strings() == ["192.0.2.0/25", "2001:db8::1/128"]
+    assert by_asn["AS64501"].to_strings() == ["192.0.2.128/25"]
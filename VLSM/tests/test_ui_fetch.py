@@ -0,0 +1,27 @@
+import queue
+import time
+
+from conftest import fixed_response
+from ui import FetchJob
+
+PAYLOAD = {"ip": "203.0.113.7", "city": "Testville", "version": "IPv4"}
+
+
+def test_fetch_job_posts_result(http_server):
+    results = queue.Queue()
+    job = FetchJob(results, base_url=http_server(fixed_response(PAYLOAD)).base_url).start()
+    posted, merged = results.get(timeout=5)
+    assert posted is job
+    assert merged["public_ipv4"] == "203.0.113.7"
+
+
+def test_cancel_aborts_outstanding_fetch(http_server):
+    results = queue.Queue()
+    job = FetchJob(results, base_url=http_server(fixed_response(PAYLOAD), delay=3.0).base_url).start()
+    time.sleep(0.2)
+    started = time.perf_counter()
+    job.cancel()
+    job.thread.join(timeout=5)
+    assert not job.thread.is_alive()
+    assert time.perf_counter() - started < 1.5
+    assert results.empty()
@@ -0,0 +1,52 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import pytest
+
+from VLSM.vlsm import VLSMPlan, allocate
+
+
+def test_classic_ipv4_plan():
+    subnets = allocate("192.168.1.0/24", [("A", 100), ("D", 2), ("B", 50), ("C", 20)])
+    rows = [s.as_dict() for s in subnets]
+    assert [r["name"] for r in rows] == ["A", "B", "C", "D"]
+    assert [r["network"] for r in rows] == [
+        "192.168.1.0/25", "192.168.1.128/26", "192.168.1.192/27", "192.168.1.224/30",
+    ]
+    assert rows[0]["broadcast"] == "192.168.1.127"
+    assert (rows[0]["first_host"], rows[0]["last_host"]) == ("192.168.1.1", "192.168.1.126")
+    assert rows[0]["waste"] == 26
+    assert rows[3]["waste"] == 0
+
+
+def test_ipv6_plan_has_no_broadcast_and_min_64():
+    subnets = allocate("2001:db8::/48", [10, 300])
+    assert all(s.prefixlen == 64 for s in subnets)
+    assert subnets[0].broadcast is None
+    assert str(subnets[1].network) == "2001:db8:0:1::/64"
+
+
+def test_release_merges_buddies_and_reserve():
+    plan = VLSMPlan("10.0.0.0/24")
+    a = plan.allocate(10)
+    b = plan.allocate(10)
+    plan.reserve("10.0.0.128/25", name="existing")
+    with pytest.raises(ValueError):
+        plan.reserve("10.0.0.192/26")
+    plan.release(a)
+    plan.release(b)
+    assert [str(n) for n in plan.free_blocks()] == ["10.0.0.0/25"]
+    assert plan.free_addresses == 128
+
+
+def test_plan_full_raises():
+    plan = VLSMPlan("10.0.0.0/30")
+    plan.allocate(2)
+    with pytest.raises(ValueError):
+        plan.allocate(1)
+
+
+def test_large_plan_does_not_overlap():
+    subnets = allocate("10.0.0.0/8", [(i % 200) + 1 for i in range(20000)])
+    spans = sorted((s.network_int, s.network_int + s.size) for s in subnets)
+    assert all(end <= nxt for (_, end), (nxt, _) in zip(spans, spans[1:]))
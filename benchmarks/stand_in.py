@@ -0,0 +1,208 @@
+"""
+Local stand-in for the ipapi.co JSON API.
+
+Serves /json/ (the caller's "own" address) and /<ip>/json/ with payloads shaped
+like ipapi.co's, derived deterministically from the address, over HTTP/1.1
+keep-alive. Latency, jitter, an error rate and a rate limit are configurable,
+so lookups can be benchmarked (or demoed) without touching the real service.
+
+    python benchmarks/stand_in.py [--port 8080] [--latency 0.05] [--error-rate 0.01] [--rate-limit 45/60]
+"""
+import argparse
+import ipaddress
+import json
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_CITIES = (
+    ("Wellington", "Wellington", "NZ", "New Zealand", -41.2866, 174.7756, "Pacific/Auckland", "+1300"),
+    ("Amsterdam", "North Holland", "NL", "Netherlands", 52.3740, 4.8897, "Europe/Amsterdam", "+0200"),
+    ("Mountain View", "California", "US", "United States", 37.4056, -122.0775, "America/Los_Angeles", "-0700"),
+    ("Tokyo", "Tokyo", "JP", "Japan", 35.6895, 139.6917, "Asia/Tokyo", "+0900"),
+    ("Sao Paulo", "Sao Paulo", "BR", "Brazil", -23.5475, -46.6361, "America/Sao_Paulo", "-0300"),
+)
+
+
+def payload(ip):
+    """
+    The ipapi.co-style answer for `ip`, or its {"error": true, ...} answer for an invalid address.
+    """
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return {"ip": ip, "error": True, "reason": "Invalid IP Address"}
+    seed = zlib.crc32(address.packed)
+    city, region, code, country, latitude, longitude, timezone, offset = _CITIES[seed % len(_CITIES)]
+    asn = 64496 + seed % 16
+    return {
+        "ip": str(address),
+        "network": str(ipaddress.ip_network(f"{address}/{24 if address.version == 4 else 48}", strict=False)),
+        "version": f"IPv{address.version}",
+        "city": city,
+        "region": region,
+        "country": code,
+        "country_name": country,
+        "country_code": code,
+        "in_eu": code == "NL",
+        "latitude": latitude,
+        "longitude": longitude,
+        "timezone": timezone,
+        "utc_offset": offset,
+        "asn": f"AS{asn}",
+        "org": f"EXAMPLE-NET-{asn}",
+    }
+
+
+class StandInServer:
+    """
+    Threaded ipapi.co stand-in on 127.0.0.1.
+
+    Each request sleeps `latency` (+ up to `jitter`) seconds; a fraction
+    `error_rate` of them fail with HTTP 503; with `rate_limit` = (requests, per
+    seconds) requests beyond the quota get ipapi.co's 429 "RateLimited" answer.
+    Usable as a context manager; `base_url` is set once started.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=None, self_ip="203.0.113.10",
+                 port=0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.self_ip = self_ip
+        self.port = port
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window = []
+        self._server = None
+        self.base_url = None
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.connections = 0
+
+    def _admit(self):
+        """
+        Returns (status, reason) for the next request, or None to answer it normally.
+        """
+        with self._lock:
+            self.requests += 1
+            if self.rate_limit is not None:
+                quota, per = self.rate_limit
+                now = time.monotonic()
+                self._window = [t for t in self._window if now - t < per]
+                if len(self._window) >= quota:
+                    self.rate_limited += 1
+                    return 429, "Too Many Requests"
+                self._window.append(now)
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.errors += 1
+                return 503, "Service Unavailable"
+            delay = self.latency + (self._random.random() * self.jitter if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+        return None
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body go out in separate writes; without TCP_NODELAY the
+            # client's delayed ACK would add ~40 ms to every keep-alive response
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                parts = [part for part in self.path.split("?")[0].split("/") if part]
+                failure = stand_in._admit()
+                if failure is not None:
+                    status, reason = failure
+                    answer = {"error": True, "reason": "RateLimited" if status == 429 else reason}
+                elif parts == ["json"]:
+                    status, answer = 200, payload(stand_in.self_ip)
+                elif len(parts) == 2 and parts[1] == "json":
+                    status, answer = 200, payload(parts[0])
+                else:
+                    status, answer = 404, {"error": True, "reason": "Not Found"}
+                body = json.dumps(answer).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", self.port), self._handler())
+        self._server.daemon_threads = True
+        original = self._server.process_request
+
+        def counting(request, client_address):
+            with self._lock:
+                self.connections += 1
+            original(request, client_address)
+
+        self._server.process_request = counting
+        threading.Thread(target=self._server.serve_forever, name="ipapi-stand-in", daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "rate_limited": self.rate_limited,
+                "connections": self.connections,
+            }
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _rate(text):
+    requests, _, per = text.partition("/")
+    return int(requests), float(per or 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds, at random")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--rate-limit", type=_rate, help="REQUESTS/SECONDS quota, e.g. 45/60")
+    args = parser.parse_args(argv)
+
+    server = StandInServer(args.latency, args.jitter, args.error_rate, args.rate_limit, port=args.port).start()
+    print(f"ipapi.co stand-in listening on {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(json.dumps(server.stats()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
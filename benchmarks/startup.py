@@ -0,0 +1,140 @@
+"""
+Cold-start budget check.
+
+Runs `python -X importtime` in a fresh interpreter for each entry point and fails
+when an import exceeds its budget or pulls in a heavy optional dependency
+(folium and everything behind it should load only when a map is rendered).
+Launching IPInfoApp is timed too when a display is available.
+
+    python benchmarks/startup.py [--repeat N] [--json out.json]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# cumulative import time budgets in milliseconds (best of --repeat runs)
+BUDGETS_MS = {
+    "network": 150,
+    "VLSM": 150,
+    "ui": 300,
+    "launch IPInfoApp": 1000,
+}
+
+# modules that must not be imported just to start up
+HEAVY_MODULES = ("folium", "branca", "jinja2", "pandas", "numpy")
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+_LAUNCH_APP = """
+import tkinter as tk
+root = tk.Tk()
+root.withdraw()
+from ui import IPInfoApp
+IPInfoApp(root)
+root.update_idletasks()
+root.destroy()
+"""
+
+
+def _env():
+    env = dict(os.environ)
+    paths = [ROOT, os.path.join(ROOT, "VLSM")]
+    if env.get("PYTHONPATH"):
+        paths.append(env["PYTHONPATH"])
+    env["PYTHONPATH"] = os.pathsep.join(paths)
+    return env
+
+
+def measure_import(module):
+    """
+    Imports `module` in a fresh interpreter under -X importtime.
+    Returns (cumulative milliseconds, set of all modules imported on the way).
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=_env(), capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr}")
+    cumulative_us = 0
+    imported = set()
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        imported.add(match.group(3))
+        if match.group(3) == module:
+            # nested imports are reported first; the module's own line comes last
+            cumulative_us = int(match.group(2))
+    return cumulative_us / 1000.0, imported
+
+
+def measure_launch():
+    """
+    Wall time in milliseconds to import ui and build IPInfoApp, or None without a display.
+    """
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", _LAUNCH_APP], cwd=ROOT, env=_env(), capture_output=True, text=True)
+    elapsed = (time.perf_counter() - start) * 1000.0
+    if proc.returncode != 0:
+        if "display" in proc.stderr.lower():
+            return None
+        raise RuntimeError(f"launching IPInfoApp failed:\n{proc.stderr}")
+    return elapsed
+
+
+def run(repeat=3):
+    """
+    Returns {name: {"ms": best time, "budget_ms": budget, "heavy": [...], "ok": bool}}.
+    """
+    results = {}
+    for module in ("network", "VLSM", "ui"):
+        best = None
+        heavy = set()
+        for _ in range(repeat):
+            ms, imported = measure_import(module)
+            best = ms if best is None else min(best, ms)
+            heavy |= {name for name in imported if name.split(".")[0] in HEAVY_MODULES}
+        results[module] = {
+            "ms": round(best, 2),
+            "budget_ms": BUDGETS_MS[module],
+            "heavy": sorted(heavy),
+            "ok": best <= BUDGETS_MS[module] and not heavy,
+        }
+    launches = [measure_launch() for _ in range(repeat)]
+    if None not in launches:
+        best = min(launches)
+        results["launch IPInfoApp"] = {
+            "ms": round(best, 2),
+            "budget_ms": BUDGETS_MS["launch IPInfoApp"],
+            "heavy": [],
+            "ok": best <= BUDGETS_MS["launch IPInfoApp"],
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat)
+    for name, result in results.items():
+        status = "ok" if result["ok"] else "OVER BUDGET"
+        extra = f" heavy imports: {', '.join(result['heavy'])}" if result["heavy"] else ""
+        print(f"{name:<18} {result['ms']:8.1f} ms  (budget {result['budget_ms']} ms)  {status}{extra}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(result["ok"] for result in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+Performance benchmark suite with regression thresholds.
+
+Measures lookup latency and bulk throughput against a local ipapi.co stand-in
+(see stand_in.py), safe_json_loads parsing, get_local_ips, map rendering, the
+cost of a metrics phase hook, reverse geocoding throughput and package import
+times. Results are written as JSON; given a baseline (an earlier results file),
+any metric that got worse by more than its tolerance fails the run.
+
+    python benchmarks/suite.py [--json results.json] [--baseline baseline.json] [--update-baseline]
+                               [--tolerance 0.25] [--only NAME ...] [--quick]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.dirname(os.path.abspath(__file__))):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import startup
+from stand_in import StandInServer, payload
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# name: (unit, whether "lower" or "higher" is better, default tolerance as a fraction).
+# Tolerances are wide enough for run-to-run noise on a quiet machine; network and
+# process start-up numbers are noisier than pure CPU work.
+METRICS = {
+    "get_ip_info_p50_ms": ("ms", "lower", 0.5),
+    "get_ip_info_p95_ms": ("ms", "lower", 0.75),
+    "bulk_lookups_per_s": ("lookups/s", "higher", 0.3),
+    "safe_json_loads_us": ("us", "lower", 0.3),
+    "get_local_ips_cold_ms": ("ms", "lower", 1.0),
+    "get_local_ips_us": ("us", "lower", 0.5),
+    "generate_map_first_ms": ("ms", "lower", 0.5),
+    "generate_map_ms": ("ms", "lower", 0.5),
+    "metrics_hook_off_ns": ("ns", "lower", 0.5),
+    "metrics_hook_on_ns": ("ns", "lower", 0.5),
+    "reverse_geocode_per_s": ("coordinates/s", "higher", 0.3),
+    "import_network_ms": ("ms", "lower", 0.5),
+    "import_VLSM_ms": ("ms", "lower", 0.5),
+    "import_ui_ms": ("ms", "lower", 0.5),
+}
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench_lookups(quick=False, latency=0.0, jitter=0.0, error_rate=0.0):
+    """
+    get_ip_info() latency (sequential, one connection per call as in the UI) and
+    get_ip_info_many() throughput, both against the stand-in server.
+    """
+    from network import get_ip_info, get_ip_info_many
+    from scheduler import RequestScheduler
+
+    single, bulk = (50, 300) if quick else (300, 3000)
+    with StandInServer(latency=latency, jitter=jitter, error_rate=error_rate, seed=1) as server:
+        # an unpaced scheduler: the benchmark measures our overhead, not ipapi.co's quota
+        scheduler = RequestScheduler(limits={})
+        get_ip_info("192.0.2.1", scheduler=scheduler, base_url=server.base_url)
+        timings = []
+        for i in range(single):
+            started = time.perf_counter()
+            get_ip_info(f"198.51.{i // 256}.{i % 256}", scheduler=scheduler, base_url=server.base_url)
+            timings.append((time.perf_counter() - started) * 1000.0)
+        ips = [f"10.{i // 65536}.{i // 256 % 256}.{i % 256}" for i in range(bulk)]
+        started = time.perf_counter()
+        for _ in get_ip_info_many(ips, concurrency=16, base_url=server.base_url, scheduler=scheduler):
+            pass
+        elapsed = time.perf_counter() - started
+    return {
+        "get_ip_info_p50_ms": statistics.median(timings),
+        "get_ip_info_p95_ms": _percentile(timings, 0.95),
+        "bulk_lookups_per_s": bulk / elapsed,
+    }
+
+
+def bench_parsing(quick=False, **_):
+    from network import safe_json_loads
+
+    body = json.dumps(payload("203.0.113.7")).encode()
+    number = 5000 if quick else 50000
+    best = min(timeit.repeat(lambda: safe_json_loads(body), number=number, repeat=3))
+    return {"safe_json_loads_us": best / number * 1e6}
+
+
+def bench_local_ips(quick=False, **_):
+    from network import get_local_ips
+
+    started = time.perf_counter()
+    get_local_ips()
+    cold = (time.perf_counter() - started) * 1000.0
+    number = 200 if quick else 2000
+    best = min(timeit.repeat(get_local_ips, number=number, repeat=3))
+    return {"get_local_ips_cold_ms": cold, "get_local_ips_us": best / number * 1e6}
+
+
+def bench_map(quick=False, **_):
+    from map_generator import generate_map
+
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "map.html")
+        started = time.perf_counter()
+        generate_map(-41.2866, 174.7756, output, tooltip="Wellington")
+        first = (time.perf_counter() - started) * 1000.0
+        timings = []
+        for _ in range(2 if quick else 5):
+            started = time.perf_counter()
+            generate_map(-41.2866, 174.7756, output, tooltip="Wellington")
+            timings.append((time.perf_counter() - started) * 1000.0)
+    return {"generate_map_first_ms": first, "generate_map_ms": min(timings)}
+
+
+def bench_metrics(quick=False, **_):
+    """
+    Cost of one metrics.phase() block with instrumentation off (the default on every
+    lookup) and on.
+    """
+    import metrics
+
+    def hook():
+        with metrics.phase("lookup", "dns"):
+            pass
+
+    number = 20000 if quick else 200000
+    previous = metrics.get_metrics()
+    metrics.disable()
+    try:
+        off = min(timeit.repeat(hook, number=number, repeat=3))
+        metrics.enable(metrics.Metrics())
+        on = min(timeit.repeat(hook, number=number, repeat=3))
+    finally:
+        metrics.disable()
+        if previous is not None:
+            metrics.enable(previous)
+    return {"metrics_hook_off_ns": off / number * 1e9, "metrics_hook_on_ns": on / number * 1e9}
+
+
+def bench_reverse_geocode(quick=False, **_):
+    """
+    Batch CityIndex.nearest() throughput over a synthetic 100k-place gazetteer, for
+    coordinates scattered around the places as geolocation results are.
+    """
+    import numpy as np
+    from reverse_geocode import CityIndex
+
+    rng = np.random.default_rng(0)
+    places = 20000 if quick else 100000
+    latitudes, longitudes = rng.uniform(-55, 70, places), rng.uniform(-180, 180, places)
+    index = CityIndex(latitudes, longitudes, np.zeros((places, 5), dtype=np.int32), [""])
+    count = 100000 if quick else 1000000
+    pick = rng.integers(0, places, count)
+    query_lat = np.clip(latitudes[pick] + rng.normal(0, 0.3, count), -90, 90)
+    query_lon = longitudes[pick] + rng.normal(0, 0.3, count)
+    elapsed = min(timeit.repeat(lambda: index.nearest(query_lat, query_lon), number=1, repeat=3))
+    return {"reverse_geocode_per_s": count / elapsed}
+
+
+def bench_imports(quick=False, **_):
+    results = {}
+    for module in ("network", "VLSM", "ui"):
+        results[f"import_{module}_ms"] = min(startup.measure_import(module)[0] for _ in range(1 if quick else 3))
+    return results
+
+
+BENCHMARKS = {
+    "lookups": bench_lookups,
+    "parsing": bench_parsing,
+    "local_ips": bench_local_ips,
+    "map": bench_map,
+    "metrics": bench_metrics,
+    "reverse_geocode": bench_reverse_geocode,
+    "imports": bench_imports,
+}
+
+
+def run(only=None, quick=False, **server_options):
+    """
+    Runs the selected benchmark groups (all by default) and returns a results document.
+    """
+    metrics = {}
+    for name, bench in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        metrics.update({key: round(value, 3) for key, value in bench(quick=quick, **server_options).items()})
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": quick,
+        "metrics": metrics,
+        "units": {name: METRICS[name][0] for name in metrics},
+    }
+
+
+def compare(metrics, baseline, tolerance=None):
+    """
+    Checks `metrics` against `baseline` (both {name: value}). Returns a list of
+    (name, value, baseline value, change as a fraction) for every metric that got
+    worse by more than its tolerance; `tolerance` overrides the per-metric ones.
+    """
+    regressions = []
+    for name, value in metrics.items():
+        reference = baseline.get(name)
+        if not reference or name not in METRICS:
+            continue
+        _, better, default = METRICS[name]
+        allowed = default if tolerance is None else tolerance
+        change = (value - reference) / reference
+        worse = change if better == "lower" else -change
+        if worse > allowed:
+            regressions.append((name, value, reference, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="results file to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="save these results as the baseline")
+    parser.add_argument("--tolerance", type=float, help="allowed degradation for every metric, e.g. 0.25")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmark groups to run")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations (smoke test)")
+    parser.add_argument("--latency", type=float, default=0.0, help="stand-in server latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="stand-in server jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stand-in requests that fail")
+    args = parser.parse_args(argv)
+
+    results = run(args.only, args.quick, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("metrics", {})
+    regressions = {name: change for name, _, _, change in compare(results["metrics"], baseline, args.tolerance)}
+    results["regressions"] = sorted(regressions)
+
+    for name, value in results["metrics"].items():
+        unit = METRICS[name][0]
+        line = f"{name:<24} {value:12.3f} {unit:<10}"
+        if name in baseline:
+            line += f" baseline {baseline[name]:.3f}"
+        if name in regressions:
+            line += f"  REGRESSION ({regressions[name]:+.0%})"
+        print(line)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
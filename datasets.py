@@ -0,0 +1,522 @@
+import csv
+import os
+import re
+import socket
+import sys
+import threading
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from geo_offline import FIELDS, MAGIC as GEO_MAGIC, GeoDatabase, _row_fields, _row_range
+from prefix_trie import MAGIC as PREFIX_MAGIC, PrefixTrie, _parse_prefix, parse_line
+
+# A dataset directory holds full builds named <version><extension> and deltas on top
+# of them named <version>+<n>.delta, applied in order of n, e.g.
+#   2026-10-12.vgeo  2026-10-12+1.delta  2026-10-12+2.delta  2026-10-19.vgeo
+_BASE_FILE = re.compile(r"^(?P<version>[^+]+)(?P<extension>\.vgeo|\.vpfx)$")
+_DELTA_FILE = re.compile(r"^(?P<version>[^+]+)\+(?P<number>\d+)\.delta$")
+_DIGITS = re.compile(r"(\d+)")
+# Delta actions; rows without one are additions, which also replace what they cover
+_REMOVE = ("remove", "delete", "-")
+
+
+def _natural_key(name: str) -> Tuple:
+    return tuple(int(part) if part.isdigit() else part for part in _DIGITS.split(name))
+
+
+def _parse_ip(ip: str) -> Tuple[int, int]:
+    """
+    (version, integer) of an address; raises ValueError for anything else.
+    """
+    try:
+        if ":" in ip:
+            return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip.split("%")[0]), "big")
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except OSError:
+        raise ValueError(f"Invalid IP address: {ip}") from None
+
+
+class _RangeMap:
+    """
+    Sorted, non-overlapping [start, end] -> value ranges; assigning a range replaces
+    whatever part of existing ranges it covers.
+    """
+
+    __slots__ = ("starts", "ends", "values")
+
+    def __init__(self, starts: List[int] = None, ends: List[int] = None, values: List[Any] = None):
+        self.starts = starts or []
+        self.ends = ends or []
+        self.values = values or []
+
+    def copy(self) -> "_RangeMap":
+        return _RangeMap(list(self.starts), list(self.ends), list(self.values))
+
+    def assign(self, start: int, end: int, value: Any) -> None:
+        i = bisect_left(self.ends, start)
+        j = bisect_right(self.starts, end)
+        starts, ends, values = [start], [end], [value]
+        if i < j and self.starts[i] < start:
+            starts.insert(0, self.starts[i])
+            ends.insert(0, start - 1)
+            values.insert(0, self.values[i])
+        if i < j and self.ends[j - 1] > end:
+            starts.append(end + 1)
+            ends.append(self.ends[j - 1])
+            values.append(self.values[j - 1])
+        self.starts[i:j], self.ends[i:j], self.values[i:j] = starts, ends, values
+
+    def find(self, ip: int) -> Tuple[bool, Any]:
+        """
+        (True, value) when a range covers `ip`, else (False, None).
+        """
+        i = bisect_right(self.starts, ip) - 1
+        if i >= 0 and self.ends[i] >= ip:
+            return True, self.values[i]
+        return False, None
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+
+def _geo_record(values: Tuple[str, ...]) -> Dict[str, Any]:
+    record = dict(zip(FIELDS, values))
+    for field in ("latitude", "longitude"):
+        record[field] = float(record[field]) if record[field] else None
+    return record
+
+
+class GeoView:
+    """
+    A GeoDatabase with delta ranges laid over it. Views are immutable: with_delta()
+    returns a new one, so a lookup always sees one consistent version.
+
+    Geo deltas are CSV files with the columns build_database() accepts plus an
+    optional `action` column. Rows are additions by default; an added range
+    replaces everything the base or earlier deltas said about the addresses it
+    covers (which is how a range is changed), and "remove" rows make their range
+    a miss.
+    """
+
+    extension = ".vgeo"
+    magic = GEO_MAGIC
+
+    def __init__(self, base: GeoDatabase, ranges: Optional[Dict[int, _RangeMap]] = None):
+        self.base = base
+        self.ranges = ranges or {4: _RangeMap(), 6: _RangeMap()}
+        self._overlaid = any(self.ranges.values())
+
+    @staticmethod
+    def open(path: str) -> GeoDatabase:
+        return GeoDatabase(path)
+
+    def with_delta(self, path: str) -> "GeoView":
+        ranges = {version: ranges.copy() for version, ranges in self.ranges.items()}
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                version, start, end = _row_range(row)
+                removed = (row.get("action") or "").strip().lower() in _REMOVE
+                ranges[version].assign(start, end, None if removed else _geo_record(_row_fields(row)))
+        return GeoView(self.base, ranges)
+
+    def lookup(self, ip: str) -> Dict[str, Any]:
+        """
+        GeoDatabase.lookup() with the deltas applied.
+        """
+        if not self._overlaid:
+            return self.base.lookup(ip)
+        try:
+            version, value = _parse_ip(ip)
+        except ValueError as e:
+            return {"error": str(e)}
+        covered, record = self.ranges[version].find(value)
+        if not covered:
+            return self.base.lookup(ip)
+        if record is None:
+            return {"error": f"No offline data for {ip}"}
+        data = dict(record)
+        data["ip"] = data["public_ip"] = ip
+        data["version"] = f"IPv{version}"
+        return data
+
+    def lookup_many(self, ips: Iterable[str]):
+        for ip in ips:
+            yield ip, self.lookup(ip)
+
+    def delta_size(self) -> int:
+        return sum(len(ranges) for ranges in self.ranges.values())
+
+
+class PrefixView:
+    """
+    A PrefixTrie with delta routes laid over it; immutable like GeoView.
+
+    Prefix deltas use the routing-table line formats of prefix_trie.parse_line().
+    A line starting with "-" withdraws its prefix, any other line (optionally
+    starting with "+") announces or replaces one. Longest-prefix matching runs
+    over the base and delta routes together, so withdrawing a prefix exposes the
+    next less specific one.
+    """
+
+    extension = ".vpfx"
+    magic = PREFIX_MAGIC
+
+    def __init__(self, base: PrefixTrie, routes: Optional[Dict[int, Dict[Tuple[int, int], Any]]] = None):
+        self.base = base
+        self.routes = routes or {4: {}, 6: {}}
+        # prefix lengths present in the delta, longest first
+        self._lengths = {version: sorted({plen for _, plen in routes}, reverse=True)
+                         for version, routes in self.routes.items()}
+        self._overlaid = any(self.routes.values())
+
+    @staticmethod
+    def open(path: str) -> PrefixTrie:
+        return PrefixTrie(path)
+
+    def with_delta(self, path: str) -> "PrefixView":
+        routes = {version: dict(routes) for version, routes in self.routes.items()}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                withdrawn = line.startswith("-")
+                if line[:1] in "+-":
+                    line = line[1:]
+                if withdrawn:
+                    version, network, plen = _parse_prefix(line.split(None, 1)[0].split(",")[0])
+                    routes[version][network, plen] = None
+                    continue
+                parsed = parse_line(line)
+                if parsed is None:
+                    continue
+                prefix, asn, org = parsed
+                version, network, plen = _parse_prefix(prefix)
+                family = socket.AF_INET if version == 4 else socket.AF_INET6
+                address = socket.inet_ntop(family, network.to_bytes(4 if version == 4 else 16, "big"))
+                routes[version][network, plen] = {"network": f"{address}/{plen}", "asn": f"AS{asn}", "org": org}
+        return PrefixView(self.base, routes)
+
+    def lookup(self, ip: str) -> Dict[str, Any]:
+        """
+        PrefixTrie.lookup() with the deltas applied.
+        """
+        if not self._overlaid:
+            return self.base.lookup(ip)
+        try:
+            version, value = _parse_ip(ip)
+        except ValueError as e:
+            return {"error": str(e)}
+        routes = self.routes[version]
+        best_length, best = -1, None
+        for network, plen, node in reversed(self.base.covering(value, version)):
+            if (network, plen) not in routes:  # withdrawn or replaced by the delta
+                best_length, best = plen, self.base._route(node, version)
+                break
+        width = 32 if version == 4 else 128
+        for plen in self._lengths[version]:
+            if plen <= best_length:
+                break
+            route = routes.get((value >> (width - plen) << (width - plen), plen))
+            if route is not None:
+                best = route
+                break
+        if best is None:
+            return {"error": f"No announced prefix covers {ip}"}
+        return dict(best)
+
+    def lookup_many(self, ips: Iterable[str]):
+        for ip in ips:
+            yield ip, self.lookup(ip)
+
+    def annotate(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        PrefixTrie.annotate() with the deltas applied.
+        """
+        ip = data.get("public_ip") or data.get("ip")
+        if not ip or ip == "N/A":
+            return data
+        route = self.lookup(ip)
+        if "error" not in route:
+            data["asn"] = route["asn"]
+            data["network"] = route["network"]
+            if route["org"]:
+                data["org"] = route["org"]
+        return data
+
+    def delta_size(self) -> int:
+        return sum(len(routes) for routes in self.routes.values())
+
+
+VIEWS = {view.extension: view for view in (GeoView, PrefixView)}
+
+
+class _Version:
+    __slots__ = ("name", "base_name", "deltas", "view", "base", "leases", "retired")
+
+    def __init__(self, name: str, base_name: str, deltas: Tuple[str, ...], view: Any, base: "_Base"):
+        self.name = name
+        self.base_name = base_name
+        self.deltas = deltas
+        self.view = view
+        self.base = base
+        self.leases = 0
+        self.retired = False
+
+
+class _Base:
+    """
+    An open base file and the number of versions built on it.
+    """
+
+    __slots__ = ("database", "versions")
+
+    def __init__(self, database: Any):
+        self.database = database
+        self.versions = 0
+
+
+class Dataset:
+    """
+    The current version of a directory of versioned dataset files (geo_offline
+    .vgeo builds or prefix_trie .vpfx builds, plus deltas), swapped for newer ones
+    as they appear without interrupting lookups.
+
+    Every lookup leases the version that is current when it starts and returns it
+    when done. A reload maps and prepares the new version completely before
+    publishing it with one reference swap, so lookups never wait for it and never
+    see a mix of versions; the replaced version's file is closed once its last
+    lease is returned. New delta files are applied on top of the version in use
+    (the base file stays mapped), a new full build replaces everything.
+
+    A watcher thread checks the directory every `interval` seconds (0 disables it;
+    reload() checks on demand). Files must appear atomically, as build_database()
+    and build_trie() write them. Reload failures are printed to stderr and leave
+    the current version in place.
+
+    Works as `offline=` for network.get_ip_info() and get_ip_info_many(), and
+    (for prefix tables) as `prefixes=` for enrich.enrich().
+    """
+
+    def __init__(self, directory: str, interval: float = 30.0):
+        self.directory = directory
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._callbacks: List[Callable[[Dict[str, Any]], None]] = []
+        self._current: Optional[_Version] = None
+        self._stop = threading.Event()
+        self.reload(raise_errors=True)
+        self._thread = None
+        if interval > 0:
+            self._thread = threading.Thread(target=self._watch, name="dataset-watch", daemon=True)
+            self._thread.start()
+
+    @property
+    def version(self) -> str:
+        """
+        "<base version>" or "<base version>+<last delta>" of the current version.
+        """
+        return self._current.name
+
+    @property
+    def extension(self) -> str:
+        """
+        ".vgeo" or ".vpfx": which kind of builds the directory holds.
+        """
+        return type(self._current.view).extension
+
+    def add_callback(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        """
+        Registers a function called with {"directory", "version", "previous"} after each swap.
+        """
+        self._callbacks.append(callback)
+
+    def _scan(self) -> Tuple[str, str, Tuple[str, ...]]:
+        bases = {}
+        deltas = {}
+        for name in os.listdir(self.directory):
+            match = _BASE_FILE.match(name)
+            if match:
+                bases[match.group("version")] = name
+                continue
+            match = _DELTA_FILE.match(name)
+            if match:
+                deltas.setdefault(match.group("version"), []).append((int(match.group("number")), name))
+        if not bases:
+            raise FileNotFoundError(f"No .vgeo or .vpfx dataset in {self.directory}")
+        latest = max(bases, key=_natural_key)
+        return latest, bases[latest], tuple(name for _, name in sorted(deltas.get(latest, ())))
+
+    def reload(self, raise_errors: bool = False) -> bool:
+        """
+        Swaps in a newer version if the directory has one. Returns True if it did.
+        """
+        with self._reload_lock:
+            try:
+                return self._reload()
+            except Exception as e:
+                if raise_errors:
+                    raise
+                print(f"Dataset reload error ({self.directory}):", e, file=sys.stderr)
+                return False
+
+    def _reload(self) -> bool:
+        base_name, base_file, deltas = self._scan()
+        current = self._current
+        if current is not None and (current.base_name, current.deltas) == (base_name, deltas):
+            return False
+        if current is not None and current.base_name == base_name and deltas[:len(current.deltas)] == current.deltas:
+            base, view, pending = current.base, current.view, deltas[len(current.deltas):]
+        else:
+            extension = _BASE_FILE.match(base_file).group("extension")
+            if current is not None and extension != self.extension:
+                raise ValueError(f"{base_file} is not a {self.extension} build like the versions before it")
+            database = VIEWS[extension].open(os.path.join(self.directory, base_file))
+            base, view, pending = _Base(database), VIEWS[extension](database), deltas
+        try:
+            for delta in pending:
+                view = view.with_delta(os.path.join(self.directory, delta))
+        except Exception:
+            if base is not (current and current.base):
+                base.database.close()
+            raise
+        name = base_name + (f"+{_DELTA_FILE.match(deltas[-1]).group('number')}" if deltas else "")
+        self._publish(_Version(name, base_name, deltas, view, base))
+        return True
+
+    def _publish(self, version: _Version) -> None:
+        with self._lock:
+            version.base.versions += 1
+            previous, self._current = self._current, version
+            if previous is not None:
+                previous.retired = True
+        if previous is not None:
+            self._dispose(previous)
+            event = {"directory": self.directory, "version": version.name, "previous": previous.name}
+            for callback in list(self._callbacks):
+                try:
+                    callback(event)
+                except Exception as e:
+                    print("Dataset callback error:", e, file=sys.stderr)
+
+    def _dispose(self, version: _Version) -> None:
+        """
+        Closes a retired version's base file once no lease or later version uses it.
+        """
+        with self._lock:
+            if not version.retired or version.leases or version.base is None:
+                return
+            base, version.base = version.base, None
+            base.versions -= 1
+            if base.versions:
+                return
+        base.database.close()
+
+    def _acquire(self) -> _Version:
+        with self._lock:
+            version = self._current
+            version.leases += 1
+            return version
+
+    def _release(self, version: _Version) -> None:
+        with self._lock:
+            version.leases -= 1
+            retired = version.retired and not version.leases
+        if retired:
+            self._dispose(version)
+
+    @contextmanager
+    def snapshot(self) -> Iterator[Any]:
+        """
+        Leases the current version's view (GeoView or PrefixView) for a block of
+        lookups that must all see the same version.
+        """
+        version = self._acquire()
+        try:
+            yield version.view
+        finally:
+            self._release(version)
+
+    def lookup(self, ip: str) -> Dict[str, Any]:
+        version = self._acquire()
+        try:
+            return version.view.lookup(ip)
+        finally:
+            self._release(version)
+
+    def lookup_many(self, ips: Iterable[str]):
+        """
+        Looks addresses up one lease at a time, so a long batch moves on to new
+        versions as they are published; use snapshot() to pin one version instead.
+        """
+        for ip in ips:
+            yield ip, self.lookup(ip)
+
+    def annotate(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        version = self._acquire()
+        try:
+            return version.view.annotate(data)
+        finally:
+            self._release(version)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.reload()
+
+    def close(self) -> None:
+        """
+        Stops the watcher and closes the current version once its leases are returned.
+        """
+        self._stop.set()
+        with self._reload_lock:
+            with self._lock:
+                version = self._current
+                if version is not None:
+                    version.retired = True
+            if version is not None:
+                self._dispose(version)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_dataset(path: str, interval: float = 30.0, extension: Optional[str] = None) -> Any:
+    """
+    A hot-reloading Dataset for a directory, otherwise the GeoDatabase or PrefixTrie
+    for a single built file (told apart by the file's magic, not its name).
+    With `extension` (".vgeo" or ".vpfx") any other kind of dataset is rejected
+    with ValueError.
+    """
+    if os.path.isdir(path):
+        dataset = Dataset(path, interval)
+        if extension is not None and dataset.extension != extension:
+            dataset.close()
+            raise ValueError(f"{path} holds {dataset.extension} builds, not {extension}")
+        return dataset
+    with open(path, "rb") as f:
+        magic = f.read(len(GEO_MAGIC))
+    views = [view for view in VIEWS.values() if view.magic == magic]
+    if not views:
+        raise ValueError(f"{path} is not a .vgeo or .vpfx build")
+    if extension is not None and views[0].extension != extension:
+        raise ValueError(f"{path} is a {views[0].extension} build, not {extension}")
+    return views[0].open(path)
+
+
+if __name__ == "__main__":
+    import argparse
+    import pprint
+
+    parser = argparse.ArgumentParser(description="Inspect or query a versioned dataset directory.")
+    parser.add_argument("directory")
+    parser.add_argument("ips", nargs="*", help="addresses to look up in the current version")
+    args = parser.parse_args()
+
+    with Dataset(args.directory, interval=0) as dataset:
+        with dataset.snapshot() as view:
+            print(f"{dataset.version}: {view.delta_size()} delta entries over {view.base.path}")
+            for ip, data in view.lookup_many(args.ips):
+                pprint.pprint(data)
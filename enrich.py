@@ -0,0 +1,227 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import re
+import socket
+import sys
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from network import RECORD_FIELDS, get_ip_info_many, to_record
+
+if TYPE_CHECKING:
+    from prefix_trie import PrefixTrie
+
+# Candidate address tokens inside a log line; each candidate is validated with inet_pton
+_IPV4_TOKEN = re.compile(r"(?<![\d.])(?:\d{1,3}\.){3}\d{1,3}(?![\d.])")
+_IPV6_TOKEN = re.compile(r"(?<![0-9A-Fa-f:])(?:[0-9A-Fa-f]{0,4}:){2,7}[0-9A-Fa-f.]{0,15}(?![0-9A-Fa-f:])")
+
+
+def _valid_ip(token: str) -> bool:
+    try:
+        socket.inet_pton(socket.AF_INET6 if ":" in token else socket.AF_INET, token)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def extract_ip(line: str) -> Optional[str]:
+    """
+    Returns the client address of one input line, or None.
+    Handles plain address lists and Common/Combined access logs (client address
+    first), and otherwise falls back to the first valid address found in the line.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    first = line.split(None, 1)[0].strip("[]\",")
+    if _valid_ip(first):
+        return first
+    for pattern in (_IPV4_TOKEN, _IPV6_TOKEN):
+        for match in pattern.finditer(line):
+            if _valid_ip(match.group()):
+                return match.group()
+    return None
+
+
+def open_input(path: str) -> TextIO:
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", errors="replace")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, encoding="utf-8", errors="replace")
+
+
+class Progress:
+    """
+    Pipeline counters, with a throughput line on stderr every `interval` seconds.
+    """
+
+    def __init__(self, interval: float = 5.0, stream: TextIO = sys.stderr):
+        self.interval = interval
+        self.stream = stream
+        self.lines = 0
+        self.addresses = 0
+        self.duplicates = 0
+        self.written = 0
+        self.errors = 0
+        self.started = time.monotonic()
+        self._next_report = self.started + interval
+
+    def tick(self) -> None:
+        if self.interval > 0 and time.monotonic() >= self._next_report:
+            self._next_report = time.monotonic() + self.interval
+            self.report()
+
+    def report(self, final: bool = False) -> None:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        prefix = "done" if final else "progress"
+        print(
+            f"{prefix}: {self.lines} lines, {self.addresses} addresses, {self.duplicates} duplicates, "
+            f"{self.written} written, {self.errors} errors in {elapsed:.1f}s "
+            f"({self.lines / elapsed:,.0f} lines/s, {self.written / elapsed:,.0f} records/s)",
+            file=self.stream,
+        )
+
+
+def iter_addresses(paths: Iterable[str], progress: Progress) -> Iterator[str]:
+    for path in paths:
+        with open_input(path) as f:
+            for line in f:
+                progress.lines += 1
+                ip = extract_ip(line)
+                if ip is not None:
+                    progress.addresses += 1
+                    yield ip
+                progress.tick()
+
+
+def dedupe_window(ips: Iterable[str], window: int, progress: Progress) -> Iterator[str]:
+    """
+    Drops addresses already seen among the last `window` distinct ones (LRU), so
+    memory stays bounded however long the input is.
+    """
+    seen: "OrderedDict[str, None]" = OrderedDict()
+    for ip in ips:
+        if ip in seen:
+            seen.move_to_end(ip)
+            progress.duplicates += 1
+            continue
+        seen[ip] = None
+        if len(seen) > window:
+            seen.popitem(last=False)
+        yield ip
+
+
+def enrich(ips: Iterable[str], prefixes: Optional["PrefixTrie"] = None, **lookup_options) -> Iterator[Dict[str, Any]]:
+    """
+    Looks addresses up through network.get_ip_info_many() and yields records in the
+    RECORD_FIELDS schema. Failed lookups carry an extra "error" key. With a
+    prefix_trie.PrefixTrie, "asn" and "org" come from that routing table instead.
+    """
+    for ip, data in get_ip_info_many(ips, ordered=False, **lookup_options):
+        if prefixes is not None and "error" not in data:
+            prefixes.annotate(data)
+        record = to_record(data)
+        record["public_ip"] = ip
+        if "error" in data:
+            record["error"] = data["error"]
+        yield record
+
+
+class JSONLWriter:
+    def __init__(self, out: TextIO):
+        self.out = out
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self.out.write(json.dumps(record, ensure_ascii=False))
+        self.out.write("\n")
+
+
+class CSVWriter:
+    def __init__(self, out: TextIO):
+        self.writer = csv.DictWriter(out, fieldnames=list(RECORD_FIELDS), extrasaction="ignore")
+        self.writer.writeheader()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self.writer.writerow(record)
+
+
+def run(paths: List[str], out: TextIO, fmt: str = "jsonl", window: int = 100_000,
+        progress: Optional[Progress] = None, **lookup_options) -> Progress:
+    """
+    Streams `paths` (or "-" for stdin) through parse -> dedupe -> lookup -> write.
+    """
+    progress = progress or Progress(interval=0)
+    writer = CSVWriter(out) if fmt == "csv" else JSONLWriter(out)
+    ips = dedupe_window(iter_addresses(paths, progress), window, progress)
+    for record in enrich(ips, **lookup_options):
+        writer.write(record)
+        progress.written += 1
+        if "error" in record:
+            progress.errors += 1
+        progress.tick()
+    return progress
+
+
+def _parse_args(argv: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Enrich IP addresses from stdin, address lists or access logs with geolocation data."
+    )
+    parser.add_argument("inputs", nargs="*", default=["-"], help="input files ('-' or none for stdin, .gz allowed)")
+    parser.add_argument("-o", "--output", default="-", help="output file (default: stdout)")
+    parser.add_argument("-f", "--format", choices=("jsonl", "csv"), default="jsonl")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="parallel lookups (default: 8)")
+    parser.add_argument("--window", type=int, default=100_000, help="dedupe window in distinct addresses")
+    parser.add_argument("--offline", metavar="DB",
+                        help="answer from a geo_offline database (or a datasets directory) instead of ipapi.co")
+    parser.add_argument("--cache", metavar="PATH", help="persistent lookup cache file (see ip_cache)")
+    parser.add_argument("--providers", action="store_true",
+                        help="hedge lookups across several providers instead of ipapi.co alone")
+    parser.add_argument("--prefixes", metavar="TABLE",
+                        help="take asn/org from a prefix_trie routing table (or a datasets directory)")
+    parser.add_argument("--progress", type=float, default=5.0, metavar="SECONDS",
+                        help="progress report interval on stderr, 0 to disable")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _parse_args(argv)
+    lookup_options: Dict[str, Any] = {"concurrency": args.concurrency}
+    if args.offline or args.prefixes:
+        from datasets import open_dataset
+    if args.offline:
+        lookup_options["offline"] = open_dataset(args.offline, extension=".vgeo")
+    if args.cache:
+        from ip_cache import IPInfoCache
+        lookup_options["cache"] = IPInfoCache(args.cache)
+    if args.prefixes:
+        lookup_options["prefixes"] = open_dataset(args.prefixes, extension=".vpfx")
+    if args.providers:
+        from providers import HedgedResolver
+        lookup_options["resolver"] = HedgedResolver()
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    progress = Progress(interval=args.progress)
+    try:
+        run(args.inputs, out, fmt=args.format, window=args.window, progress=progress, **lookup_options)
+    except KeyboardInterrupt:
+        print("interrupted", file=sys.stderr)
+        return 130
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if "cache" in lookup_options:
+            lookup_options["cache"].close()
+        if "resolver" in lookup_options:
+            lookup_options["resolver"].close()
+        if args.progress > 0:
+            progress.report(final=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
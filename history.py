@@ -0,0 +1,196 @@
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from network import RECORD_FIELDS
+from records import IPRecord
+
+# Columns of one history row: when, the RECORD_FIELDS schema, and what the record is indexed by
+COLUMNS = ("timestamp",) + RECORD_FIELDS + ("country_code", "error")
+
+
+def default_history_path() -> str:
+    """
+    Location of the lookup history: $XDG_DATA_HOME/vlsm/history.sqlite3
+    (falling back to ~/.local/share).
+    """
+    base = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, "vlsm", "history.sqlite3")
+
+
+def _row(data: Any, timestamp: Optional[float]) -> Tuple:
+    """
+    One history row from a get_ip_info()/discover() result, a RECORD_FIELDS record
+    or an IPRecord (such as the rows of an IPRecordBatch).
+    """
+    if isinstance(data, IPRecord):
+        record = data
+    else:
+        record = IPRecord.from_dict(data)
+        if timestamp is None:
+            timestamp = data.get("timestamp")
+    fields = record.as_record()
+    fields["latitude"] = record.latitude
+    fields["longitude"] = record.longitude
+    return (
+        (float(timestamp or time.time()),)
+        + tuple(fields[field] for field in RECORD_FIELDS)
+        + (record.country_code, record.error)
+    )
+
+
+class HistoryStore:
+    """
+    Append-only log of lookups in a SQLite database (WAL mode).
+
+    Every record is stored with its timestamp and indexed by IP, ASN and country
+    (each together with time) and by time alone, so range queries filtered on any
+    of them are index scans. Queries and exports stream rows from their own
+    connection, so reading a large window neither loads it into memory nor blocks
+    writers. append_many() writes in large transactions for bulk imports.
+    Without a `path` the history lives in memory only.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False, isolation_level=None)
+        if path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        # bulk inserts touch four index b-trees; a bigger page cache keeps them off the disk
+        self._db.execute("PRAGMA cache_size=-65536")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS lookups ("
+            "id INTEGER PRIMARY KEY, timestamp REAL NOT NULL, local_ipv4 TEXT, local_ipv6 TEXT, public_ip TEXT, "
+            "version TEXT, city TEXT, region TEXT, country TEXT, latitude REAL, longitude REAL, timezone TEXT, "
+            "org TEXT, asn TEXT, country_code TEXT, error TEXT)"
+        )
+        for column in ("timestamp", "public_ip, timestamp", "asn, timestamp", "country_code, timestamp"):
+            name = "lookups_" + column.split(",")[0]
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS {name} ON lookups ({column})")
+
+    def append(self, data: Dict[str, Any], timestamp: Optional[float] = None) -> None:
+        """
+        Records one lookup result (stamped now unless `timestamp` or data["timestamp"] is given).
+        """
+        self.append_many([data], timestamp)
+
+    def append_many(self, items: Iterable[Dict[str, Any]], timestamp: Optional[float] = None,
+                    batch_size: int = 50_000) -> int:
+        """
+        Records many results, `batch_size` rows per transaction. Returns the number written.
+        """
+        insert = f"INSERT INTO lookups ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        written = 0
+        batch: List[Tuple] = []
+        for data in items:
+            batch.append(_row(data, timestamp))
+            if len(batch) >= batch_size:
+                written += self._write(insert, batch)
+                batch = []
+        if batch:
+            written += self._write(insert, batch)
+        return written
+
+    def _write(self, insert: str, rows: List[Tuple]) -> int:
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(insert, rows)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return len(rows)
+
+    @staticmethod
+    def _where(start: Optional[float], end: Optional[float], ip: Optional[str], asn: Optional[str],
+               country: Optional[str]) -> Tuple[str, List[Any]]:
+        clauses, params = [], []
+        for column, value in (("public_ip", ip), ("asn", asn), ("country_code", country)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("timestamp < ?")
+            params.append(end)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _reader(self) -> sqlite3.Connection:
+        if self.path:
+            return sqlite3.connect(self.path, check_same_thread=False)
+        return self._db
+
+    def query(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        ip: Optional[str] = None,
+        asn: Optional[str] = None,
+        country: Optional[str] = None,
+        limit: Optional[int] = None,
+        newest_first: bool = False,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Streams records with start <= timestamp < end, optionally for one IP, ASN
+        (e.g. "AS15169") or country code, in time order.
+        """
+        where, params = self._where(start, end, ip, asn, country)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM lookups{where} ORDER BY timestamp {'DESC' if newest_first else 'ASC'}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        reader = self._reader()
+        try:
+            cursor = reader.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    return
+                for row in rows:
+                    yield dict(zip(COLUMNS, row))
+        finally:
+            if reader is not self._db:
+                reader.close()
+
+    def count(self, start: Optional[float] = None, end: Optional[float] = None, ip: Optional[str] = None,
+              asn: Optional[str] = None, country: Optional[str] = None) -> int:
+        where, params = self._where(start, end, ip, asn, country)
+        with self._lock:
+            (count,) = self._db.execute(f"SELECT COUNT(*) FROM lookups{where}", params).fetchone()
+        return count
+
+    def export(self, out: TextIO, fmt: str = "csv", **filters) -> int:
+        """
+        Writes the records matching `filters` (see query()) to `out` as CSV or JSON
+        Lines, one row at a time. Returns the number of rows written.
+        """
+        if fmt not in ("csv", "jsonl"):
+            raise ValueError(f"unknown export format: {fmt}")
+        written = 0
+        if fmt == "csv":
+            writer = csv.writer(out)
+            writer.writerow(COLUMNS)
+            for record in self.query(**filters):
+                writer.writerow([record[column] for column in COLUMNS])
+                written += 1
+        else:
+            for record in self.query(**filters):
+                out.write(json.dumps(record, ensure_ascii=False))
+                out.write("\n")
+                written += 1
+        return written
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,186 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import metrics
+
+DEFAULT_TTL = 24 * 3600
+DEFAULT_NEGATIVE_TTL = 5 * 60
+
+
+def default_cache_path() -> str:
+    """
+    Location of the on-disk lookup cache: $XDG_CACHE_HOME/vlsm/ipinfo.sqlite3
+    (falling back to ~/.cache).
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "vlsm", "ipinfo.sqlite3")
+
+
+class IPInfoCache:
+    """
+    Two-level cache for get_ip_info() results.
+
+    Level one is an in-memory LRU of at most `max_entries` items. Level two is an
+    optional SQLite file at `path` that survives restarts and is trimmed to
+    `max_disk_entries` by least-recent access. Every entry carries its own expiry;
+    {"error": ...} results are kept only for `negative_ttl` seconds so that a
+    provider hiccup is not remembered for a whole day.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = 10_000,
+        max_disk_entries: int = 1_000_000,
+        ttl: float = DEFAULT_TTL,
+        negative_ttl: float = DEFAULT_NEGATIVE_TTL,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._puts_since_trim = 0
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, expires REAL NOT NULL, accessed REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def get(self, key: str, memory_only: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Returns a copy of the cached result for `key`, or None when absent or expired.
+        With `memory_only` the SQLite level is not read (and a miss is not counted),
+        for callers such as an event loop that must not wait on disk I/O.
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires, data = entry
+                if expires > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    metrics.cache_result("ip_cache", "memory")
+                    return dict(data)
+                del self._memory[key]
+            if memory_only:
+                return None
+            if self._db is not None:
+                row = self._db.execute("SELECT expires, value FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    expires, value = row
+                    if expires > now:
+                        data = json.loads(value)
+                        self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+                        self._remember(key, expires, data)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        metrics.cache_result("ip_cache", "disk")
+                        return dict(data)
+                    self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.misses += 1
+            metrics.cache_result("ip_cache", "miss")
+            return None
+
+    def put(self, key: str, data: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        """
+        Stores `data` under `key`. Error results never outlive the short negative TTL.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        if "error" in data:
+            ttl = min(ttl, self.negative_ttl)
+        if ttl <= 0:
+            return
+        now = self._clock()
+        expires = now + ttl
+        data = dict(data)
+        with self._lock:
+            self._remember(key, expires, data)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (key, expires, accessed, value) VALUES (?, ?, ?, ?)",
+                    (key, expires, now, json.dumps(data)),
+                )
+                self._puts_since_trim += 1
+                if self._puts_since_trim >= 1000:
+                    self._trim_disk()
+
+    def get_or_fetch(self, key: str, fetch: Callable[[], Dict[str, Any]], ttl: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Returns the cached result for `key`, calling `fetch()` and caching its result on a miss.
+        A "throttled" result (no request was sent) is returned but not cached.
+        """
+        data = self.get(key)
+        if data is None:
+            data = fetch()
+            if not data.get("throttled"):
+                self.put(key, data, ttl)
+        return data
+
+    def _remember(self, key: str, expires: float, data: Dict[str, Any]) -> None:
+        self._memory[key] = (expires, data)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _trim_disk(self) -> None:
+        self._puts_since_trim = 0
+        now = self._clock()
+        self._db.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()
+        excess = count - self.max_disk_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed LIMIT ?)", (excess,)
+            )
+            self.evictions += excess
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM entries")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._trim_disk()
+                self._db.close()
+                self._db = None
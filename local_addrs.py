@@ -0,0 +1,274 @@
+import errno
+import os
+import socket
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# rtnetlink constants (linux/netlink.h, linux/rtnetlink.h, linux/if_addr.h)
+_NETLINK_ROUTE = 0
+_NLMSG_ERROR = 2
+_NLMSG_DONE = 3
+_RTM_NEWADDR = 20
+_RTM_GETADDR = 22
+_NLM_F_REQUEST = 0x1
+_NLM_F_DUMP = 0x300
+_IFA_ADDRESS = 1
+_IFA_LOCAL = 2
+_IFA_LABEL = 3
+_IFA_FLAGS = 8
+_RTMGRP_LINK = 0x1
+_RTMGRP_IPV4_IFADDR = 0x10
+_RTMGRP_IPV6_IFADDR = 0x100
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_IFADDRMSG = struct.Struct("=BBBBI")
+_RTATTR = struct.Struct("=HH")
+
+_SCOPES = {0: "global", 200: "site", 253: "link", 254: "host"}
+_FLAGS = {0x01: "temporary", 0x20: "deprecated", 0x40: "tentative", 0x80: "permanent"}
+
+
+def _align4(n: int) -> int:
+    return (n + 3) & ~3
+
+
+def _address_entry(family: int, raw: bytes, prefixlen: int, scope: int, flags: int, ifname: str) -> Dict[str, Any]:
+    address = socket.inet_ntop(family, raw)
+    scope_name = _SCOPES.get(scope, str(scope))
+    if family == socket.AF_INET6 and scope_name == "link":
+        # link-local addresses are only meaningful together with their zone
+        address = f"{address}%{ifname}"
+    return {
+        "family": "IPv4" if family == socket.AF_INET else "IPv6",
+        "address": address,
+        "prefixlen": prefixlen,
+        "interface": ifname,
+        "scope": scope_name,
+        "flags": [name for bit, name in _FLAGS.items() if flags & bit],
+    }
+
+
+def _ifname(index: int) -> str:
+    try:
+        return socket.if_indextoname(index)
+    except OSError:
+        return str(index)
+
+
+def _netlink_dump() -> List[Dict[str, Any]]:
+    """
+    Lists every interface address with one RTM_GETADDR dump over rtnetlink.
+    """
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, _NETLINK_ROUTE) as sock:
+        sock.bind((0, 0))
+        seq = int(time.time()) & 0xFFFFFFFF
+        request = _IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        header = _NLMSGHDR.pack(_NLMSGHDR.size + len(request), _RTM_GETADDR, _NLM_F_REQUEST | _NLM_F_DUMP, seq, 0)
+        sock.sendall(header + request)
+
+        entries = []
+        while True:
+            data = sock.recv(65536)
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                length, msg_type, _, msg_seq, _ = _NLMSGHDR.unpack_from(data, offset)
+                if length < _NLMSGHDR.size:
+                    return entries
+                if msg_seq == seq:
+                    if msg_type == _NLMSG_DONE:
+                        return entries
+                    if msg_type == _NLMSG_ERROR:
+                        (code,) = struct.unpack_from("=i", data, offset + _NLMSGHDR.size)
+                        raise OSError(-code, os.strerror(-code))
+                    if msg_type == _RTM_NEWADDR:
+                        entry = _parse_newaddr(data, offset + _NLMSGHDR.size, offset + length)
+                        if entry is not None:
+                            entries.append(entry)
+                offset += _align4(length)
+
+
+def _parse_newaddr(data: bytes, start: int, end: int) -> Optional[Dict[str, Any]]:
+    family, prefixlen, flags, scope, index = _IFADDRMSG.unpack_from(data, start)
+    if family not in (socket.AF_INET, socket.AF_INET6):
+        return None
+    attrs = {}
+    offset = start + _IFADDRMSG.size
+    while offset + _RTATTR.size <= end:
+        length, attr_type = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        attrs[attr_type] = data[offset + _RTATTR.size:offset + length]
+        offset += _align4(length)
+    # IFA_LOCAL is the interface's own address; IFA_ADDRESS is the peer on point-to-point links
+    raw = attrs.get(_IFA_LOCAL) or attrs.get(_IFA_ADDRESS)
+    if raw is None:
+        return None
+    if _IFA_FLAGS in attrs:
+        (flags,) = struct.unpack("=I", attrs[_IFA_FLAGS][:4])
+    label = attrs.get(_IFA_LABEL)
+    ifname = label.rstrip(b"\0").decode(errors="replace") if label else _ifname(index)
+    return _address_entry(family, raw, prefixlen, scope, flags, ifname)
+
+
+def _proc_if_inet6() -> List[Dict[str, Any]]:
+    """
+    IPv6 addresses from /proc/net/if_inet6 (used when rtnetlink is unavailable).
+    """
+    entries = []
+    with open("/proc/net/if_inet6") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 6:
+                continue
+            raw = bytes.fromhex(parts[0])
+            scope = int(parts[3], 16)
+            # /proc reports IPV6_ADDR_* scope bits rather than rtnetlink scopes
+            scope = {0x00: 0, 0x10: 254, 0x20: 253, 0x40: 200}.get(scope, scope)
+            entries.append(_address_entry(socket.AF_INET6, raw, int(parts[2], 16), scope, int(parts[4], 16), parts[5]))
+    return entries
+
+
+def _resolver_addresses() -> List[Dict[str, Any]]:
+    """
+    Last-resort, portable listing: whatever the host name resolves to locally.
+    """
+    entries = []
+    seen = set()
+    try:
+        infos = socket.getaddrinfo(socket.gethostname(), None, proto=socket.IPPROTO_TCP)
+    except OSError:
+        return entries
+    for family, _, _, _, sockaddr in infos:
+        address = sockaddr[0]
+        if address in seen or family not in (socket.AF_INET, socket.AF_INET6):
+            continue
+        seen.add(address)
+        raw = socket.inet_pton(family, address.split("%")[0])
+        loopback = address.startswith("127.") or address == "::1"
+        entries.append(_address_entry(family, raw, 32 if family == socket.AF_INET else 128,
+                                      254 if loopback else 0, 0, ""))
+    return entries
+
+
+class LocalAddressProvider:
+    """
+    Cached list of every local interface address, read straight from the kernel.
+
+    The list comes from one rtnetlink RTM_GETADDR dump, so no route or outbound
+    socket is needed. A second netlink socket subscribed to address and link
+    change notifications is polled without blocking on each call; the cache is
+    rebuilt only when the kernel reports a change. Where rtnetlink is unavailable
+    (or the change socket fails) the provider falls back to /proc/net/if_inet6
+    (IPv6) or the resolver and simply re-reads after `ttl` seconds.
+    """
+
+    def __init__(self, ttl: float = 5.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Optional[List[Dict[str, Any]]] = None
+        self._loaded_at = 0.0
+        self._monitor = self._open_monitor()
+
+    @staticmethod
+    def _open_monitor() -> Optional[socket.socket]:
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, _NETLINK_ROUTE)
+            sock.bind((0, _RTMGRP_LINK | _RTMGRP_IPV4_IFADDR | _RTMGRP_IPV6_IFADDR))
+            sock.setblocking(False)
+            return sock
+        except (AttributeError, OSError):
+            return None
+
+    def _changed(self) -> bool:
+        if self._monitor is None:
+            return time.monotonic() - self._loaded_at > self.ttl
+        changed = False
+        while True:
+            try:
+                if not self._monitor.recv(65536):
+                    return changed
+                changed = True
+            except BlockingIOError:
+                return changed
+            except OSError as e:
+                if e.errno == errno.ENOBUFS:
+                    # events were dropped after a burst: something changed, re-read
+                    changed = True
+                    continue
+                # the socket itself failed: stop listening and re-read every `ttl` seconds
+                self.close()
+                return True
+
+    @staticmethod
+    def _load() -> List[Dict[str, Any]]:
+        try:
+            return _netlink_dump()
+        except (AttributeError, OSError):
+            pass
+        resolved = _resolver_addresses()
+        try:
+            ipv6 = _proc_if_inet6()
+        except OSError:
+            return resolved
+        return [entry for entry in resolved if entry["family"] == "IPv4"] + ipv6
+
+    def addresses(self) -> List[Dict[str, Any]]:
+        """
+        Every local address as {"family", "address", "prefixlen", "interface", "scope", "flags"}.
+        """
+        with self._lock:
+            if self._entries is None or self._changed():
+                self._entries = self._load()
+                self._loaded_at = time.monotonic()
+            return [dict(entry) for entry in self._entries]
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries = None
+
+    def close(self) -> None:
+        if self._monitor is not None:
+            self._monitor.close()
+            self._monitor = None
+
+
+def preferred_address(entries: List[Dict[str, Any]], family: str) -> Optional[str]:
+    """
+    The address of `family` ("IPv4"/"IPv6") best suited to show as "the" local IP:
+    global before site before link scope, stable before temporary, and never
+    loopback, deprecated or tentative addresses.
+    """
+    ranks = {"global": 0, "site": 1, "link": 2}
+    candidates = [
+        entry for entry in entries
+        if entry["family"] == family and entry["scope"] in ranks
+        and not {"deprecated", "tentative"} & set(entry["flags"])
+    ]
+    if not candidates:
+        return None
+    best = min(candidates, key=lambda entry: (ranks[entry["scope"]], "temporary" in entry["flags"]))
+    return best["address"]
+
+
+_default_provider: Optional[LocalAddressProvider] = None
+_default_lock = threading.Lock()
+
+
+def get_local_addresses() -> List[Dict[str, Any]]:
+    """
+    All local interface addresses from a shared, change-invalidated cache.
+    """
+    global _default_provider
+    if _default_provider is None:
+        with _default_lock:
+            if _default_provider is None:
+                _default_provider = LocalAddressProvider()
+    return _default_provider.addresses()
+
+
+if __name__ == "__main__":
+    for entry in get_local_addresses():
+        print(f"{entry['interface']:<12} {entry['family']:<5} {entry['address']}/{entry['prefixlen']} "
+              f"scope {entry['scope']} {' '.join(entry['flags'])}")
@@ -0,0 +1,431 @@
+import argparse
+import asyncio
+import ipaddress
+import json
+import sys
+import time
+import urllib.parse
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+from ip_cache import IPInfoCache
+from local_addrs import get_local_addresses
+from network import IPAPI_BASE_URL, _cache_key, _lookup_pooled, _scheduled, get_local_ips
+from scheduler import BATCH, INTERACTIVE, RequestScheduler, get_scheduler
+
+if TYPE_CHECKING:
+    from geo_offline import GeoDatabase
+    from providers import HedgedResolver
+
+DEFAULT_PORT = 8765
+# request latencies: 25 us (a cache hit) up to the 10 s lookup timeout
+LATENCY_BUCKETS = (0.000025, 0.00005) + metrics.DURATION_BUCKETS
+MAX_BODY_BYTES = 8 * 1024 * 1024
+MAX_HEADERS = 100
+ROUTES = ("lookup", "batch", "self", "local", "stats", "metrics", "other")
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _valid_ip(text: str) -> bool:
+    try:
+        ipaddress.ip_address(text.split("%", 1)[0])
+    except ValueError:
+        return False
+    return True
+
+
+class LookupService:
+    """
+    Local HTTP/1.1 service answering get_ip_info() lookups for many clients from one
+    shared IPInfoCache and one set of outbound keep-alive connections:
+
+        GET  /lookup/<ip>   one address, the get_ip_info() dict
+        POST /batch         a JSON list of addresses (or one per line as text/plain);
+                            streams one NDJSON line per address, {"query": ip, ...}.
+                            ?ordered=0 streams them as they complete.
+        GET  /self          this host's public address
+        GET  /local         local IPv4/IPv6 and the interface list
+        GET  /stats         request counts and latency quantiles, cache statistics
+        GET  /metrics       the metrics registry in Prometheus format, when enabled
+
+    Cache hits are answered on the event loop without leaving it. Misses run on
+    `concurrency` worker threads, each owning a keep-alive connection to the
+    provider, through the request scheduler, so concurrent clients asking for the
+    same address share one outbound request and all of them stay within quota.
+    Client connections are kept alive until `idle_timeout` seconds pass unused.
+    Lookup failures keep the {"error": "..."} contract, with status 502 (or 400 for
+    an invalid address) on the single-address routes.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[IPInfoCache] = None,
+        base_url: str = IPAPI_BASE_URL,
+        concurrency: int = 8,
+        timeout: float = 10,
+        scheduler: Optional[RequestScheduler] = None,
+        offline: Optional["GeoDatabase"] = None,
+        idle_timeout: float = 60.0,
+        resolver: Optional["HedgedResolver"] = None,
+    ):
+        self.cache = cache if cache is not None else IPInfoCache()
+        self.base_url = base_url
+        self.concurrency = max(1, int(concurrency))
+        self.timeout = timeout
+        self.scheduler = scheduler or get_scheduler()
+        self.offline = offline
+        self.resolver = resolver
+        self.idle_timeout = idle_timeout
+        self.pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="lookup-service")
+        self.latency = {route: metrics.Histogram(LATENCY_BUCKETS) for route in ROUTES}
+        self.statuses: Counter = Counter()
+        self.lookups = 0
+        self.started = time.time()
+        self.server: Optional[asyncio.AbstractServer] = None
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    async def start(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        """
+        Starts listening; port 0 picks a free port (see `port`).
+        """
+        self.server = await asyncio.start_server(self._serve_connection, host, port)
+        return self.server
+
+    @property
+    def port(self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        """
+        Stops listening, drops open client connections and the worker threads.
+        """
+        if self.server is not None:
+            self.server.close()
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        if self.server is not None:
+            await self.server.wait_closed()
+        self.pool.shutdown(wait=False)
+
+    # --- Lookups ------------------------------------------------------------
+
+    async def lookup(self, ip: Optional[str], priority: int = INTERACTIVE) -> Dict[str, Any]:
+        """
+        The get_ip_info() answer for `ip` (None for this host), from the shared cache
+        when fresh, otherwise fetched on a worker thread and cached. Only the memory
+        level of the cache is read on the event loop; the SQLite level is read on the
+        worker thread.
+        """
+        self.lookups += 1
+        if self.offline is not None and ip is not None:
+            return self.offline.lookup(ip)
+        cached = self.cache.get(_cache_key(ip), memory_only=True)
+        if cached is not None:
+            return cached
+        return await asyncio.get_running_loop().run_in_executor(self.pool, self._fetch, ip, priority)
+
+    def _fetch(self, ip: Optional[str], priority: int) -> Dict[str, Any]:
+        cached = self.cache.get(_cache_key(ip))
+        if cached is not None:
+            return cached
+        if self.resolver is not None:
+            data = self.resolver.lookup(ip, self.timeout)
+        else:
+            fetch = partial(_lookup_pooled, ip, self.base_url, self.timeout)
+            data = _scheduled(self.scheduler, ip, self.base_url, priority, fetch)
+        if not data.get("throttled"):
+            # a throttled answer sent no request; caching it would refuse every client for minutes
+            self.cache.put(_cache_key(ip), data)
+        return data
+
+    async def _checked_lookup(self, ip: str, priority: int) -> Dict[str, Any]:
+        if not _valid_ip(ip):
+            return {"error": f"Invalid IP address: {ip}"}
+        return await self.lookup(ip, priority)
+
+    async def lookup_many(self, ips: Iterable[str], ordered: bool = True):
+        """
+        Async-iterates (ip, data) like network.get_ip_info_many(): in input order or as
+        completed, with at most 2 * concurrency lookups in flight.
+        """
+        window = 2 * self.concurrency
+        it = iter(ips)
+
+        def submit_next():
+            for ip in it:
+                return ip, asyncio.ensure_future(self._checked_lookup(ip, BATCH))
+            return None
+
+        if ordered:
+            pending = deque()
+            while len(pending) < window and (item := submit_next()):
+                pending.append(item)
+            while pending:
+                ip, task = pending.popleft()
+                item = submit_next()
+                if item:
+                    pending.append(item)
+                yield ip, await task
+            return
+
+        in_flight = {}
+        while len(in_flight) < window and (item := submit_next()):
+            in_flight[item[1]] = item[0]
+        while in_flight:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                ip = in_flight.pop(task)
+                item = submit_next()
+                if item:
+                    in_flight[item[1]] = item[0]
+                yield ip, task.result()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Requests served per route with latency quantiles in milliseconds, responses
+        by status, open connections and the shared cache's statistics.
+        """
+        routes = {}
+        for route, histogram in self.latency.items():
+            if histogram.count:
+                routes[route] = {
+                    "requests": histogram.count,
+                    "mean_ms": round(histogram.mean() * 1000, 3),
+                    "p50_ms": round(histogram.quantile(0.5) * 1000, 3),
+                    "p95_ms": round(histogram.quantile(0.95) * 1000, 3),
+                    "p99_ms": round(histogram.quantile(0.99) * 1000, 3),
+                }
+        return {
+            "uptime": round(time.time() - self.started, 3),
+            "connections": len(self._connections),
+            "lookups": self.lookups,
+            "routes": routes,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "cache": self.cache.stats(),
+        }
+
+    # --- HTTP ---------------------------------------------------------------
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+                started = time.perf_counter()
+                route = "other"
+                keep_alive = False
+                try:
+                    method, target, version, headers = await self._read_head(reader, request_line)
+                    body = await self._read_body(reader, headers)
+                    keep_alive = headers.get("connection", "").lower() != "close" and (
+                        version == "HTTP/1.1" or headers.get("connection", "").lower() == "keep-alive"
+                    )
+                    route, status = await self._dispatch(writer, method, target, body, keep_alive)
+                except _HTTPError as e:
+                    status = e.status
+                    await self._send_json(writer, e.status, {"error": e.message}, keep_alive)
+                self.statuses[status] += 1
+                elapsed = time.perf_counter() - started
+                self.latency[route].observe(elapsed)
+                metrics.observe_phase("service", route, elapsed)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    @staticmethod
+    async def _read_head(reader: asyncio.StreamReader, request_line: bytes) -> Tuple[str, str, str, Dict[str, str]]:
+        parts = request_line.decode("latin-1").split()
+        if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+            raise _HTTPError(400, f"Malformed request line: {request_line[:100]!r}")
+        headers = {}
+        for _ in range(MAX_HEADERS):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return parts[0], parts[1], parts[2], headers
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        raise _HTTPError(431, "Too many request headers")
+
+    @staticmethod
+    async def _read_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                try:
+                    size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+                except ValueError:
+                    raise _HTTPError(400, "Invalid chunk size") from None
+                if size < 0:
+                    raise _HTTPError(400, "Invalid chunk size")
+                if size == 0:
+                    await reader.readline()
+                    return bytes(body)
+                if len(body) + size > MAX_BODY_BYTES:
+                    raise _HTTPError(413, f"Request body over {MAX_BODY_BYTES} bytes")
+                body += await reader.readexactly(size)
+                await reader.readline()
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise _HTTPError(400, "Invalid Content-Length") from None
+        if length > MAX_BODY_BYTES:
+            raise _HTTPError(413, f"Request body over {MAX_BODY_BYTES} bytes")
+        return await reader.readexactly(length) if length > 0 else b""
+
+    async def _dispatch(
+        self, writer: asyncio.StreamWriter, method: str, target: str, body: bytes, keep_alive: bool
+    ) -> Tuple[str, int]:
+        parts = urllib.parse.urlsplit(target)
+        path = parts.path.rstrip("/") or "/"
+        query = urllib.parse.parse_qs(parts.query)
+        route = "lookup" if path.startswith("/lookup/") else path[1:]
+        if route not in ROUTES or route in ("lookup", "other") and not path.startswith("/lookup/"):
+            raise _HTTPError(404, f"No such endpoint: {parts.path}")
+        expected = "POST" if route == "batch" else "GET"
+        if method != expected:
+            raise _HTTPError(405, f"{parts.path} expects {expected}")
+
+        if route == "lookup":
+            ip = urllib.parse.unquote(path[len("/lookup/"):])
+            data = await self._checked_lookup(ip, INTERACTIVE)
+            status = 200 if "error" not in data else 400 if not _valid_ip(ip) else 502
+            return route, await self._send_json(writer, status, data, keep_alive)
+        if route == "self":
+            data = await self.lookup(None)
+            return route, await self._send_json(writer, 502 if "error" in data else 200, data, keep_alive)
+        if route == "local":
+            loop = asyncio.get_running_loop()
+            local = await loop.run_in_executor(self.pool, get_local_ips)
+            interfaces = await loop.run_in_executor(self.pool, get_local_addresses)
+            return route, await self._send_json(writer, 200, dict(local, interfaces=interfaces), keep_alive)
+        if route == "stats":
+            return route, await self._send_json(writer, 200, self.stats(), keep_alive)
+        if route == "metrics":
+            registry = metrics.get_metrics()
+            if registry is None:
+                raise _HTTPError(404, "Metrics are not enabled (set VLSM_METRICS=1)")
+            text = registry.to_prometheus().encode()
+            await self._send(writer, 200, "text/plain; version=0.0.4; charset=utf-8", text, keep_alive)
+            return route, 200
+        ordered = query.get("ordered", ["1"])[-1] not in ("0", "false", "no")
+        await self._stream_batch(writer, self._parse_batch(body), ordered, keep_alive)
+        return route, 200
+
+    @staticmethod
+    def _parse_batch(body: bytes) -> List[str]:
+        text = body.decode("utf-8", errors="replace").strip()
+        if not text.startswith("["):
+            return [line.strip() for line in text.splitlines() if line.strip()]
+        try:
+            ips = json.loads(text)
+        except ValueError as e:
+            raise _HTTPError(400, f"Invalid JSON body: {e}") from None
+        if not all(isinstance(ip, str) for ip in ips):
+            raise _HTTPError(400, "The batch body must be a list of address strings")
+        return [ip.strip() for ip in ips]
+
+    async def _stream_batch(self, writer: asyncio.StreamWriter, ips: List[str], ordered: bool, keep_alive: bool) -> None:
+        """
+        Chunked NDJSON: every result is written as soon as it may be, so clients can
+        consume a long batch incrementally.
+        """
+        writer.write(self._head(200, "application/x-ndjson", None, keep_alive))
+        async for ip, data in self.lookup_many(ips, ordered):
+            line = json.dumps(dict(data, query=ip), ensure_ascii=False).encode() + b"\n"
+            writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _head(status: int, content_type: str, length: Optional[int], keep_alive: bool) -> bytes:
+        framing = "Transfer-Encoding: chunked" if length is None else f"Content-Length: {length}"
+        return (
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: {content_type}\r\n{framing}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode("latin-1")
+
+    async def _send(self, writer: asyncio.StreamWriter, status: int, content_type: str, body: bytes,
+                    keep_alive: bool) -> int:
+        writer.write(self._head(status, content_type, len(body), keep_alive) + body)
+        await writer.drain()
+        return status
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, data: Any, keep_alive: bool) -> int:
+        body = json.dumps(data, ensure_ascii=False).encode()
+        return await self._send(writer, status, "application/json", body, keep_alive)
+
+
+async def serve(host: str = "127.0.0.1", port: int = DEFAULT_PORT, **options) -> None:
+    """
+    Runs a LookupService until cancelled.
+    """
+    service = LookupService(**options)
+    server = await service.start(host, port)
+    print(f"Serving lookups on http://{host}:{service.port}/", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Local REST service sharing one lookup cache between clients.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--cache", help="persistent cache file (default: memory only)")
+    parser.add_argument("--cache-entries", type=int, default=100_000, help="in-memory cache size")
+    parser.add_argument("--concurrency", type=int, default=8, help="outbound connections to the provider")
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--offline", metavar="DB", help="answer from a geo_offline database (or a datasets directory)")
+    parser.add_argument("--base-url", default=IPAPI_BASE_URL)
+    parser.add_argument("--providers", action="store_true",
+                        help="hedge lookups across several providers instead of --base-url alone")
+    args = parser.parse_args(argv)
+
+    metrics.enable_from_env()
+    offline = None
+    if args.offline:
+        from datasets import open_dataset
+        offline = open_dataset(args.offline, extension=".vgeo")
+    resolver = None
+    if args.providers:
+        from providers import HedgedResolver
+        resolver = HedgedResolver()
+    cache = IPInfoCache(args.cache, max_entries=args.cache_entries)
+    try:
+        asyncio.run(serve(args.host, args.port, cache=cache, base_url=args.base_url, concurrency=args.concurrency,
+                          timeout=args.timeout, offline=offline, resolver=resolver))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cache.close()
+        if resolver is not None:
+            resolver.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,320 @@
-import folium
+import hashlib
+import heapq
+import html
+import json
+import math
+import os
+import tempfile
+import time
+from collections import Counter
 
-def generate_map(latitude, longitude, output_file="ip_map.html"):
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# bump when the rendered HTML changes for the same inputs, to invalidate cached maps
+RENDER_VERSION = 1
+
+
+def default_map_cache_dir():
+    """
+    Where cached map HTML lives: $XDG_CACHE_HOME/vlsm/maps (falling back to ~/.cache).
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "vlsm", "maps")
+
+
+class MapCache:
+    """
+    Content-addressed store of rendered map HTML.
+
+    A map's file name is a hash of its rendering inputs, with coordinates rounded to
+    `precision` decimals (5 is about a metre), so identical requests reuse one file and
+    skip the folium build. New files are rendered to a temporary name in the cache
+    directory and renamed into place, so concurrent callers never see or clobber a
+    half-written map. After each render, files older than `max_age` seconds are
+    removed, then the least recently used ones until at most `max_files` files and
+    `max_bytes` bytes remain.
+    """
+
+    def __init__(self, directory=None, precision=5, max_files=200, max_bytes=100 * 1024 * 1024, max_age=7 * 86400):
+        self.directory = directory or default_map_cache_dir()
+        self.precision = precision
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def round(self, value):
+        return round(float(value), self.precision)
+
+    def key(self, inputs):
+        payload = json.dumps({"v": RENDER_VERSION, **inputs}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_or_render(self, inputs, render):
+        """
+        Returns the cached file for `inputs`, calling render(path) to create it on a miss.
+        """
+        path = os.path.join(self.directory, f"map-{self.key(inputs)[:32]}.html")
+        try:
+            os.utime(path)  # hit: refresh its LRU position
+            self.hits += 1
+            return path
+        except FileNotFoundError:
+            pass
+        self.misses += 1
+        fd, tmp_path = tempfile.mkstemp(prefix=".render-", suffix=".html", dir=self.directory)
+        os.close(fd)
+        try:
+            render(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.cleanup(keep=path)
+        return path
+
+    def cleanup(self, keep=None):
+        """
+        Applies the age, count and size bounds. Returns the number of files removed.
+        `keep` (the file just rendered) is never removed, even if it alone exceeds `max_bytes`.
+        """
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith("map-") and entry.name.endswith(".html"):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        entries.sort(reverse=True)  # most recently used first
+        removed = 0
+        total = 0
+        for index, (mtime, size, path) in enumerate(entries):
+            total += size
+            if path == keep:
+                continue
+            if index >= self.max_files or total > self.max_bytes or now - mtime > self.max_age:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+        return removed
+
+
+def generate_map(latitude, longitude, output_file="ip_map.html", zoom_start=10, tooltip=None, cache=None):
     """
     Generates a folium map centered at the given coordinates.
+    With a `tooltip`, a marker carrying it is placed at the center.
+    With a MapCache, the (possibly already existing) cached file is returned and
+    `output_file` is ignored.
     Returns the output filename.
     """
     try:
-        m = folium.Map(location=[latitude, longitude], zoom_start=10)
-        m.save(output_file)
+        if cache is not None:
+            latitude, longitude = cache.round(latitude), cache.round(longitude)
+            inputs = {"kind": "single", "center": [latitude, longitude], "zoom": zoom_start, "tooltip": tooltip}
+            return cache.get_or_render(inputs, lambda path: _render_map(latitude, longitude, path, zoom_start, tooltip))
+        _render_map(latitude, longitude, output_file, zoom_start, tooltip)
+        return output_file
+    except Exception as e:
+        return None
+
+
+def _render_map(latitude, longitude, output_file, zoom_start, tooltip):
+    # folium (and pandas/jinja2/branca behind it) is imported on first render only
+    import folium
+
+    m = folium.Map(location=[latitude, longitude], zoom_start=zoom_start)
+    if tooltip is not None:
+        folium.Marker([latitude, longitude], popup=tooltip, tooltip=tooltip).add_to(m)
+    m.save(output_file)
+
+
+def _geohash_bits(precision):
+    """
+    (longitude bits, latitude bits) of a geohash with `precision` characters.
+    """
+    total = 5 * precision
+    return (total + 1) // 2, total // 2
+
+
+def _grid_cell(latitude, longitude, precision):
+    """
+    Integer (row, column) of the geohash cell containing a coordinate.
+    """
+    lon_bits, lat_bits = _geohash_bits(precision)
+    col = min(int((longitude + 180.0) / 360.0 * (1 << lon_bits)), (1 << lon_bits) - 1)
+    row = min(int((latitude + 90.0) / 180.0 * (1 << lat_bits)), (1 << lat_bits) - 1)
+    return row, col
+
+
+def _cell_geohash(row, col, precision):
+    lon_bits, lat_bits = _geohash_bits(precision)
+    value = 0
+    for i in range(lon_bits + lat_bits):
+        # geohash interleaves bits starting with longitude
+        if i % 2 == 0:
+            bit = (col >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (row >> (lat_bits - 1 - i // 2)) & 1
+        value = (value << 1) | bit
+    return "".join(
+        _GEOHASH_ALPHABET[(value >> (5 * (precision - 1 - i))) & 31] for i in range(precision)
+    )
+
+
+def geohash(latitude, longitude, precision=4):
+    """
+    Standard base32 geohash of a coordinate; `precision` characters
+    (4 is roughly a 40 km cell, 5 roughly 5 km).
+    """
+    return _cell_geohash(*_grid_cell(latitude, longitude, precision), precision)
+
+
+def _point_fields(point):
+    if isinstance(point, dict):
+        lat = point.get("latitude", point.get("lat"))
+        lon = point.get("longitude", point.get("lon"))
+        label = point.get("asn") or point.get("org")
+        if point.get("asn") and point.get("org"):
+            label = f"{point['asn']} {point['org']}"
+        return lat, lon, label
+    lat, lon = point[0], point[1]
+    return lat, lon, point[2] if len(point) > 2 else None
+
+
+def aggregate_points(points, precision=4, top_n=3, max_cells=None):
+    """
+    Buckets points into geohash cells in a single pass.
+    Points are dicts with latitude/longitude (or lat/lon) and optional asn/org, or
+    (lat, lon[, label]) tuples; points without valid coordinates are skipped.
+    Returns one dict per cell with its centroid, point count and the `top_n` most
+    common ASN/org labels, largest cells first (at most `max_cells` of them).
+    Memory grows with the number of cells, not the number of points.
+    """
+    lon_bits, lat_bits = _geohash_bits(precision)
+    lon_scale = (1 << lon_bits) / 360.0
+    lat_scale = (1 << lat_bits) / 180.0
+    lon_max = (1 << lon_bits) - 1
+    lat_max = (1 << lat_bits) - 1
+    cells = {}
+    for point in points:
+        lat, lon, label = _point_fields(point)
+        try:
+            lat = float(lat)
+            lon = float(lon)
+        except (TypeError, ValueError):
+            continue
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+            continue
+        key = (min(int((lat + 90.0) * lat_scale), lat_max), min(int((lon + 180.0) * lon_scale), lon_max))
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = [0, 0.0, 0.0, None]
+        cell[0] += 1
+        cell[1] += lat
+        cell[2] += lon
+        if label:
+            labels = cell[3]
+            if labels is None:
+                labels = cell[3] = {}
+            labels[label] = labels.get(label, 0) + 1
+
+    items = cells.items()
+    if max_cells is not None and len(cells) > max_cells:
+        items = heapq.nlargest(max_cells, items, key=lambda item: item[1][0])
+    else:
+        items = sorted(items, key=lambda item: item[1][0], reverse=True)
+    result = []
+    for (row, col), (count, lat_sum, lon_sum, labels) in items:
+        result.append({
+            "cell": _cell_geohash(row, col, precision),
+            "latitude": lat_sum / count,
+            "longitude": lon_sum / count,
+            "count": count,
+            "top": Counter(labels).most_common(top_n) if labels else [],
+        })
+    return result
+
+
+_CLUSTER_CALLBACK = """
+function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {radius: row[3], fill: true});
+    marker.bindPopup(row[2], {maxWidth: 300});
+    return marker;
+};
+"""
+
+
+def _cell_popup(cell):
+    lines = [f"<b>{cell['count']:,} addresses</b>"]
+    for label, count in cell["top"]:
+        lines.append(f"{html.escape(str(label))}: {count:,}")
+    return "<br>".join(lines)
+
+
+def generate_map_many(points, output_file="ip_map.html", mode="cluster", precision=4, max_cells=2000, top_n=3,
+                      cache=None):
+    """
+    Generates one folium map for any number of points.
+    Points are pre-aggregated into geohash cells (see aggregate_points) and only the
+    `max_cells` busiest cells are drawn, so the HTML size and browser render time stay
+    bounded however many points are given. mode="cluster" draws one clustered marker
+    per cell with its count and top ASNs/orgs; mode="heatmap" draws a count-weighted
+    heat layer. With a MapCache, the aggregated cells are the cache key and an
+    identical earlier map is returned without rendering. Returns the output
+    filename, or None on failure; an unknown mode raises ValueError.
+    """
+    if mode not in ("cluster", "heatmap"):
+        raise ValueError(f"unknown map mode: {mode}")
+    try:
+        cells = aggregate_points(points, precision=precision, top_n=top_n, max_cells=max_cells)
+        if cache is not None:
+            inputs = {"kind": "many", "mode": mode, "cells": cells}
+            return cache.get_or_render(inputs, lambda path: _render_cells(cells, path, mode))
+        _render_cells(cells, output_file, mode)
         return output_file
     except Exception as e:
         return None
+
+
+def _render_cells(cells, output_file, mode):
+    import folium
+
+    if cells:
+        total = sum(cell["count"] for cell in cells)
+        center = [
+            sum(cell["latitude"] * cell["count"] for cell in cells) / total,
+            sum(cell["longitude"] * cell["count"] for cell in cells) / total,
+        ]
+    else:
+        center = [0.0, 0.0]
+    m = folium.Map(location=center, zoom_start=2 if len(cells) > 1 else 10)
+
+    if mode == "heatmap":
+        from folium.plugins import HeatMap
+
+        HeatMap([[cell["latitude"], cell["longitude"], cell["count"]] for cell in cells]).add_to(m)
+    else:
+        from folium.plugins import FastMarkerCluster
+
+        # one JS array instead of a folium element per cell keeps rendering cheap
+        largest = cells[0]["count"] if cells else 1
+        rows = [
+            [
+                cell["latitude"],
+                cell["longitude"],
+                _cell_popup(cell),
+                round(4 + 12 * math.log1p(cell["count"]) / math.log1p(largest), 1),
+            ]
+            for cell in cells
+        ]
+        FastMarkerCluster(rows, callback=_CLUSTER_CALLBACK).add_to(m)
+
+    m.save(output_file)
@@ -0,0 +1,437 @@
+import os
+import socket
+import ssl
+import sys
+import threading
+import time
+import urllib.error
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+# Phase durations in seconds: 0.1 ms to 10 s, roughly 2.5x apart
+DURATION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Response body sizes in bytes
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536, 262144, 1048576)
+
+PHASE_SECONDS = "vlsm_phase_seconds"
+RESPONSE_BYTES = "vlsm_response_bytes"
+CACHE_REQUESTS = "vlsm_cache_requests_total"
+ERRORS = "vlsm_errors_total"
+
+_HELP = {
+    PHASE_SECONDS: ("histogram", "Duration of each phase of an operation."),
+    RESPONSE_BYTES: ("histogram", "Response body bytes read."),
+    CACHE_REQUESTS: ("counter", "Cache lookups by result."),
+    ERRORS: ("counter", "Failed operations by error class."),
+}
+
+# phases of a lookup in the order they happen, as shown in the status summary
+LOOKUP_PHASES = ("dns", "connect", "tls", "server", "read", "parse")
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram: one bisect and three additions per observation.
+    counts[i] is the number of values <= bounds[i] and > bounds[i - 1]; the last
+    slot counts values above every bound. `last` is the most recent value.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum", "last")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.last = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.last = value
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates the q-quantile by linear interpolation inside its bucket, as
+        Prometheus' histogram_quantile() does. Returns 0.0 when empty.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[i - 1] if i else 0.0
+                return lower + (self.bounds[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+def error_class(cause: Union[BaseException, str]) -> str:
+    """
+    Short, low-cardinality name for why an operation failed, used as the "class" label.
+    """
+    if isinstance(cause, str):
+        return cause
+    if isinstance(cause, urllib.error.HTTPError):
+        return "rate_limited" if cause.code == 429 else f"http_{cause.code}"
+    if isinstance(cause, urllib.error.URLError) and isinstance(cause.reason, BaseException):
+        return error_class(cause.reason)
+    if isinstance(cause, socket.gaierror):
+        return "dns"
+    # asyncio.TimeoutError is only an alias of the builtin from Python 3.11 on
+    if isinstance(cause, (TimeoutError, socket.timeout)) or type(cause).__name__ == "TimeoutError":
+        return "timeout"
+    if isinstance(cause, (ssl.SSLError, ssl.CertificateError)):
+        return "tls"
+    if isinstance(cause, ConnectionRefusedError):
+        return "refused"
+    if isinstance(cause, (ConnectionError, OSError)):
+        return "connection"
+    if isinstance(cause, ValueError):
+        return "invalid_response"
+    return type(cause).__name__
+
+
+_label_keys: Dict[Labels, Labels] = {}
+
+
+def _labels(labels: Mapping[str, str]) -> Labels:
+    # label sets are few (operation x phase, error classes), so their sorted form is memoized
+    raw = tuple(labels.items())
+    key = _label_keys.get(raw)
+    if key is None:
+        key = _label_keys[raw] = tuple(sorted((name, str(value)) for name, value in raw))
+    return key
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class Metrics:
+    """
+    Registry of phase histograms and counters for the network layer.
+
+    Every recorded value is also passed, as an event dict {"metric", "labels",
+    "value", "time"}, to the callbacks registered with add_callback(). Callbacks
+    run on the recording thread (a lookup worker, an event loop, the Tk thread),
+    so they should be quick; their exceptions are printed and otherwise ignored.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self.callbacks: List[Callable[[Dict[str, Any]], None]] = []
+        self.started = time.time()
+
+    def add_callback(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        self.callbacks.append(callback)
+
+    def remove_callback(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        self.callbacks.remove(callback)
+
+    def _emit(self, metric: str, labels: Mapping[str, str], value: float) -> None:
+        event = {"metric": metric, "labels": dict(labels), "value": value, "time": time.time()}
+        for callback in self.callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print("Metrics callback error:", e, file=sys.stderr)
+
+    def observe(self, metric: str, value: float, buckets: Sequence[float] = DURATION_BUCKETS, **labels: str) -> None:
+        key = (metric, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+        if self.callbacks:
+            self._emit(metric, labels, value)
+
+    def inc(self, metric: str, amount: float = 1, **labels: str) -> None:
+        key = (metric, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        if self.callbacks:
+            self._emit(metric, labels, amount)
+
+    def histogram(self, metric: str, **labels: str) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get((metric, _labels(labels)))
+
+    def counter(self, metric: str, **labels: str) -> float:
+        with self._lock:
+            return self._counters.get((metric, _labels(labels)), 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Plain-dict copy of every series: histograms with their count, sum, mean,
+        p50/p95 and last value, counters with their total.
+        """
+        with self._lock:
+            histograms = [
+                {
+                    "metric": metric,
+                    "labels": dict(labels),
+                    "count": h.count,
+                    "sum": round(h.sum, 6),
+                    "mean": round(h.mean(), 6),
+                    "p50": round(h.quantile(0.5), 6),
+                    "p95": round(h.quantile(0.95), 6),
+                    "last": round(h.last, 6),
+                }
+                for (metric, labels), h in sorted(self._histograms.items())
+            ]
+            counters = [
+                {"metric": metric, "labels": dict(labels), "value": value}
+                for (metric, labels), value in sorted(self._counters.items())
+            ]
+        return {"started": self.started, "histograms": histograms, "counters": counters}
+
+    def to_prometheus(self) -> str:
+        """
+        Every series in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            described = set()
+            for (metric, labels), h in histograms:
+                if metric not in described:
+                    described.add(metric)
+                    kind, text = _HELP.get(metric, ("histogram", metric))
+                    lines += [f"# HELP {metric} {text}", f"# TYPE {metric} {kind}"]
+                cumulative = 0
+                for bound, n in zip(h.bounds + ("+Inf",), h.counts):
+                    cumulative += n
+                    le = f'le="{bound}"'
+                    lines.append(f"{metric}_bucket{_format_labels(labels, le)} {cumulative}")
+                lines.append(f"{metric}_sum{_format_labels(labels)} {_format_value(h.sum)}")
+                lines.append(f"{metric}_count{_format_labels(labels)} {h.count}")
+            for (metric, labels), value in counters:
+                if metric not in described:
+                    described.add(metric)
+                    kind, text = _HELP.get(metric, ("counter", metric))
+                    lines += [f"# HELP {metric} {text}", f"# TYPE {metric} {kind}"]
+                lines.append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Writes to_prometheus() to `path` atomically, for node_exporter's textfile collector.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
+
+    def serve(self, port: int = 9464, host: str = "127.0.0.1") -> "ThreadingHTTPServer":
+        """
+        Serves to_prometheus() at http://host:port/metrics from a daemon thread.
+        Returns the server; call shutdown() on it to stop. Port 0 picks a free port.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+    def summary(self, operation: str = "lookup") -> str:
+        """
+        One line for a status bar: the latest `operation` broken down by phase, then
+        cache hits and errors so far, e.g.
+        "lookup 182 ms (dns 12, connect 30, tls 41, server 95, read 1, parse 0.2) · cache 3/4 hits · 1 error".
+        """
+        with self._lock:
+            total = self._histograms.get((PHASE_SECONDS, _labels({"operation": operation, "phase": "total"})))
+            phases = []
+            for phase in LOOKUP_PHASES:
+                h = self._histograms.get((PHASE_SECONDS, _labels({"operation": operation, "phase": phase})))
+                if h is not None:
+                    phases.append(f"{phase} {_ms(h.last)}")
+            hits = misses = 0
+            for (metric, labels), value in self._counters.items():
+                if metric == CACHE_REQUESTS:
+                    if dict(labels).get("result") == "miss":
+                        misses += value
+                    else:
+                        hits += value
+            errors = sum(value for (metric, _), value in self._counters.items() if metric == ERRORS)
+        parts = []
+        if total is not None:
+            parts.append(f"{operation} {_ms(total.last)} ms" + (f" ({', '.join(phases)})" if phases else ""))
+        if hits or misses:
+            parts.append(f"cache {int(hits)}/{int(hits + misses)} hits")
+        if errors:
+            parts.append(f"{int(errors)} error{'s' if errors != 1 else ''}")
+        return " · ".join(parts)
+
+
+def _ms(seconds: float) -> str:
+    ms = seconds * 1000.0
+    return f"{ms:.0f}" if ms >= 10 else f"{ms:.1f}"
+
+
+class _NoopPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Phase:
+    __slots__ = ("metrics", "operation", "name", "started")
+
+    def __init__(self, metrics: Metrics, operation: str, name: str):
+        self.metrics = metrics
+        self.operation = operation
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(PHASE_SECONDS, time.perf_counter() - self.started, operation=self.operation, phase=self.name)
+        return False
+
+
+_NOOP = _NoopPhase()
+
+# None while instrumentation is off: every hook below then returns after one global lookup
+_metrics: Optional[Metrics] = None
+
+
+def enable(registry: Optional[Metrics] = None) -> Metrics:
+    """
+    Turns instrumentation on, recording into `registry` (a new one by default, or
+    the current one if already enabled). Returns the active registry.
+    """
+    global _metrics
+    if registry is not None:
+        _metrics = registry
+    elif _metrics is None:
+        _metrics = Metrics()
+    return _metrics
+
+
+def disable() -> None:
+    global _metrics
+    _metrics = None
+
+
+def get_metrics() -> Optional[Metrics]:
+    """
+    The active registry, or None while instrumentation is off.
+    """
+    return _metrics
+
+
+def enabled() -> bool:
+    return _metrics is not None
+
+
+def enable_from_env(environ: Mapping[str, str] = os.environ) -> Optional[Metrics]:
+    """
+    Enables instrumentation when VLSM_METRICS is set to a true value, or when
+    VLSM_METRICS_FILE (a Prometheus textfile to keep updated) or VLSM_METRICS_PORT
+    (serve /metrics on 127.0.0.1:PORT) is set. Returns the registry, or None.
+    """
+    flag = environ.get("VLSM_METRICS", "").strip().lower()
+    port = environ.get("VLSM_METRICS_PORT", "").strip()
+    if flag not in ("1", "true", "yes", "on") and not port and not environ.get("VLSM_METRICS_FILE"):
+        return None
+    registry = enable()
+    if port:
+        try:
+            registry.serve(int(port))
+        except (ValueError, OSError) as e:
+            print("Metrics endpoint error:", e, file=sys.stderr)
+    return registry
+
+
+def phase(operation: str, name: str) -> Union[_Phase, _NoopPhase]:
+    """
+    Context manager timing one phase of `operation` into the vlsm_phase_seconds histogram.
+    The time is recorded even if the block raises.
+    """
+    registry = _metrics
+    if registry is None:
+        return _NOOP
+    return _Phase(registry, operation, name)
+
+
+def observe_phase(operation: str, name: str, seconds: float) -> None:
+    registry = _metrics
+    if registry is not None:
+        registry.observe(PHASE_SECONDS, seconds, operation=operation, phase=name)
+
+
+def bytes_read(operation: str, n: int) -> None:
+    registry = _metrics
+    if registry is not None:
+        registry.observe(RESPONSE_BYTES, n, SIZE_BUCKETS, operation=operation)
+
+
+def cache_result(cache: str, result: str) -> None:
+    """
+    Counts one lookup in `cache`; `result` is "miss" or where the hit came from (e.g. "memory", "disk").
+    """
+    registry = _metrics
+    if registry is not None:
+        registry.inc(CACHE_REQUESTS, cache=cache, result=result)
+
+
+def error(operation: str, cause: Union[BaseException, str]) -> None:
+    """
+    Counts a failed `operation`; `cause` is the exception or an error class name.
+    """
+    registry = _metrics
+    if registry is not None:
+        registry.inc(ERRORS, operation=operation, **{"class": error_class(cause)})
@@ -0,0 +1,184 @@
+import argparse
+import ipaddress
+import json
+import random
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from network import _pooled_get, get_ip_info
+
+# Endpoints answering with nothing but the caller's address as plain text (a few dozen bytes)
+IP_ONLY_ENDPOINTS = (
+    "https://api.ipify.org/",
+    "https://icanhazip.com/",
+    "https://checkip.amazonaws.com/",
+)
+
+
+def get_public_ip(endpoints: Sequence[str] = IP_ONLY_ENDPOINTS, timeout: float = 5) -> Optional[str]:
+    """
+    The caller's public address from the first IP-only endpoint that answers with a
+    valid address, or None if none does. No geolocation quota is used.
+    """
+    for url in endpoints:
+        try:
+            status, _, body = _pooled_get(url, timeout)
+            if status >= 400:
+                continue
+            return str(ipaddress.ip_address(body.decode("ascii", "replace").strip()))
+        except Exception:
+            continue
+    return None
+
+
+class IPMonitor:
+    """
+    Watches the public address and reports when it changes.
+
+    Each check asks a cheap IP-only endpoint over a keep-alive connection; only
+    when the address differs from the last one seen is the full geolocation
+    looked up (once) and a change event emitted to every callback. While the
+    address stays the same the polling interval grows by `backoff` per check up
+    to `max_interval`; a change resets it to `min_interval`. Every delay gets
+    +/- `jitter` randomization so a fleet of boxes does not poll in lockstep.
+    The first successful check reports the initial address as a change from None.
+    If the geolocation lookup fails, the change is not recorded and the next check
+    (after `min_interval`) tries again.
+    """
+
+    def __init__(
+        self,
+        on_change: Optional[Callable[[Dict[str, Any]], None]] = None,
+        endpoints: Sequence[str] = IP_ONLY_ENDPOINTS,
+        min_interval: float = 30.0,
+        max_interval: float = 15 * 60.0,
+        backoff: float = 1.5,
+        jitter: float = 0.1,
+        lookup: Callable[[str], Dict[str, Any]] = get_ip_info,
+        timeout: float = 5,
+    ):
+        self.callbacks: List[Callable[[Dict[str, Any]], None]] = [on_change] if on_change else []
+        self.endpoints = endpoints
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.lookup = lookup
+        self.timeout = timeout
+        self.current: Optional[str] = None
+        self.info: Dict[str, Any] = {}
+        self.interval = min_interval
+        self.checks = 0
+        self.failures = 0
+        self.lookups = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_callback(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        self.callbacks.append(callback)
+
+    def check(self) -> Optional[Dict[str, Any]]:
+        """
+        One poll. Returns the change event if the address changed, else None.
+        """
+        self.checks += 1
+        ip = get_public_ip(self.endpoints, self.timeout)
+        if ip is None:
+            # keep the interval short while the endpoints are unreachable
+            self.failures += 1
+            self.interval = self.min_interval
+            return None
+        if ip == self.current:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+            return None
+
+        self.lookups += 1
+        info = self.lookup(ip)
+        if "error" in info:
+            # keep the last known state so the next check sees the change again and retries
+            self.failures += 1
+            self.interval = self.min_interval
+            return None
+        event = {"time": time.time(), "previous": self.current, "ip": ip, "info": info}
+        self.current, self.info = ip, info
+        self.interval = self.min_interval
+        for callback in self.callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print("Monitor callback error:", e, file=sys.stderr)
+        return event
+
+    def next_delay(self) -> float:
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def run(self, max_checks: Optional[int] = None) -> None:
+        """
+        Polls until stop() is called (or `max_checks` checks were made).
+        """
+        self._stop.clear()
+        while not self._stop.is_set():
+            self.check()
+            if max_checks is not None and self.checks >= max_checks:
+                return
+            self._stop.wait(self.next_delay())
+
+    def start(self) -> "IPMonitor":
+        """
+        Runs the monitor on a daemon thread.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name="ip-monitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "current": self.current,
+            "checks": self.checks,
+            "failures": self.failures,
+            "lookups": self.lookups,
+            "interval": round(self.interval, 1),
+        }
+
+
+def _print_event(event: Dict[str, Any], as_json: bool) -> None:
+    if as_json:
+        print(json.dumps(event, ensure_ascii=False), flush=True)
+        return
+    info = event["info"]
+    where = ", ".join(str(info[key]) for key in ("city", "country_name", "org") if info.get(key))
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(event["time"]))
+    print(f"{stamp} {event['previous'] or '-'} -> {event['ip']} ({where})", flush=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Watch the public IP address and report changes.")
+    parser.add_argument("--min-interval", type=float, default=30.0, help="seconds between checks after a change")
+    parser.add_argument("--max-interval", type=float, default=900.0, help="upper bound while the address is stable")
+    parser.add_argument("--backoff", type=float, default=1.5, help="interval growth per unchanged check")
+    parser.add_argument("--json", action="store_true", help="print events as JSON lines")
+    parser.add_argument("--once", action="store_true", help="check once, print the address and exit")
+    args = parser.parse_args(argv)
+
+    monitor = IPMonitor(
+        on_change=lambda event: _print_event(event, args.json),
+        min_interval=args.min_interval,
+        max_interval=args.max_interval,
+        backoff=args.backoff,
+    )
+    try:
+        monitor.run(max_checks=1 if args.once else None)
+    except KeyboardInterrupt:
+        return 130
+    return 0 if monitor.current else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
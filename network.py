@@ -1,83 +1,469 @@
-import urllib.request
-import json
-import socket
-from typing import Dict, Any
-
-
-def safe_json_loads(raw_bytes: bytes) -> Dict[str, Any]:
-    try:
-        return json.loads(raw_bytes.decode())
-    except Exception:
-        return {"error": "Invalid JSON response"}
-
-
-def get_ip_info() -> Dict[str, Any]:
-    """
-    Fetches public IP/geolocation data from ipapi.co.
-    Always returns a dictionary; on any error returns {"error": "..."}.
-    """
-    url = "https://ipapi.co/json/"
-    try:
-        with urllib.request.urlopen(url, timeout=10) as response:
-            body = response.read()
-            data = safe_json_loads(body)
-            # Normalize some fields for UI consumers
-            if "ip" in data:
-                data.setdefault("public_ip", data.get("ip"))
-            if "asn" not in data and "org" in data:
-                # ipapi may return 'org' with "AS12345 Name"; keep org as-is
-                data.setdefault("asn", data.get("asn", "N/A"))
-            return data
-    except Exception as e:
-        return {"error": f"Failed to retrieve data: {e}"}
-
-
-def _get_local_ipv4() -> str:
-    """
-    Determines the local IPv4 address by opening a UDP socket to a public IPv4 address.
-    This doesn't send any packets on UDP — it's a trick to learn the local address.
-    """
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        # Google DNS IPv4: 8.8.8.8 port 80 (UDP)
-        s.connect(("8.8.8.8", 80))
-        addr = s.getsockname()[0]
-        s.close()
-        return addr
-    except Exception:
-        return "N/A"
-
-
-def _get_local_ipv6() -> str:
-    """
-    Determines the local IPv6 address by opening a UDP IPv6 socket to a public IPv6 address.
-    If the environment doesn't support IPv6 or it's not configured, returns "N/A".
-    """
-    try:
-        s = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-        # Google Public DNS IPv6:
-        s.connect(("2001:4860:4860::8888", 80))
-        addr = s.getsockname()[0]
-        s.close()
-        # Some systems return scope id e.g. "fe80::1%eth0" — keep as-is
-        return addr
-    except Exception:
-        return "N/A"
-
-
-def get_local_ips() -> Dict[str, str]:
-    """
-    Returns both local IPv4 and IPv6 addresses as a dict:
-    { "local_ipv4": "...", "local_ipv6": "..." }
-    Values are "N/A" when unavailable.
-    """
-    return {"local_ipv4": _get_local_ipv4(), "local_ipv6": _get_local_ipv6()}
-
-
-if __name__ == "__main__":
-    print("Testing network.py...")
-    print("Local IPs:", get_local_ips())
-    data = get_ip_info()
-    import pprint
-
-    pprint.pprint(data)
+import urllib.request
+import urllib.parse
+import http.client
+import json
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Dict, Any, Iterable, Iterator, Optional, Tuple
+
+import metrics
+from local_addrs import get_local_addresses, preferred_address
+from scheduler import BATCH, INTERACTIVE, RequestScheduler, SlotTimeout, get_scheduler
+
+if TYPE_CHECKING:
+    from ip_cache import IPInfoCache
+    from geo_offline import GeoDatabase
+    from providers import HedgedResolver
+
+IPAPI_BASE_URL = "https://ipapi.co"
+USER_AGENT = "VLSM/1.0 (+https://github.com/vincesy22/VLSM)"
+
+
+def safe_json_loads(raw_bytes: bytes) -> Dict[str, Any]:
+    try:
+        return json.loads(raw_bytes.decode())
+    except Exception:
+        return {"error": "Invalid JSON response"}
+
+
+# Field schema shared by the UI, its CSV/JSON exports and the enrichment CLI
+RECORD_FIELDS = (
+    "local_ipv4", "local_ipv6", "public_ip", "version", "city", "region", "country",
+    "latitude", "longitude", "timezone", "org", "asn",
+)
+
+
+def to_record(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Flattens a merged local + get_ip_info() dict into the RECORD_FIELDS schema,
+    with "N/A" for anything missing. Normalization is records.IPRecord.from_dict();
+    an IPRecord is already normalized and is only formatted.
+    """
+    if not hasattr(data, "as_record"):
+        from records import IPRecord
+
+        data = IPRecord.from_dict(data)
+    return data.as_record()
+
+
+def _normalize_ip_info(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Normalizes an ipapi.co payload in place for UI consumers.
+    ipapi.co reports per-IP failures as {"error": true, "reason": "..."}; those
+    are folded into the usual {"error": "..."} shape.
+    """
+    if data.get("error") is True:
+        return {"error": f"Failed to retrieve data: {data.get('reason', 'unknown error')}"}
+    if "ip" in data:
+        data.setdefault("public_ip", data.get("ip"))
+    if "asn" not in data and "org" in data:
+        # ipapi may return 'org' with "AS12345 Name"; keep org as-is
+        data.setdefault("asn", data.get("asn", "N/A"))
+    return data
+
+
+def _ip_info_url(ip: Optional[str] = None, base_url: str = IPAPI_BASE_URL) -> str:
+    """
+    Builds the ipapi.co endpoint for the caller's own address (ip=None) or a given IP.
+    """
+    if ip is None:
+        return f"{base_url}/json/"
+    return f"{base_url}/{urllib.parse.quote(ip.strip(), safe='')}/json/"
+
+
+def _cache_key(ip: Optional[str]) -> str:
+    return "self" if ip is None else ip.strip()
+
+
+def _is_rate_limited(data: Dict[str, Any]) -> bool:
+    error = data.get("error", "")
+    return "429" in error or "RateLimited" in error
+
+
+def _scheduled(
+    scheduler: RequestScheduler,
+    ip: Optional[str],
+    base_url: str,
+    priority: int,
+    fetch: Callable[[], Dict[str, Any]],
+) -> Dict[str, Any]:
+    """
+    Runs `fetch` through the request scheduler: paced by the host's quotas, and
+    shared with any concurrent lookup of the same address on the same host.
+    If no request slot comes free in time nothing is sent and the error carries
+    "throttled": True.
+    """
+    host = urllib.parse.urlsplit(base_url).netloc
+    try:
+        return scheduler.do((host, _cache_key(ip)), fetch, host=host, priority=priority, rate_limited=_is_rate_limited)
+    except SlotTimeout as e:
+        metrics.error("lookup", "throttled")
+        return {"error": f"Failed to retrieve data: local rate limit reached, {e}", "throttled": True}
+
+
+def get_ip_info(
+    ip: Optional[str] = None,
+    cache: Optional["IPInfoCache"] = None,
+    offline: Optional["GeoDatabase"] = None,
+    scheduler: Optional[RequestScheduler] = None,
+    priority: int = INTERACTIVE,
+    base_url: str = IPAPI_BASE_URL,
+    resolver: Optional["HedgedResolver"] = None,
+) -> Dict[str, Any]:
+    """
+    Fetches public IP/geolocation data from ipapi.co (or a compatible service at `base_url`).
+    With no argument the caller's own public address is looked up; otherwise `ip`.
+    When an ip_cache.IPInfoCache is given, fresh cached results skip the HTTP call.
+    In offline mode (a geo_offline.GeoDatabase is given) `ip` is answered from the
+    local range database and no request is made at all.
+    Requests go through the shared scheduler (or `scheduler`), which keeps within
+    ipapi.co's quotas, serves INTERACTIVE callers before BATCH ones and merges
+    concurrent lookups of the same address into one request.
+    With a providers.HedgedResolver the lookup is hedged across its providers
+    instead of going to `base_url`; each provider takes its own scheduler token.
+    Always returns a dictionary; on any error returns {"error": "..."}.
+    """
+    if offline is not None:
+        if ip is None:
+            return {"error": "Offline mode needs an explicit IP address"}
+        return offline.lookup(ip)
+    if resolver is not None:
+        fetch = partial(resolver.lookup, ip)
+    else:
+        fetch = partial(_scheduled, scheduler or get_scheduler(), ip, base_url, priority,
+                        partial(_fetch_ip_info, ip, base_url))
+    if cache is not None:
+        return cache.get_or_fetch(_cache_key(ip), fetch)
+    return fetch()
+
+
+# --- Instrumentation --------------------------------------------------------
+# While metrics are enabled, lookups use these connection classes so that DNS,
+# TCP connect, TLS and the wait for the response headers are timed separately.
+# With metrics off the plain http.client / urllib classes are used unchanged.
+
+class _TimedHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = self._timed_create_connection
+        self._socket_seconds = 0.0
+
+    def _timed_create_connection(self, address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+        started = time.perf_counter()
+        host, port = address
+        with metrics.phase("lookup", "dns"):
+            infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        failure = None
+        with metrics.phase("lookup", "connect"):
+            for family, kind, proto, _, sockaddr in infos:
+                sock = socket.socket(family, kind, proto)
+                try:
+                    if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                        sock.settimeout(timeout)
+                    if source_address:
+                        sock.bind(source_address)
+                    sock.connect(sockaddr)
+                    break
+                except OSError as e:
+                    failure = e
+                    sock.close()
+            else:
+                raise failure or OSError(f"getaddrinfo returned no addresses for {host}")
+        self._socket_seconds = time.perf_counter() - started
+        return sock
+
+    def getresponse(self):
+        with metrics.phase("lookup", "server"):
+            return super().getresponse()
+
+
+class _TimedHTTPSConnection(_TimedHTTPConnection, http.client.HTTPSConnection):
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        metrics.observe_phase("lookup", "tls", time.perf_counter() - started - self._socket_seconds)
+
+
+class _TimedHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_TimedHTTPConnection, req)
+
+
+class _TimedHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_TimedHTTPSConnection, req, context=self._context)
+
+
+_timed_opener = None
+
+
+def _open_url(url: str, timeout: float):
+    global _timed_opener
+    if not metrics.enabled():
+        return urllib.request.urlopen(url, timeout=timeout)
+    if _timed_opener is None:
+        _timed_opener = urllib.request.build_opener(_TimedHTTPHandler, _TimedHTTPSHandler)
+    return _timed_opener.open(url, timeout=timeout)
+
+
+def _decode_ip_info(body: bytes) -> Dict[str, Any]:
+    """
+    safe_json_loads() + _normalize_ip_info(), recording the body size, the parse
+    time and, for an {"error": ...} answer, an error of class "api".
+    """
+    metrics.bytes_read("lookup", len(body))
+    with metrics.phase("lookup", "parse"):
+        data = _normalize_ip_info(safe_json_loads(body))
+    if "error" in data:
+        metrics.error("lookup", "invalid_response" if data["error"] == "Invalid JSON response" else "api")
+    return data
+
+
+def _fetch_ip_info(ip: Optional[str], base_url: str = IPAPI_BASE_URL) -> Dict[str, Any]:
+    url = _ip_info_url(ip, base_url)
+    with metrics.phase("lookup", "total"):
+        try:
+            with _open_url(url, timeout=10) as response:
+                with metrics.phase("lookup", "read"):
+                    body = response.read()
+                return _decode_ip_info(body)
+        except Exception as e:
+            metrics.error("lookup", e)
+            return {"error": f"Failed to retrieve data: {e}"}
+
+
+# --- Bulk lookups -----------------------------------------------------------
+
+_pool_local = threading.local()
+
+
+def _pooled_connection(scheme: str, netloc: str, timeout: float) -> http.client.HTTPConnection:
+    """
+    Returns this thread's keep-alive connection for (scheme, netloc), creating it if needed.
+    Each worker thread owns its connections, so no locking is required.
+    """
+    conns = getattr(_pool_local, "conns", None)
+    if conns is None:
+        conns = _pool_local.conns = {}
+    key = (scheme, netloc)
+    conn = conns.get(key)
+    if conn is None:
+        timed = metrics.enabled()
+        if scheme == "https":
+            conn = (_TimedHTTPSConnection if timed else http.client.HTTPSConnection)(netloc, timeout=timeout)
+        else:
+            conn = (_TimedHTTPConnection if timed else http.client.HTTPConnection)(netloc, timeout=timeout)
+        conns[key] = conn
+    return conn
+
+
+def _drop_pooled_connection(scheme: str, netloc: str) -> None:
+    conns = getattr(_pool_local, "conns", {})
+    conn = conns.pop((scheme, netloc), None)
+    if conn is not None:
+        conn.close()
+
+
+def _pooled_get(url: str, timeout: float = 10) -> Tuple[int, str, bytes]:
+    """
+    GETs `url` over the calling thread's pooled connection and returns (status, reason, body).
+    A connection the server has already closed is reopened once before giving up.
+    """
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path or "/"
+    if parts.query:
+        path = f"{path}?{parts.query}"
+    headers = {"User-Agent": USER_AGENT, "Accept": "application/json", "Connection": "keep-alive"}
+    for attempt in range(2):
+        conn = _pooled_connection(parts.scheme, parts.netloc, timeout)
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            with metrics.phase("lookup", "read"):
+                body = response.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            # stale keep-alive connection: retry once on a fresh one
+            _drop_pooled_connection(parts.scheme, parts.netloc)
+            if attempt:
+                raise
+            continue
+        except Exception:
+            _drop_pooled_connection(parts.scheme, parts.netloc)
+            raise
+        if response.will_close:
+            _drop_pooled_connection(parts.scheme, parts.netloc)
+        return response.status, response.reason, body
+
+
+def _lookup_pooled(ip: str, base_url: str, timeout: float, cache: Optional["IPInfoCache"] = None) -> Dict[str, Any]:
+    """
+    Single per-IP lookup over a pooled connection; keeps the get_ip_info() error contract.
+    """
+    with metrics.phase("lookup", "total"):
+        try:
+            status, reason, body = _pooled_get(_ip_info_url(ip, base_url), timeout)
+            if status >= 400:
+                metrics.error("lookup", "rate_limited" if status == 429 else f"http_{status}")
+                data = {"error": f"Failed to retrieve data: HTTP Error {status}: {reason}"}
+            else:
+                data = _decode_ip_info(body)
+        except Exception as e:
+            metrics.error("lookup", e)
+            data = {"error": f"Failed to retrieve data: {e}"}
+    if cache is not None:
+        cache.put(_cache_key(ip), data)
+    return data
+
+
+def _resolve(resolver: "HedgedResolver", ip: str, cache: Optional["IPInfoCache"] = None) -> Dict[str, Any]:
+    """
+    _lookup_pooled() through a HedgedResolver.
+    """
+    data = resolver.lookup(ip)
+    if cache is not None and not data.get("throttled"):
+        cache.put(_cache_key(ip), data)
+    return data
+
+
+def get_ip_info_many(
+    ips: Iterable[str],
+    concurrency: int = 8,
+    ordered: bool = True,
+    base_url: str = IPAPI_BASE_URL,
+    timeout: float = 10,
+    cache: Optional["IPInfoCache"] = None,
+    offline: Optional["GeoDatabase"] = None,
+    scheduler: Optional[RequestScheduler] = None,
+    priority: int = BATCH,
+    resolver: Optional["HedgedResolver"] = None,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Looks up many addresses with a bounded pool of `concurrency` worker threads.
+    Yields (ip, data) pairs as results arrive: in input order when `ordered` is true,
+    otherwise as they complete. `data` follows the get_ip_info() contract, so a failed
+    lookup yields {"error": "..."} for that IP instead of raising.
+
+    Workers reuse keep-alive connections, and at most 2 * concurrency lookups are in
+    flight at once, so `ips` may be an arbitrarily long (lazy) iterable. Addresses found
+    in `cache` are answered without a request, and fetched results are stored in it.
+    Requests are paced by the shared scheduler (or `scheduler`) at `priority`, so a
+    batch never exceeds the provider's quotas and yields to interactive lookups.
+    With an `offline` database every address is answered locally, in input order.
+    With a providers.HedgedResolver each lookup is hedged across its providers
+    instead of going to `base_url`.
+    """
+    if offline is not None:
+        yield from offline.lookup_many(ips)
+        return
+
+    scheduler = scheduler or get_scheduler()
+    concurrency = max(1, int(concurrency))
+    window = 2 * concurrency
+    it = iter(ips)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ipinfo") as pool:
+        def submit_next():
+            for ip in it:
+                cached = cache.get(_cache_key(ip)) if cache is not None else None
+                if cached is not None:
+                    future = Future()
+                    future.set_result(cached)
+                    return ip, future
+                if resolver is not None:
+                    return ip, pool.submit(_resolve, resolver, ip, cache)
+                fetch = partial(_lookup_pooled, ip, base_url, timeout, cache)
+                return ip, pool.submit(_scheduled, scheduler, ip, base_url, priority, fetch)
+            return None
+
+        if ordered:
+            pending = deque()
+            while len(pending) < window and (item := submit_next()):
+                pending.append(item)
+            while pending:
+                ip, future = pending.popleft()
+                item = submit_next()
+                if item:
+                    pending.append(item)
+                yield ip, future.result()
+            return
+
+        in_flight = {}
+        while len(in_flight) < window and (item := submit_next()):
+            in_flight[item[1]] = item[0]
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                ip = in_flight.pop(future)
+                item = submit_next()
+                if item:
+                    in_flight[item[1]] = item[0]
+                yield ip, future.result()
+
+
+def _get_local_ipv4() -> str:
+    """
+    Determines the local IPv4 address by opening a UDP socket to a public IPv4 address.
+    This doesn't send any packets on UDP — it's a trick to learn the local address.
+    """
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Google DNS IPv4: 8.8.8.8 port 80 (UDP)
+        s.connect(("8.8.8.8", 80))
+        addr = s.getsockname()[0]
+        s.close()
+        return addr
+    except Exception:
+        return "N/A"
+
+
+def _get_local_ipv6() -> str:
+    """
+    Determines the local IPv6 address by opening a UDP IPv6 socket to a public IPv6 address.
+    If the environment doesn't support IPv6 or it's not configured, returns "N/A".
+    """
+    try:
+        s = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        # Google Public DNS IPv6:
+        s.connect(("2001:4860:4860::8888", 80))
+        addr = s.getsockname()[0]
+        s.close()
+        # Some systems return scope id e.g. "fe80::1%eth0" — keep as-is
+        return addr
+    except Exception:
+        return "N/A"
+
+
+def get_local_ips() -> Dict[str, str]:
+    """
+    Returns both local IPv4 and IPv6 addresses as a dict:
+    { "local_ipv4": "...", "local_ipv6": "..." }
+    Addresses are read from the kernel's interface list (see local_addrs), which
+    needs no default route and is cached until the interfaces change. The UDP
+    socket probes are only used when that list has nothing suitable.
+    Values are "N/A" when unavailable.
+    """
+    with metrics.phase("local_ips", "total"):
+        with metrics.phase("local_ips", "interfaces"):
+            entries = get_local_addresses()
+        ipv4 = preferred_address(entries, "IPv4")
+        if not ipv4:
+            with metrics.phase("local_ips", "probe_ipv4"):
+                ipv4 = _get_local_ipv4()
+        ipv6 = preferred_address(entries, "IPv6")
+        if not ipv6:
+            with metrics.phase("local_ips", "probe_ipv6"):
+                ipv6 = _get_local_ipv6()
+    return {"local_ipv4": ipv4, "local_ipv6": ipv6}
+
+
+if __name__ == "__main__":
+    print("Testing network.py...")
+    print("Local IPs:", get_local_ips())
+    print("Interfaces:", get_local_addresses())
+    data = get_ip_info()
+    import pprint
+
+    pprint.pprint(data)
@@ -0,0 +1,225 @@
+import asyncio
+import socket
+import ssl
+import time
+import urllib.parse
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+import metrics
+from network import IPAPI_BASE_URL, USER_AGENT, _cache_key, _decode_ip_info, _ip_info_url, get_local_ips
+from scheduler import INTERACTIVE, get_scheduler
+
+if TYPE_CHECKING:
+    from ip_cache import IPInfoCache
+
+_FAMILIES = {"IPv4": socket.AF_INET, "IPv6": socket.AF_INET6}
+
+
+async def _read_response(reader: asyncio.StreamReader) -> Tuple[int, str, bytes]:
+    with metrics.phase("lookup", "server"):
+        status_line = await reader.readline()
+    with metrics.phase("lookup", "read"):
+        return await _read_rest(reader, status_line)
+
+
+async def _read_rest(reader: asyncio.StreamReader, status_line: bytes) -> Tuple[int, str, bytes]:
+    parts = status_line.decode("latin-1").split(" ", 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+        raise ConnectionError(f"malformed status line: {status_line!r}")
+    status, reason = int(parts[1]), parts[2].strip() if len(parts) > 2 else ""
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                break
+            body += await reader.readexactly(size)
+            await reader.readline()
+        return status, reason, bytes(body)
+    if "content-length" in headers:
+        return status, reason, await reader.readexactly(int(headers["content-length"]))
+    return status, reason, await reader.read()
+
+
+class _TLSStreamProtocol(asyncio.StreamReaderProtocol):
+    """
+    StreamReaderProtocol for a connection upgraded with loop.start_tls(): it was made
+    over plain TCP, so it would not know to let the SSL layer close on EOF.
+    """
+
+    def eof_received(self) -> bool:
+        super().eof_received()
+        return False
+
+
+async def _open_connection(
+    host: str, port: int, ssl_context: Optional[ssl.SSLContext], family: int
+) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """
+    asyncio.open_connection(); while metrics are enabled, DNS, TCP connect and the
+    TLS handshake are done as separate, timed steps.
+    """
+    server_hostname = host if ssl_context else None
+    if not metrics.enabled():
+        return await asyncio.open_connection(host, port, ssl=ssl_context, family=family, server_hostname=server_hostname)
+    loop = asyncio.get_running_loop()
+    with metrics.phase("lookup", "dns"):
+        infos = await loop.getaddrinfo(host, port, family=family, type=socket.SOCK_STREAM)
+    failure = None
+    reader = asyncio.StreamReader()
+    protocol_class = asyncio.StreamReaderProtocol if ssl_context is None else _TLSStreamProtocol
+    with metrics.phase("lookup", "connect"):
+        for info_family, _, _, _, sockaddr in infos:
+            try:
+                transport, protocol = await loop.create_connection(
+                    lambda: protocol_class(reader), sockaddr[0], port, family=info_family
+                )
+                break
+            except OSError as e:
+                failure = e
+        else:
+            raise failure or OSError(f"getaddrinfo returned no addresses for {host}")
+    if ssl_context is not None:
+        # loop.start_tls() rather than StreamWriter.start_tls(), which needs Python 3.11
+        with metrics.phase("lookup", "tls"):
+            transport = await loop.start_tls(transport, protocol, ssl_context, server_hostname=server_hostname)
+    return reader, asyncio.StreamWriter(transport, protocol, reader, loop)
+
+
+async def http_get(url: str, family: int = 0, timeout: float = 10) -> Tuple[int, str, bytes]:
+    """
+    Minimal asyncio HTTP/1.1 GET returning (status, reason, body).
+    `family` pins the connection to IPv4 (AF_INET) or IPv6 (AF_INET6), which is how the
+    public address of each stack is discovered.
+    """
+    parts = urllib.parse.urlsplit(url)
+    host = parts.hostname
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    ssl_context = ssl.create_default_context() if parts.scheme == "https" else None
+
+    async def exchange():
+        reader, writer = await _open_connection(host, port, ssl_context, family)
+        try:
+            request = (
+                f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nUser-Agent: {USER_AGENT}\r\n"
+                f"Accept: application/json\r\nConnection: close\r\n\r\n"
+            )
+            writer.write(request.encode("latin-1"))
+            await writer.drain()
+            return await _read_response(reader)
+        finally:
+            writer.close()
+
+    return await asyncio.wait_for(exchange(), timeout)
+
+
+async def get_ip_info_async(
+    ip: Optional[str] = None,
+    family: str = "any",
+    base_url: str = IPAPI_BASE_URL,
+    timeout: float = 10,
+) -> Dict[str, Any]:
+    """
+    Async get_ip_info(). With family="IPv4" or "IPv6" the request is sent over that
+    stack only, so the answer is the public address of that family.
+    Always returns a dictionary; on any error returns {"error": "..."}.
+    """
+    with metrics.phase("lookup", "total"):
+        try:
+            status, reason, body = await http_get(_ip_info_url(ip, base_url), _FAMILIES.get(family, 0), timeout)
+            if status >= 400:
+                metrics.error("lookup", "rate_limited" if status == 429 else f"http_{status}")
+                return {"error": f"Failed to retrieve data: HTTP Error {status}: {reason}"}
+            return _decode_ip_info(body)
+        except asyncio.TimeoutError as e:
+            metrics.error("lookup", e)
+            return {"error": f"Failed to retrieve data: timed out after {timeout:g}s"}
+        except Exception as e:
+            metrics.error("lookup", e)
+            return {"error": f"Failed to retrieve data: {e}"}
+
+
+async def get_local_ips_async(timeout: float = 1.0) -> Dict[str, str]:
+    """
+    Async get_local_ips(); falls back to "N/A" values if the probe misses its deadline.
+    """
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(get_local_ips), timeout)
+    except Exception:
+        return {"local_ipv4": "N/A", "local_ipv6": "N/A"}
+
+
+async def discover_async(
+    base_url: str = IPAPI_BASE_URL,
+    timeout: float = 10,
+    local_timeout: float = 1.0,
+    cache: Optional["IPInfoCache"] = None,
+    ttl: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Runs the local address probe and the public IPv4 and IPv6 lookups concurrently,
+    each under its own deadline, so the wall-clock time is that of the slowest step
+    rather than the sum. Returns the local fields, `public_ipv4` / `public_ipv6`, and
+    the geolocation of whichever family answered (IPv4 preferred). Steps that failed
+    are listed under "errors"; if both public lookups failed the result also carries
+    "error", as get_ip_info() would. Cached public answers skip their step (only
+    successful ones are cached); the others take an INTERACTIVE token from the
+    shared request scheduler first.
+    """
+    started = time.perf_counter()
+
+    async def public(family: str) -> Dict[str, Any]:
+        key = f"{_cache_key(None)}:{family}"
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        host = urllib.parse.urlsplit(base_url).netloc
+        # one deadline covers both the wait for a request slot and the request itself
+        deadline = time.monotonic() + timeout
+        if not await asyncio.to_thread(get_scheduler().acquire, host, INTERACTIVE, timeout):
+            return {"error": f"Failed to retrieve data: no request slot for {host} within {timeout}s",
+                    "throttled": True}
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return {"error": f"Failed to retrieve data: timed out after {timeout}s"}
+        data = await get_ip_info_async(family=family, base_url=base_url, timeout=remaining)
+        # a failure is not cached, so asking again (e.g. the UI button) really retries
+        if cache is not None and "error" not in data:
+            cache.put(key, data, ttl)
+        return data
+
+    local, ipv4, ipv6 = await asyncio.gather(get_local_ips_async(local_timeout), public("IPv4"), public("IPv6"))
+
+    merged: Dict[str, Any] = {}
+    errors = {}
+    for family, data in (("IPv6", ipv6), ("IPv4", ipv4)):
+        if "error" in data:
+            errors[family] = data["error"]
+        else:
+            merged.update(data)
+            merged[f"public_{family.lower()}"] = data.get("ip", "N/A")
+    merged.update(local)
+    if errors:
+        merged["errors"] = errors
+        if len(errors) == 2:
+            merged["error"] = errors["IPv4"]
+    elapsed = time.perf_counter() - started
+    metrics.observe_phase("discover", "total", elapsed)
+    merged["elapsed"] = round(elapsed, 3)
+    return merged
+
+
+def discover(**kwargs) -> Dict[str, Any]:
+    """
+    Blocking wrapper around discover_async() for threads without an event loop.
+    """
+    return asyncio.run(discover_async(**kwargs))
@@ -0,0 +1,463 @@
+import ipaddress
+import mmap
+import os
+import re
+import socket
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+MAGIC = b"VLSMPFX\x01"
+# magic, nodes, records, strings, distinct ASNs, announced prefixes, IPv4 root, IPv6 root
+_HEADER = struct.Struct("<8s7I")
+_MASK64 = (1 << 64) - 1
+_WIDTHS = {4: 32, 6: 128}
+
+# "AS13335", "13335", CAIDA multi-origin "13335_209242" and AS-sets "13335,209242": the first ASN wins
+_ASN = re.compile(r"(?:AS)?(\d+)", re.IGNORECASE)
+_FIELD_SEPARATORS = re.compile(r"[\s,]+")
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _little_endian(values: array) -> array:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def _parse_prefix(text: str) -> Tuple[int, int, int]:
+    """
+    Returns (version, network, length) for "addr/len"; host bits are cleared.
+    """
+    address, _, length = text.partition("/")
+    if ":" in address:
+        version, raw = 6, socket.inet_pton(socket.AF_INET6, address)
+    else:
+        version, raw = 4, socket.inet_pton(socket.AF_INET, address)
+    width = _WIDTHS[version]
+    plen = int(length) if length else width
+    if not 0 <= plen <= width:
+        raise ValueError(f"bad prefix length in {text!r}")
+    network = int.from_bytes(raw, "big") & ~((1 << (width - plen)) - 1)
+    return version, network, plen
+
+
+def parse_line(line: str) -> Optional[Tuple[str, int, str]]:
+    """
+    Parses one routing-table line into (prefix, ASN, org), or None for blank and
+    comment lines. Accepted layouts, whitespace- or comma-separated:
+
+        1.0.0.0/24 AS13335 Cloudflare, Inc.     prefix, ASN, optional org
+        1.0.0.0    24      13335                CAIDA RouteViews pfx2as
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    comma_separated = "," in line.split(None, 1)[0]
+    fields = _FIELD_SEPARATORS.split(line, 2) if comma_separated else line.split(None, 2)
+    if "/" not in fields[0]:
+        fields = _FIELD_SEPARATORS.split(line, 3) if comma_separated else line.split(None, 3)
+        if len(fields) < 3:
+            raise ValueError(f"expected prefix and ASN: {line!r}")
+        fields = [f"{fields[0]}/{fields[1]}"] + fields[2:]
+    if len(fields) < 2:
+        raise ValueError(f"expected prefix and ASN: {line!r}")
+    match = _ASN.match(fields[1])
+    if match is None:
+        raise ValueError(f"bad ASN in {line!r}")
+    return fields[0], int(match.group(1)), fields[2].strip() if len(fields) > 2 else ""
+
+
+class _Builder:
+    """
+    Node columns of the trie under construction. Node 0 is the "no child" sentinel.
+    """
+
+    def __init__(self):
+        self.keys = [0]
+        self.plens = [0]
+        self.children = ([0], [0])
+        self.values = [0]
+
+    def add(self, key: int, plen: int, value: int = 0) -> int:
+        self.keys.append(key)
+        self.plens.append(plen)
+        self.children[0].append(0)
+        self.children[1].append(0)
+        self.values.append(value)
+        return len(self.keys) - 1
+
+    def build_family(self, routes: Dict[int, int], width: int) -> int:
+        """
+        Bulk-builds the path-compressed trie of one address family and returns its root.
+
+        `routes` maps network << 8 | length to a value. In ascending key order the
+        prefixes come in pre-order of the trie, so each one is attached to the current
+        rightmost path: pop down to the longest common prefix with the previous one,
+        insert a branching node there if none exists, then hang the new prefix below it.
+        """
+        keys, plens, values = self.keys, self.plens, self.values
+        zero, one = self.children
+        root = self.add(0, 0)
+        stack = [root]
+        previous, previous_length = 0, 0
+        for packed in sorted(routes):
+            network, length = packed >> 8, packed & 0xFF
+            common = min(width - (network ^ previous).bit_length(), length, previous_length)
+            last = 0
+            while plens[stack[-1]] > common:
+                last = stack.pop()
+            top = stack[-1]
+            if last and plens[top] < common:
+                glue = len(keys)
+                keys.append(network & ~((1 << (width - common)) - 1))
+                plens.append(common)
+                values.append(0)
+                if (keys[last] >> (width - 1 - common)) & 1:
+                    zero.append(0)
+                    one.append(last)
+                else:
+                    zero.append(last)
+                    one.append(0)
+                (one if (network >> (width - 1 - plens[top])) & 1 else zero)[top] = glue
+                stack.append(glue)
+                top = glue
+            if plens[top] == length:
+                values[top] = routes[packed]  # the default route lands on the root
+            else:
+                node = len(keys)
+                keys.append(network)
+                plens.append(length)
+                values.append(routes[packed])
+                zero.append(0)
+                one.append(0)
+                (one if (network >> (width - 1 - plens[top])) & 1 else zero)[top] = node
+                stack.append(node)
+            previous, previous_length = network, length
+        return root
+
+    def announced(self, root: int) -> Iterator[int]:
+        """
+        Nodes carrying a value below `root`, in address order.
+        """
+        zero, one = self.children
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if self.values[node]:
+                yield node
+            if one[node]:
+                stack.append(one[node])
+            if zero[node]:
+                stack.append(zero[node])
+
+
+def build_trie(source_path: str, output_path: str) -> Dict[str, int]:
+    """
+    Imports a prefix -> ASN table (see parse_line() for the line formats; a later
+    line for the same prefix replaces an earlier one) into the compact binary
+    format read by PrefixTrie. Identical (ASN, org) records and org strings are
+    stored once. The file is written next to `output_path` and renamed into place.
+    Returns counts of what was written.
+    """
+    strings: Dict[str, int] = {"": 0}
+    records: Dict[Tuple[int, int], int] = {}
+    families: Dict[int, Dict[int, int]] = {4: {}, 6: {}}
+    with open(source_path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            parsed = parse_line(line)
+            if parsed is None:
+                continue
+            prefix, asn, org = parsed
+            version, network, plen = _parse_prefix(prefix)
+            record = records.setdefault((asn, strings.setdefault(org, len(strings))), len(records))
+            families[version][network << 8 | plen] = record + 1
+
+    builder = _Builder()
+    roots = {version: builder.build_family(routes, _WIDTHS[version]) for version, routes in families.items()}
+
+    record_asns = [asn for asn, _ in records]
+    announced = [node for version in (4, 6) for node in builder.announced(roots[version])]
+    node_asns = [record_asns[builder.values[node] - 1] for node in announced]
+    # stable, so each ASN's prefixes stay in address order
+    order = sorted(range(len(announced)), key=node_asns.__getitem__)
+    announced = [announced[i] for i in order]
+    asn_keys, asn_offsets = array("I"), array("I")
+    for i, j in enumerate(order):
+        asn = node_asns[j]
+        if not asn_keys or asn_keys[-1] != asn:
+            asn_keys.append(asn)
+            asn_offsets.append(i)
+    asn_offsets.append(len(announced))
+
+    blob = bytearray()
+    string_offsets = array("I", [0])
+    for value in strings:
+        blob += value.encode("utf-8")
+        string_offsets.append(len(blob))
+
+    sections = [
+        array("Q", (key >> 64 for key in builder.keys)),
+        array("Q", (key & _MASK64 for key in builder.keys)),
+        array("I", builder.children[0]),
+        array("I", builder.children[1]),
+        array("I", builder.values),
+        array("B", builder.plens),
+        array("I", record_asns),
+        array("I", (org for _, org in records)),
+        asn_keys,
+        asn_offsets,
+        array("I", announced),
+        string_offsets,
+        bytes(blob),
+    ]
+    tmp_path = f"{output_path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as out:
+        out.write(_HEADER.pack(MAGIC, len(builder.keys), len(records), len(strings), len(asn_keys),
+                               len(announced), roots[4], roots[6]))
+        for section in sections:
+            out.write(b"\0" * (_align(out.tell()) - out.tell()))
+            out.write(section if isinstance(section, bytes) else _little_endian(section).tobytes())
+    os.replace(tmp_path, output_path)
+    return {
+        "ipv4_prefixes": len(families[4]),
+        "ipv6_prefixes": len(families[6]),
+        "nodes": len(builder.keys) - 1,
+        "records": len(records),
+        "asns": len(asn_keys),
+    }
+
+
+class PrefixTrie:
+    """
+    Read-only, memory-mapped path-compressed (Patricia) trie of announced prefixes,
+    from a file written by build_trie().
+
+    Opening only maps the file, so startup does not depend on the table size. Each
+    node stores its whole prefix, so a longest-prefix match walks at most one node
+    per branching point and checks the skipped bits with a single XOR; the deepest
+    node carrying a route is the answer. Prefixes are also indexed by ASN.
+    """
+
+    def __init__(self, path: str):
+        if sys.byteorder != "little":
+            raise ValueError("PrefixTrie requires a little-endian host")
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = self._view = memoryview(self._mmap)
+        magic, nodes, nrecords, nstrings, nasns, nannounced, root4, root6 = _HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a VLSM prefix table")
+        self.prefixes = nannounced
+        self._roots = {4: root4, 6: root6}
+        offset = _HEADER.size
+        layout = [("Q", nodes)] * 2 + [("I", nodes)] * 3 + [("B", nodes)] + [("I", nrecords)] * 2 + [
+            ("I", nasns), ("I", nasns + 1), ("I", nannounced), ("I", nstrings + 1)
+        ]
+        columns = []
+        for typecode, count in layout:
+            offset = _align(offset)
+            size = count * struct.calcsize(typecode)
+            columns.append(view[offset:offset + size].cast(typecode))
+            offset += size
+        (self._key_hi, self._key_lo, self._zero, self._one, self._values, self._plens,
+         self._record_asns, self._record_orgs, self._asn_keys, self._asn_offsets, self._by_asn,
+         self._str_offsets) = columns
+        self._strings = view[_align(offset):]
+
+    def _string(self, index: int) -> str:
+        return str(self._strings[self._str_offsets[index]:self._str_offsets[index + 1]], "utf-8")
+
+    def _key(self, node: int, version: int) -> int:
+        if version == 4:
+            return self._key_lo[node]
+        return self._key_hi[node] << 64 | self._key_lo[node]
+
+    def _route(self, node: int, version: int) -> Dict[str, Any]:
+        width = _WIDTHS[version]
+        family = socket.AF_INET if version == 4 else socket.AF_INET6
+        address = socket.inet_ntop(family, self._key(node, version).to_bytes(width // 8, "big"))
+        record = self._values[node] - 1
+        return {
+            "network": f"{address}/{self._plens[node]}",
+            "asn": f"AS{self._record_asns[record]}",
+            "org": self._string(self._record_orgs[record]),
+        }
+
+    def find(self, ip: int, version: int = 4) -> Optional[int]:
+        """
+        Returns the node of the longest prefix covering integer address `ip`, or None.
+        """
+        width = _WIDTHS[version]
+        key_lo, key_hi, plens, values, zero, one = (
+            self._key_lo, self._key_hi, self._plens, self._values, self._zero, self._one
+        )
+        best = None
+        node = self._roots[version]
+        while node:
+            plen = plens[node]
+            key = key_lo[node] if version == 4 else key_hi[node] << 64 | key_lo[node]
+            if (ip ^ key) >> (width - plen):
+                break
+            if values[node]:
+                best = node
+            if plen == width:
+                break
+            node = one[node] if (ip >> (width - 1 - plen)) & 1 else zero[node]
+        return best
+
+    def covering(self, ip: int, version: int = 4) -> List[Tuple[int, int, int]]:
+        """
+        (network, length, node) of every announced prefix covering integer address
+        `ip`, shortest first; the last one is what find() returns.
+        """
+        width = _WIDTHS[version]
+        routes = []
+        node = self._roots[version]
+        while node:
+            plen = self._plens[node]
+            key = self._key(node, version)
+            if (ip ^ key) >> (width - plen):
+                break
+            if self._values[node]:
+                routes.append((key, plen, node))
+            if plen == width:
+                break
+            node = self._one[node] if (ip >> (width - 1 - plen)) & 1 else self._zero[node]
+        return routes
+
+    def lookup(self, ip: str) -> Dict[str, Any]:
+        """
+        The announcing prefix, ASN and org of `ip`: {"network", "asn", "org"}.
+        Follows the get_ip_info() contract: always a dict, {"error": "..."} on a miss.
+        """
+        try:
+            if ":" in ip:
+                version, raw = 6, socket.inet_pton(socket.AF_INET6, ip.split("%")[0])
+            else:
+                version, raw = 4, socket.inet_pton(socket.AF_INET, ip)
+        except (OSError, ValueError):
+            return {"error": f"Invalid IP address: {ip}"}
+        node = self.find(int.from_bytes(raw, "big"), version)
+        if node is None:
+            return {"error": f"No announced prefix covers {ip}"}
+        return self._route(node, version)
+
+    def lookup_many(self, ips: Iterable[str]):
+        for ip in ips:
+            yield ip, self.lookup(ip)
+
+    def annotate(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Sets the "asn" and "network" (and "org", when the table has one) of a
+        get_ip_info()-style dict from the routing table, in place. Results without a
+        usable public address, or whose address is not announced, are left as they are.
+        """
+        ip = data.get("public_ip") or data.get("ip")
+        if not ip or ip == "N/A":
+            return data
+        route = self.lookup(ip)
+        if "error" not in route:
+            data["asn"] = route["asn"]
+            data["network"] = route["network"]
+            if route["org"]:
+                data["org"] = route["org"]
+        return data
+
+    def covered(self, prefix: str) -> List[Dict[str, Any]]:
+        """
+        Every announced prefix equal to or more specific than `prefix`, in address order.
+        """
+        network = ipaddress.ip_network(prefix, strict=False)
+        version, width = network.version, network.max_prefixlen
+        target, length = int(network.network_address), network.prefixlen
+        node = self._roots[version]
+        while node and self._plens[node] < length:
+            plen = self._plens[node]
+            if (target ^ self._key(node, version)) >> (width - plen):
+                return []
+            node = (self._one if (target >> (width - 1 - plen)) & 1 else self._zero)[node]
+        if not node or (target ^ self._key(node, version)) >> (width - length):
+            return []
+        routes = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if self._values[node]:
+                routes.append(self._route(node, version))
+            if self._one[node]:
+                stack.append(self._one[node])
+            if self._zero[node]:
+                stack.append(self._zero[node])
+        return routes
+
+    def announced_by(self, asn: Any) -> List[Dict[str, Any]]:
+        """
+        Every prefix originated by `asn` ("AS13335" or 13335): IPv4 first, each in address order.
+        """
+        match = _ASN.match(str(asn).strip())
+        if match is None:
+            raise ValueError(f"bad ASN: {asn!r}")
+        number = int(match.group(1))
+        i = bisect_left(self._asn_keys, number)
+        if i == len(self._asn_keys) or self._asn_keys[i] != number:
+            return []
+        v6_root = self._roots[6]
+        # the IPv4 trie is built first, so exactly the nodes from the IPv6 root on are IPv6
+        return [
+            self._route(node, 6 if node >= v6_root else 4)
+            for node in self._by_asn[self._asn_offsets[i]:self._asn_offsets[i + 1]]
+        ]
+
+    def close(self) -> None:
+        for name in ("_key_hi", "_key_lo", "_zero", "_one", "_values", "_plens", "_record_asns", "_record_orgs",
+                     "_asn_keys", "_asn_offsets", "_by_asn", "_str_offsets", "_strings", "_view"):
+            getattr(self, name).release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import pprint
+
+    parser = argparse.ArgumentParser(description="Build or query a prefix -> ASN routing table.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="import a prefix -> ASN table (e.g. a RouteViews pfx2as dump)")
+    build.add_argument("source_path")
+    build.add_argument("output_path")
+    query = sub.add_parser("lookup", help="longest-prefix match of addresses")
+    query.add_argument("table")
+    query.add_argument("ips", nargs="+")
+    under = sub.add_parser("covered", help="announced prefixes inside a prefix")
+    under.add_argument("table")
+    under.add_argument("prefix")
+    origin = sub.add_parser("asn", help="prefixes announced by an ASN")
+    origin.add_argument("table")
+    origin.add_argument("asn")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        pprint.pprint(build_trie(args.source_path, args.output_path))
+    else:
+        with PrefixTrie(args.table) as trie:
+            if args.command == "lookup":
+                for ip, route in trie.lookup_many(args.ips):
+                    pprint.pprint({"ip": ip, **route})
+            else:
+                routes = trie.covered(args.prefix) if args.command == "covered" else trie.announced_by(args.asn)
+                for route in routes:
+                    print(route["network"], route["asn"], route["org"])
@@ -0,0 +1,366 @@
+import math
+import threading
+import time
+import urllib.parse
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+from network import _is_rate_limited, _normalize_ip_info, _pooled_get, safe_json_loads
+from scheduler import INTERACTIVE, get_scheduler
+
+
+def _version(ip: str) -> str:
+    return "IPv6" if ":" in (ip or "") else "IPv4"
+
+
+def normalize_ipapi(data: Dict[str, Any]) -> Dict[str, Any]:
+    return _normalize_ip_info(data)
+
+
+def normalize_ipwhois(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    ipwho.is: {"success": bool, "type", "country", "connection": {"asn", "org"}, "timezone": {"id"}, ...}
+    """
+    if data.get("success") is False:
+        return {"error": f"Failed to retrieve data: {data.get('message', 'unknown error')}"}
+    connection = data.get("connection") or {}
+    timezone = data.get("timezone")
+    ip = data.get("ip", "N/A")
+    return {
+        "ip": ip,
+        "public_ip": ip,
+        "version": data.get("type") or _version(ip),
+        "city": data.get("city", "N/A"),
+        "region": data.get("region", "N/A"),
+        "country_name": data.get("country", "N/A"),
+        "country_code": data.get("country_code", ""),
+        "latitude": data.get("latitude"),
+        "longitude": data.get("longitude"),
+        "timezone": timezone.get("id", "N/A") if isinstance(timezone, dict) else (timezone or "N/A"),
+        "org": connection.get("org") or connection.get("isp", "N/A"),
+        "asn": f"AS{connection['asn']}" if connection.get("asn") else "N/A",
+    }
+
+
+def normalize_ip_api(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    ip-api.com: {"status": "success", "query", "countryCode", "regionName", "lat", "lon", "as": "AS15169 Google LLC", ...}
+    """
+    if data.get("status") != "success":
+        return {"error": f"Failed to retrieve data: {data.get('message', 'unknown error')}"}
+    ip = data.get("query", "N/A")
+    asn = (data.get("as") or "").split(" ", 1)[0]
+    return {
+        "ip": ip,
+        "public_ip": ip,
+        "version": _version(ip),
+        "city": data.get("city", "N/A"),
+        "region": data.get("regionName", "N/A"),
+        "country_name": data.get("country", "N/A"),
+        "country_code": data.get("countryCode", ""),
+        "latitude": data.get("lat"),
+        "longitude": data.get("lon"),
+        "timezone": data.get("timezone", "N/A"),
+        "org": data.get("org") or data.get("isp", "N/A"),
+        "asn": asn or "N/A",
+    }
+
+
+def normalize_ipinfo(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    ipinfo.io: {"ip", "city", "region", "country": "US", "loc": "lat,lon", "org": "AS15169 Google LLC", ...}
+    """
+    if "error" in data:
+        error = data["error"]
+        message = error.get("message", error) if isinstance(error, dict) else error
+        return {"error": f"Failed to retrieve data: {message}"}
+    ip = data.get("ip", "N/A")
+    latitude = longitude = None
+    if data.get("loc"):
+        lat, _, lon = data["loc"].partition(",")
+        latitude, longitude = float(lat), float(lon)
+    asn, _, org = (data.get("org") or "").partition(" ")
+    if not asn.startswith("AS"):
+        asn, org = "N/A", data.get("org", "N/A")
+    return {
+        "ip": ip,
+        "public_ip": ip,
+        "version": _version(ip),
+        "city": data.get("city", "N/A"),
+        "region": data.get("region", "N/A"),
+        # ipinfo only gives the ISO code
+        "country_name": "N/A",
+        "country_code": data.get("country", ""),
+        "latitude": latitude,
+        "longitude": longitude,
+        "timezone": data.get("timezone", "N/A"),
+        "org": org or "N/A",
+        "asn": asn,
+    }
+
+
+class Provider:
+    """
+    One geolocation backend: where to send a lookup and how to normalize its answer
+    into the get_ip_info() key schema. `url_template` contains "{ip}"; `self_url` is
+    used to look up the caller's own address.
+    """
+
+    def __init__(self, name: str, url_template: str, self_url: str,
+                 normalize: Callable[[Dict[str, Any]], Dict[str, Any]], timeout: float = 10):
+        self.name = name
+        self.url_template = url_template
+        self.self_url = self_url
+        self.normalize = normalize
+        self.timeout = timeout
+
+    def url(self, ip: Optional[str] = None) -> str:
+        if ip is None:
+            return self.self_url
+        return self.url_template.format(ip=urllib.parse.quote(ip.strip(), safe=""))
+
+    def fetch(self, ip: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Looks `ip` up over a pooled connection. Always returns a dict; {"error": ...} on failure.
+        If the provider's quota in the shared scheduler has no token left, nothing is
+        sent and the error carries "throttled": True.
+        """
+        url = self.url(ip)
+        host = urllib.parse.urlsplit(url).netloc
+        scheduler = get_scheduler()
+        if not scheduler.acquire(host, INTERACTIVE, timeout=0):
+            return {"error": f"Failed to retrieve data: local rate limit reached for {self.name}", "throttled": True}
+        try:
+            status, reason, body = _pooled_get(url, self.timeout)
+            if status >= 400:
+                data = {"error": f"Failed to retrieve data: HTTP Error {status}: {reason}"}
+            else:
+                data = self.normalize(safe_json_loads(body))
+        except Exception as e:
+            return {"error": f"Failed to retrieve data: {e}"}
+        if "error" not in data:
+            data["provider"] = self.name
+        elif _is_rate_limited(data):
+            scheduler.penalize(host)
+        return data
+
+    def __repr__(self) -> str:
+        return f"<Provider {self.name}>"
+
+
+def default_providers() -> List[Provider]:
+    return [
+        Provider("ipapi.co", "https://ipapi.co/{ip}/json/", "https://ipapi.co/json/", normalize_ipapi),
+        Provider("ipwho.is", "https://ipwho.is/{ip}", "https://ipwho.is/", normalize_ipwhois),
+        Provider("ipinfo.io", "https://ipinfo.io/{ip}/json", "https://ipinfo.io/json", normalize_ipinfo),
+        Provider("ip-api.com", "http://ip-api.com/json/{ip}", "http://ip-api.com/json/", normalize_ip_api),
+    ]
+
+
+class ProviderStats:
+    """
+    Rolling latency and outcome window for one provider, plus its circuit breaker.
+
+    The breaker opens after `failure_threshold` consecutive failures and ejects the
+    provider for `cooldown` seconds. After that a single trial request is let
+    through (half-open): success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, window: int = 200, failure_threshold: int = 5, cooldown: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            self.outcomes.append(ok)
+            self._trial_in_flight = False
+            if ok:
+                self.latencies.append(latency)
+                self.consecutive_failures = 0
+                self.opened_at = None
+            else:
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= self.failure_threshold or self.opened_at is not None:
+                    self.opened_at = self._clock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._clock() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """
+        Whether a request may be sent now; claims the single half-open trial slot.
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def cancel_trial(self) -> None:
+        """
+        Gives back a half-open trial slot from allow() when the request was never sent.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, max(0, math.ceil(q * len(samples)) - 1))]
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self.outcomes:
+                return 0.0
+            return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "requests": len(self.outcomes),
+            "error_rate": round(self.error_rate, 4),
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class HedgedResolver:
+    """
+    Looks addresses up across several providers with hedged requests.
+
+    Healthy providers are ranked by observed p95 latency and error rate. The best
+    one is asked first; if it has not answered within its own p95 (clamped to
+    [min_hedge, max_hedge], `initial_hedge` until it has samples) the next one is
+    asked too, and so on. The first successful answer wins; a failed answer
+    immediately hedges to the next provider. Slower requests finish in the
+    background and still feed the statistics, and providers whose circuit breaker
+    is open are skipped, so tail latency is bounded by the fastest healthy source.
+    """
+
+    def __init__(self, providers: Optional[List[Provider]] = None, initial_hedge: float = 1.0,
+                 min_hedge: float = 0.05, max_hedge: float = 3.0, max_workers: int = 16,
+                 failure_threshold: int = 5, cooldown: float = 30.0):
+        self.providers = providers if providers is not None else default_providers()
+        self.initial_hedge = initial_hedge
+        self.min_hedge = min_hedge
+        self.max_hedge = max_hedge
+        self.stats = {
+            provider.name: ProviderStats(failure_threshold=failure_threshold, cooldown=cooldown)
+            for provider in self.providers
+        }
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def _hedge_delay(self, provider: Provider) -> float:
+        p95 = self.stats[provider.name].percentile(0.95)
+        if p95 is None:
+            return self.initial_hedge
+        return min(self.max_hedge, max(self.min_hedge, p95))
+
+    def ranked(self) -> List[Provider]:
+        """
+        Providers whose breaker is not open, best first.
+        """
+        def score(provider):
+            stats = self.stats[provider.name]
+            p95 = stats.percentile(0.95)
+            return (stats.error_rate > 0.5, p95 if p95 is not None else self.initial_hedge)
+
+        return sorted((p for p in self.providers if self.stats[p.name].state != "open"), key=score)
+
+    def _call(self, provider: Provider, ip: Optional[str]) -> Dict[str, Any]:
+        started = time.monotonic()
+        data = provider.fetch(ip)
+        if data.get("throttled"):
+            # being skipped for our own quota says nothing about the provider's health,
+            # but a half-open trial that never went out must not hold the slot
+            self.stats[provider.name].cancel_trial()
+        else:
+            self.stats[provider.name].record(time.monotonic() - started, "error" not in data)
+        return data
+
+    def lookup(self, ip: Optional[str] = None, timeout: float = 15) -> Dict[str, Any]:
+        """
+        Hedged lookup of `ip` (or the caller's own address).
+        Always returns a dict; {"error": ...} if every provider failed or `timeout` passed.
+        """
+        deadline = time.monotonic() + timeout
+        candidates = deque(self.ranked())
+        in_flight = {}
+        errors = []
+
+        def launch_next() -> Optional[Provider]:
+            while candidates:
+                provider = candidates.popleft()
+                if self.stats[provider.name].allow():
+                    in_flight[self._pool.submit(self._call, provider, ip)] = provider
+                    return provider
+            return None
+
+        current = launch_next()
+        while in_flight:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                errors.append(f"timed out after {timeout}s")
+                break
+            hedge_in = self._hedge_delay(current) if candidates else remaining
+            done, _ = wait(in_flight, timeout=min(hedge_in, remaining), return_when=FIRST_COMPLETED)
+            if not done:
+                current = launch_next() or current
+                continue
+            for future in done:
+                provider = in_flight.pop(future)
+                data = future.result()
+                if "error" not in data:
+                    return data
+                errors.append(f"{provider.name}: {data['error']}")
+                # fail over at once, even while slower requests are still pending
+                current = launch_next() or current
+
+        if not errors:
+            errors.append("no healthy provider available")
+        return {"error": "All providers failed: " + "; ".join(errors)}
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per-provider rolling statistics and breaker state.
+        """
+        return {name: stats.snapshot() for name, stats in self.stats.items()}
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+
+
+_default_resolver: Optional[HedgedResolver] = None
+_default_lock = threading.Lock()
+
+
+def lookup(ip: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Hedged multi-provider lookup through a shared resolver over default_providers().
+    """
+    global _default_resolver
+    with _default_lock:
+        if _default_resolver is None:
+            _default_resolver = HedgedResolver()
+    return _default_resolver.lookup(ip)
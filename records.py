@@ -0,0 +1,391 @@
+import csv
+import json
+import math
+import re
+import socket
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from network import RECORD_FIELDS
+
+# "United States (US)" as produced by network.to_record()
+_COUNTRY_WITH_CODE = re.compile(r"^(.*) \(([A-Z]{2})\)$")
+_MISSING = (None, "", "N/A")
+
+# Interned string attributes of IPRecord; IPRecordBatch dictionary-encodes the same set
+STRING_FIELDS = ("city", "region", "country_name", "country_code", "timezone", "org", "asn", "error")
+
+
+def _intern(value: Any) -> Optional[str]:
+    if value in _MISSING:
+        return None
+    return sys.intern(str(value))
+
+
+def _coordinate(value: Any) -> Optional[float]:
+    if value in _MISSING:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+
+def parse_address(text: Any) -> Tuple[int, Optional[int], Optional[str]]:
+    """
+    (version, integer, zone) of an address string; (0, None, None) if it is missing or invalid.
+    """
+    if text in _MISSING:
+        return 0, None, None
+    address, _, zone = str(text).strip().partition("%")
+    try:
+        if ":" in address:
+            return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, address), "big"), sys.intern(zone) if zone else None
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, address), "big"), None
+    except OSError:
+        return 0, None, None
+
+
+def format_address(version: int, value: Optional[int], zone: Optional[str] = None) -> str:
+    if value is None or not version:
+        return "N/A"
+    if version == 4:
+        return socket.inet_ntoa(value.to_bytes(4, "big"))
+    text = socket.inet_ntop(socket.AF_INET6, value.to_bytes(16, "big"))
+    return f"{text}%{zone}" if zone else text
+
+
+def _country(data: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    name = data.get("country_name")
+    code = data.get("country_code")
+    if name in _MISSING:
+        name = data.get("country")
+        match = _COUNTRY_WITH_CODE.match(name) if isinstance(name, str) else None
+        if match:
+            name, code = match.group(1), code or match.group(2)
+    return _intern(name), _intern(code)
+
+
+class IPRecord:
+    """
+    One normalized lookup result.
+
+    Built once from any of the dict shapes in use (ipapi.co payloads, provider
+    results, discover() output or RECORD_FIELDS records) so consumers no longer
+    re-normalize `ip`/`public_ip`, `lat`/`latitude` or `country`/`country_name`.
+    Addresses are kept as integers, coordinates as floats (None when unknown) and
+    repeated strings are interned, which makes a record a fraction of the size of
+    the dict it came from.
+    """
+
+    __slots__ = (
+        "version", "address", "local_ipv4", "local_ipv6", "local_ipv6_zone", "latitude", "longitude",
+    ) + STRING_FIELDS
+
+    def __init__(
+        self,
+        version: int = 0,
+        address: Optional[int] = None,
+        local_ipv4: Optional[int] = None,
+        local_ipv6: Optional[int] = None,
+        local_ipv6_zone: Optional[str] = None,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+        city: Optional[str] = None,
+        region: Optional[str] = None,
+        country_name: Optional[str] = None,
+        country_code: Optional[str] = None,
+        timezone: Optional[str] = None,
+        org: Optional[str] = None,
+        asn: Optional[str] = None,
+        error: Optional[str] = None,
+    ):
+        self.version = version
+        self.address = address
+        self.local_ipv4 = local_ipv4
+        self.local_ipv6 = local_ipv6
+        self.local_ipv6_zone = local_ipv6_zone
+        self.latitude = latitude
+        self.longitude = longitude
+        self.city = city
+        self.region = region
+        self.country_name = country_name
+        self.country_code = country_code
+        self.timezone = timezone
+        self.org = org
+        self.asn = asn
+        self.error = error
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "IPRecord":
+        version, address, _ = parse_address(data.get("public_ip", data.get("ip")))
+        _, local_ipv4, _ = parse_address(data.get("local_ipv4"))
+        _, local_ipv6, zone = parse_address(data.get("local_ipv6"))
+        country_name, country_code = _country(data)
+        error = data.get("error")
+        return cls(
+            version=version,
+            address=address,
+            local_ipv4=local_ipv4,
+            local_ipv6=local_ipv6,
+            local_ipv6_zone=zone,
+            latitude=_coordinate(data.get("latitude", data.get("lat"))),
+            longitude=_coordinate(data.get("longitude", data.get("lon"))),
+            city=_intern(data.get("city")),
+            region=_intern(data.get("region", data.get("regionName"))),
+            country_name=country_name,
+            country_code=country_code,
+            timezone=_intern(data.get("timezone")),
+            org=_intern(data.get("org")),
+            asn=_intern(data.get("asn")),
+            error=str(error) if error not in (None, False) else None,
+        )
+
+    @property
+    def public_ip(self) -> str:
+        return format_address(self.version, self.address)
+
+    @property
+    def country(self) -> str:
+        name = self.country_name or "N/A"
+        return f"{name} ({self.country_code})" if self.country_code else name
+
+    def as_record(self) -> Dict[str, Any]:
+        """
+        The RECORD_FIELDS view; network.to_record() returns this for any source dict.
+        """
+        return {
+            "local_ipv4": format_address(4, self.local_ipv4),
+            "local_ipv6": format_address(6, self.local_ipv6, self.local_ipv6_zone),
+            "public_ip": self.public_ip,
+            "version": f"IPv{self.version}" if self.version else "N/A",
+            "city": self.city or "N/A",
+            "region": self.region or "N/A",
+            "country": self.country,
+            "latitude": "N/A" if self.latitude is None else self.latitude,
+            "longitude": "N/A" if self.longitude is None else self.longitude,
+            "timezone": self.timezone or "N/A",
+            "org": self.org or "N/A",
+            "asn": self.asn or "N/A",
+        }
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        The get_ip_info() key schema (only the fields that are known).
+        """
+        data: Dict[str, Any] = {}
+        if self.address is not None:
+            data["ip"] = data["public_ip"] = self.public_ip
+            data["version"] = f"IPv{self.version}"
+        for name in STRING_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        if self.latitude is not None:
+            data["latitude"] = self.latitude
+        if self.longitude is not None:
+            data["longitude"] = self.longitude
+        return data
+
+    def _key(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, IPRecord):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __repr__(self) -> str:
+        return f"IPRecord({self.public_ip}, {self.city or '-'}, {self.country})"
+
+
+class IPRecordBatch:
+    """
+    Column-oriented container for many lookup results.
+
+    Public addresses live in two unsigned 64-bit arrays (high/low halves, IPv4 in
+    the low half), the version in a byte array and coordinates in double arrays
+    (NaN when unknown). Every string field is dictionary-encoded: one small list
+    of distinct values plus an array of 32-bit codes. A million records take
+    roughly 75 MB instead of the gigabytes of a list of dicts, and the arrays can
+    be handed to NumPy with numpy.frombuffer() without copying.
+
+    rows(), write_csv() and write_jsonl() read straight from the columns; no
+    IPRecord is rebuilt on the way out and every distinct string is formatted once.
+    """
+
+    ADDRESS_COLUMNS = ("version", "address_hi", "address_lo")
+    FLOAT_COLUMNS = ("latitude", "longitude")
+    STRING_COLUMNS = ("local_ipv4", "local_ipv6") + STRING_FIELDS
+
+    def __init__(self, records: Iterable[Any] = ()):
+        self.version = array("B")
+        self.address_hi = array("Q")
+        self.address_lo = array("Q")
+        self.latitude = array("d")
+        self.longitude = array("d")
+        self._codes = {name: array("I") for name in self.STRING_COLUMNS}
+        # code 0 is "missing" in every string column
+        self._values: Dict[str, List[Optional[str]]] = {name: [None] for name in self.STRING_COLUMNS}
+        self._lookup: Dict[str, Dict[str, int]] = {name: {} for name in self.STRING_COLUMNS}
+        self.extend(records)
+
+    def code(self, column: str, value: Optional[str]) -> int:
+        """
+        The code of `value` in a string column (0 for None), adding it to the distinct
+        values if new. Writing codes into codes(column)[0] changes rows in place.
+        """
+        if value is None:
+            return 0
+        lookup = self._lookup[column]
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(self._values[column])
+            self._values[column].append(sys.intern(value))
+        return code
+
+    def _encode(self, column: str, value: Optional[str]) -> None:
+        self._codes[column].append(self.code(column, value))
+
+    def append(self, item: Any) -> None:
+        """
+        Adds an IPRecord or any dict IPRecord.from_dict() accepts.
+        """
+        record = item if isinstance(item, IPRecord) else IPRecord.from_dict(item)
+        address = record.address or 0
+        self.version.append(record.version)
+        self.address_hi.append(address >> 64)
+        self.address_lo.append(address & 0xFFFFFFFFFFFFFFFF)
+        self.latitude.append(math.nan if record.latitude is None else record.latitude)
+        self.longitude.append(math.nan if record.longitude is None else record.longitude)
+        local_ipv4 = format_address(4, record.local_ipv4) if record.local_ipv4 is not None else None
+        local_ipv6 = (
+            format_address(6, record.local_ipv6, record.local_ipv6_zone) if record.local_ipv6 is not None else None
+        )
+        self._encode("local_ipv4", local_ipv4)
+        self._encode("local_ipv6", local_ipv6)
+        for name in STRING_FIELDS:
+            self._encode(name, getattr(record, name))
+
+    def extend(self, items: Iterable[Any]) -> None:
+        for item in items:
+            self.append(item)
+
+    @classmethod
+    def from_results(cls, results: Iterable[Tuple[str, Dict[str, Any]]]) -> "IPRecordBatch":
+        """
+        Collects the (ip, data) pairs of network.get_ip_info_many(); failed lookups keep their IP.
+        """
+        batch = cls()
+        for ip, data in results:
+            if "error" in data and "ip" not in data:
+                data = dict(data, ip=ip)
+            batch.append(data)
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.version)
+
+    def column(self, name: str) -> Any:
+        """
+        The storage of one column: an array for addresses and coordinates, a list of
+        decoded strings (None when missing) for string fields.
+        """
+        if name in self._codes:
+            values = self._values[name]
+            return [values[code] for code in self._codes[name]]
+        return getattr(self, name)
+
+    def codes(self, name: str) -> Tuple[array, List[Optional[str]]]:
+        """
+        (code array, distinct values) of a dictionary-encoded string column.
+        """
+        return self._codes[name], self._values[name]
+
+    def _address(self, index: int) -> Optional[int]:
+        if not self.version[index]:
+            return None
+        return (self.address_hi[index] << 64) | self.address_lo[index]
+
+    def __getitem__(self, index: int) -> IPRecord:
+        if index < 0:
+            index += len(self)
+        strings = {name: self._values[name][self._codes[name][index]] for name in STRING_FIELDS}
+        _, local_ipv4, _ = parse_address(self._values["local_ipv4"][self._codes["local_ipv4"][index]])
+        _, local_ipv6, zone = parse_address(self._values["local_ipv6"][self._codes["local_ipv6"][index]])
+        latitude, longitude = self.latitude[index], self.longitude[index]
+        return IPRecord(
+            version=self.version[index],
+            address=self._address(index),
+            local_ipv4=local_ipv4,
+            local_ipv6=local_ipv6,
+            local_ipv6_zone=zone,
+            latitude=None if math.isnan(latitude) else latitude,
+            longitude=None if math.isnan(longitude) else longitude,
+            **strings,
+        )
+
+    def __iter__(self) -> Iterator[IPRecord]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def rows(self) -> Iterator[tuple]:
+        """
+        Yields one RECORD_FIELDS-ordered tuple per record, formatted as network.to_record() would.
+        """
+        def strings(column: str) -> Iterator[str]:
+            values = [("N/A" if value is None else value) for value in self._values[column]]
+            return (values[code] for code in self._codes[column])
+
+        def coordinates(column: array) -> Iterator[Any]:
+            return ("N/A" if math.isnan(value) else value for value in column)
+
+        def countries() -> Iterator[str]:
+            names, codes = self._codes["country_name"], self._codes["country_code"]
+            name_values, code_values = self._values["country_name"], self._values["country_code"]
+            for name_code, code_code in zip(names, codes):
+                name = name_values[name_code] or "N/A"
+                code = code_values[code_code]
+                yield f"{name} ({code})" if code else name
+
+        addresses = (format_address(version, (hi << 64) | lo if version else None)
+                     for version, hi, lo in zip(self.version, self.address_hi, self.address_lo))
+        versions = (f"IPv{version}" if version else "N/A" for version in self.version)
+        return zip(
+            strings("local_ipv4"), strings("local_ipv6"), addresses, versions, strings("city"),
+            strings("region"), countries(), coordinates(self.latitude), coordinates(self.longitude),
+            strings("timezone"), strings("org"), strings("asn"),
+        )
+
+    def write_csv(self, out: TextIO, header: bool = True) -> int:
+        writer = csv.writer(out)
+        if header:
+            writer.writerow(RECORD_FIELDS)
+        writer.writerows(self.rows())
+        return len(self)
+
+    def write_jsonl(self, out: TextIO) -> int:
+        for row in self.rows():
+            out.write(json.dumps(dict(zip(RECORD_FIELDS, row)), ensure_ascii=False))
+            out.write("\n")
+        return len(self)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes held by the column arrays (excluding the distinct string values).
+        """
+        arrays = [self.version, self.address_hi, self.address_lo, self.latitude, self.longitude]
+        arrays.extend(self._codes.values())
+        return sum(a.itemsize * len(a) for a in arrays)
+
+
+def lookup_batch(ips: Iterable[str], **options) -> IPRecordBatch:
+    """
+    network.get_ip_info_many() collected into an IPRecordBatch, in input order.
+    """
+    from network import get_ip_info_many
+
+    return IPRecordBatch.from_results(get_ip_info_many(ips, **options))
@@ -0,0 +1,443 @@
+import csv
+import math
+import os
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from records import IPRecordBatch
+
+# Place attributes filled in, in storage order (the keys update_ui_with_data consumes)
+FIELDS = ("city", "region", "country_name", "country_code", "timezone")
+
+# Column aliases accepted when importing a CSV gazetteer
+COLUMN_ALIASES = {
+    "name": "city",
+    "subdivision_1_name": "region",
+    "region_name": "region",
+    "admin1": "region",
+    "country": "country_name",
+    "time_zone": "timezone",
+    "lat": "latitude",
+    "lon": "longitude",
+    "lng": "longitude",
+}
+
+EARTH_RADIUS_KM = 6371.0088
+# Nearest places farther than this are not used to fill fields (open sea, sparse gazetteers)
+DEFAULT_MAX_KM = 150.0
+# Queries are answered this many at a time, bounding the temporary (rows x leaf size x 3) arrays
+CHUNK_ROWS = 16384
+# Candidate (query, leaf) pairs a KDTree.query() batch may hold before it is split in two
+MAX_PAIRS = 1 << 20
+_MISSING = (None, "", "N/A")
+
+
+def unit_vectors(latitudes, longitudes) -> np.ndarray:
+    """
+    (n, 3) unit vectors of coordinates in degrees. Squared chord length between two
+    of them orders pairs exactly like great-circle distance, without trigonometry.
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)), axis=-1)
+
+
+def chord_to_km(squared_chord: np.ndarray) -> np.ndarray:
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.sqrt(squared_chord) / 2.0, 1.0))
+
+
+class KDTree:
+    """
+    Balanced k-d tree over 3-D points with an implicit layout: node i has children
+    2i + 1 and 2i + 2, every leaf is a bucket of at most `leaf_size` points, and all
+    leaves sit at the same depth. Each node keeps its bounding box.
+
+    query() runs the whole batch through the tree together: a vectorized descent
+    gives every query its own leaf as a first answer, then one breadth-first pass
+    over (query, node) pairs keeps only the nodes whose box is closer than that
+    answer and compares the surviving leaves' points in bulk.
+    """
+
+    def __init__(self, points: np.ndarray, leaf_size: int = 16):
+        points = np.ascontiguousarray(points, dtype=np.float64)
+        n = len(points)
+        self.depth = max(0, math.ceil(math.log2(max(n, 1) / leaf_size)))
+        leaves = 1 << self.depth
+        inner = leaves - 1
+        # leaf j holds points [bounds[j], bounds[j + 1]) of `order`
+        bounds = np.arange(leaves + 1) * n // leaves
+        order = np.arange(n)
+        self.split_dim = np.zeros(inner, dtype=np.intp)
+        self.split_value = np.zeros(inner, dtype=np.float64)
+        for node in range(inner):
+            level = int(math.log2(node + 1))
+            first = (node + 1 - (1 << level)) << (self.depth - level)
+            width = 1 << (self.depth - level)
+            start, mid, end = bounds[first], bounds[first + width // 2], bounds[first + width]
+            if end - start < 2:
+                continue
+            segment = order[start:end]
+            coords = points[segment]
+            dim = int(np.argmax(coords.max(axis=0) - coords.min(axis=0)))
+            part = np.argpartition(coords[:, dim], mid - start)
+            order[start:end] = segment[part]
+            self.split_dim[node] = dim
+            self.split_value[node] = points[order[mid], dim]
+
+        self.leaf_size = int(max(np.diff(bounds).max(initial=0), 1))
+        slots = np.arange(self.leaf_size)
+        counts = np.diff(bounds)
+        taken = slots[None, :] < counts[:, None]
+        self.leaf_index = np.full((leaves, self.leaf_size), -1, dtype=np.int64)
+        self.leaf_index[taken] = order
+        # padding slots sit far outside the unit sphere, so they never win
+        self.leaf_points = np.full((leaves, self.leaf_size, 3), 1e3, dtype=np.float64)
+        self.leaf_points[taken] = points[order]
+
+        box_lo = np.full((inner + leaves, 3), np.inf)
+        box_hi = np.full((inner + leaves, 3), -np.inf)
+        box_lo[inner:] = np.where(taken[..., None], self.leaf_points, np.inf).min(axis=1)
+        box_hi[inner:] = np.where(taken[..., None], self.leaf_points, -np.inf).max(axis=1)
+        for level in range(self.depth - 1, -1, -1):
+            nodes = np.arange((1 << level) - 1, (1 << (level + 1)) - 1)
+            box_lo[nodes] = np.minimum(box_lo[2 * nodes + 1], box_lo[2 * nodes + 2])
+            box_hi[nodes] = np.maximum(box_hi[2 * nodes + 1], box_hi[2 * nodes + 2])
+        self.box_lo, self.box_hi = box_lo, box_hi
+        self.size = n
+
+    def _leaf_distances(self, leaves: np.ndarray, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (squared distance, point index) of the nearest point of leaves[i] to queries[i].
+        """
+        diff = self.leaf_points[leaves] - queries[:, None, :]
+        d2 = np.einsum("ijk,ijk->ij", diff, diff)
+        slot = d2.argmin(axis=1)
+        rows = np.arange(len(leaves))
+        return d2[rows, slot], self.leaf_index[leaves, slot]
+
+    def query(self, queries: np.ndarray, bound: float = np.inf) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (squared chord distance, index) of the nearest point to each (n, 3) query.
+        Points farther than squared distance `bound` are skipped, which also keeps the
+        search small for queries far from every point; the index is -1 (distance inf)
+        when nothing is within it.
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float64)
+        count = len(queries)
+        if not self.size or not count:
+            return np.full(count, np.inf), np.full(count, -1, dtype=np.int64)
+        inner = (1 << self.depth) - 1
+        rows = np.arange(count)
+
+        node = np.zeros(count, dtype=np.intp)
+        for _ in range(self.depth):
+            right = queries[rows, self.split_dim[node]] >= self.split_value[node]
+            node = 2 * node + 1 + right
+        own_leaf = node
+        best, index = self._leaf_distances(node - inner, queries)
+        limit = np.minimum(best, bound)
+
+        pair_query, pair_node = rows, np.zeros(count, dtype=np.intp)
+        for _ in range(self.depth):
+            pair_query = np.repeat(pair_query, 2)
+            pair_node = np.repeat(2 * pair_node, 2) + np.tile(np.array([1, 2]), len(pair_node))
+            point = queries[pair_query]
+            gap = np.maximum(self.box_lo[pair_node] - point, 0.0) + np.maximum(point - self.box_hi[pair_node], 0.0)
+            keep = np.einsum("ij,ij->i", gap, gap) <= limit[pair_query]
+            pair_query, pair_node = pair_query[keep], pair_node[keep]
+            if len(pair_query) > MAX_PAIRS and count > 1:
+                # too many candidate leaves (sparse points, far-away queries): halve the batch
+                half = count // 2
+                first, second = self.query(queries[:half], bound), self.query(queries[half:], bound)
+                return np.concatenate((first[0], second[0])), np.concatenate((first[1], second[1]))
+        other = pair_node != own_leaf[pair_query]
+        pair_query, pair_node = pair_query[other], pair_node[other]
+        if len(pair_query):
+            d2, candidate = self._leaf_distances(pair_node - inner, queries[pair_query])
+            order = np.lexsort((d2, pair_query))
+            pair_query, d2, candidate = pair_query[order], d2[order], candidate[order]
+            first = np.ones(len(pair_query), dtype=bool)
+            first[1:] = pair_query[1:] != pair_query[:-1]
+            pair_query, d2, candidate = pair_query[first], d2[first], candidate[first]
+            better = d2 < best[pair_query]
+            best[pair_query[better]] = d2[better]
+            index[pair_query[better]] = candidate[better]
+        outside = best > bound
+        best[outside], index[outside] = np.inf, -1
+        return best, index
+
+
+def _clean(value: Any) -> str:
+    return "" if value in _MISSING else str(value).strip()
+
+
+def _read_lookup(path: Optional[str], key_column: int, value_column: int) -> Dict[str, str]:
+    """
+    key -> value of a tab-separated GeoNames side file (admin1CodesASCII.txt, countryInfo.txt).
+    """
+    if not path:
+        return {}
+    table = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) > max(key_column, value_column):
+                table[fields[key_column]] = fields[value_column]
+    return table
+
+
+def read_gazetteer(
+    path: str, admin1_path: Optional[str] = None, countries_path: Optional[str] = None
+) -> Iterator[Tuple[float, float, Tuple[str, ...]]]:
+    """
+    Yields (latitude, longitude, FIELDS values) for every place in a gazetteer.
+
+    Accepts GeoNames dumps (cities500.txt, cities15000.txt, ...: tab-separated, no
+    header) and CSV files with a header naming any of the FIELDS plus latitude and
+    longitude (aliases such as name/lat/lon/time_zone are understood). For GeoNames,
+    admin1CodesASCII.txt and countryInfo.txt turn region and country codes into
+    names; without them the codes are used.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        first = f.readline()
+        f.seek(0)
+        if "\t" in first and len(first.split("\t")) >= 18:
+            regions = _read_lookup(admin1_path, 0, 1)
+            countries = _read_lookup(countries_path, 0, 4)
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < 18:
+                    continue
+                code, admin1 = fields[8], fields[10]
+                region = regions.get(f"{code}.{admin1}", admin1)
+                yield float(fields[4]), float(fields[5]), (
+                    fields[1], region, countries.get(code, code), code, fields[17],
+                )
+            return
+        for row in csv.DictReader(f):
+            values = {}
+            for column, value in row.items():
+                if column is None:
+                    continue
+                key = COLUMN_ALIASES.get(column.strip().lower(), column.strip().lower())
+                values.setdefault(key, _clean(value))
+            try:
+                latitude, longitude = float(values["latitude"]), float(values["longitude"])
+            except (KeyError, ValueError):
+                continue
+            yield latitude, longitude, tuple(values.get(field, "") for field in FIELDS)
+
+
+class CityIndex:
+    """
+    Offline reverse geocoder: the nearest gazetteer place to any coordinate.
+
+    Places are indexed by a KDTree over their unit-sphere vectors, so distances are
+    true great-circle ones everywhere (no longitude wrap-around or polar distortion).
+    Place strings are stored once and each place is referenced by five string codes.
+    """
+
+    def __init__(self, latitudes, longitudes, places: np.ndarray, strings: List[str], leaf_size: int = 16):
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.places = np.asarray(places, dtype=np.int32).reshape(-1, len(FIELDS))
+        self.strings = strings
+        self.tree = KDTree(unit_vectors(self.latitudes, self.longitudes), leaf_size)
+        self._decoded: Dict[int, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_gazetteer(
+        cls, path: str, admin1_path: Optional[str] = None, countries_path: Optional[str] = None
+    ) -> "CityIndex":
+        """
+        Builds an index from a gazetteer file (see read_gazetteer()).
+        """
+        strings: Dict[str, int] = {"": 0}
+        latitudes, longitudes, places = [], [], []
+        for latitude, longitude, values in read_gazetteer(path, admin1_path, countries_path):
+            latitudes.append(latitude)
+            longitudes.append(longitude)
+            places.extend(strings.setdefault(value, len(strings)) for value in values)
+        return cls(latitudes, longitudes, np.array(places, dtype=np.int32), list(strings))
+
+    def save(self, path: str) -> None:
+        """
+        Writes the places to an .npz file; load() rebuilds the tree from it. The file
+        is written next to `path` and renamed into place.
+        """
+        encoded = [value.encode("utf-8") for value in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, latitudes=self.latitudes, longitudes=self.longitudes, places=self.places,
+                     blob=np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets=offsets)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CityIndex":
+        with np.load(path) as data:
+            blob, offsets = data["blob"].tobytes(), data["offsets"]
+            strings = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+            return cls(data["latitudes"], data["longitudes"], data["places"], strings)
+
+    def __len__(self) -> int:
+        return len(self.latitudes)
+
+    def nearest(self, latitudes, longitudes, max_km: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized nearest place of each coordinate pair: (place index, distance in km).
+        The index is -1 and the distance NaN for missing or out-of-range coordinates
+        and, with `max_km`, when no place is that close.
+        """
+        latitudes = np.asarray(latitudes, dtype=np.float64).ravel()
+        longitudes = np.asarray(longitudes, dtype=np.float64).ravel()
+        index = np.full(len(latitudes), -1, dtype=np.int64)
+        distance = np.full(len(latitudes), np.nan)
+        bound = np.inf
+        if max_km is not None:
+            bound = (2.0 * math.sin(min(max_km / (2.0 * EARTH_RADIUS_KM), math.pi / 2))) ** 2
+        with np.errstate(invalid="ignore"):
+            valid = np.flatnonzero((np.abs(latitudes) <= 90.0) & (np.abs(longitudes) <= 360.0))
+        for start in range(0, len(valid), CHUNK_ROWS):
+            rows = valid[start:start + CHUNK_ROWS]
+            d2, found = self.tree.query(unit_vectors(latitudes[rows], longitudes[rows]), bound)
+            index[rows] = found
+            distance[rows[found >= 0]] = chord_to_km(d2[found >= 0])
+        return index, distance
+
+    def place(self, index: int) -> Dict[str, Any]:
+        """
+        The FIELDS of place `index`, plus its "latitude"/"longitude" as place_latitude/place_longitude.
+        """
+        place = self._decoded.get(index)
+        if place is None:
+            codes = self.places[index]
+            place = {field: self.strings[code] for field, code in zip(FIELDS, codes.tolist())}
+            place["place_latitude"] = float(self.latitudes[index])
+            place["place_longitude"] = float(self.longitudes[index])
+            self._decoded[index] = place
+        return place
+
+    def reverse(self, latitude: float, longitude: float, max_km: Optional[float] = DEFAULT_MAX_KM) -> Dict[str, Any]:
+        """
+        The nearest place to one coordinate with its "distance_km".
+        Follows the get_ip_info() contract: always a dict, {"error": "..."} when nothing is near.
+        """
+        index, distance = self.nearest([latitude], [longitude], max_km)
+        if index[0] < 0:
+            if max_km is None or not (abs(latitude) <= 90.0 and abs(longitude) <= 360.0):
+                return {"error": f"No place found for {latitude}, {longitude}"}
+            return {"error": f"No place within {max_km} km of {latitude}, {longitude}"}
+        return dict(self.place(int(index[0])), distance_km=round(float(distance[0]), 3))
+
+    def label(self, latitude: float, longitude: float, max_km: Optional[float] = DEFAULT_MAX_KM) -> Optional[str]:
+        """
+        "City, Region, Country" of the nearest place, for map markers; None when nothing is near.
+        """
+        place = self.reverse(latitude, longitude, max_km)
+        if "error" in place:
+            return None
+        parts = [place["city"], place["region"], place["country_name"] or place["country_code"]]
+        return ", ".join(dict.fromkeys(part for part in parts if part))
+
+    def fill(
+        self,
+        records: Iterable[Dict[str, Any]],
+        overwrite: bool = False,
+        max_km: Optional[float] = DEFAULT_MAX_KM,
+        chunk: int = CHUNK_ROWS,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Streams get_ip_info()-style dicts, filling city, region, country_name,
+        country_code and timezone in place from the nearest place to their
+        latitude/longitude (or lat/lon). Only missing fields are set unless
+        `overwrite`. Records are looked up `chunk` at a time, so any number of them
+        can be streamed with bounded memory.
+        """
+        pending: List[Dict[str, Any]] = []
+        for record in records:
+            pending.append(record)
+            if len(pending) >= chunk:
+                yield from self._fill_chunk(pending, overwrite, max_km)
+                pending = []
+        if pending:
+            yield from self._fill_chunk(pending, overwrite, max_km)
+
+    def _fill_chunk(self, records: Sequence[Dict[str, Any]], overwrite: bool, max_km: Optional[float]):
+        coordinates = np.full((len(records), 2), np.nan)
+        for i, record in enumerate(records):
+            latitude = record.get("latitude", record.get("lat"))
+            longitude = record.get("longitude", record.get("lon"))
+            if latitude not in _MISSING and longitude not in _MISSING:
+                try:
+                    coordinates[i] = float(latitude), float(longitude)
+                except (TypeError, ValueError):
+                    pass
+        index, _ = self.nearest(coordinates[:, 0], coordinates[:, 1], max_km)
+        for record, found in zip(records, index.tolist()):
+            if found >= 0:
+                place = self.place(found)
+                for field in FIELDS:
+                    if place[field] and (overwrite or record.get(field) in _MISSING):
+                        record[field] = place[field]
+            yield record
+
+    def fill_batch(self, batch: "IPRecordBatch", overwrite: bool = False,
+                   max_km: Optional[float] = DEFAULT_MAX_KM) -> int:
+        """
+        Fills the place columns of a records.IPRecordBatch in place, straight from its
+        coordinate arrays; only missing values are set unless `overwrite`. Returns the
+        number of rows that had a place near enough.
+        """
+        latitudes = np.frombuffer(batch.latitude, dtype=np.float64)
+        longitudes = np.frombuffer(batch.longitude, dtype=np.float64)
+        index, _ = self.nearest(latitudes, longitudes, max_km)
+        rows = np.flatnonzero(index >= 0)
+        places = index[rows]
+        for column, field in enumerate(FIELDS):
+            codes = np.frombuffer(batch.codes(field)[0], dtype=np.uint32)
+            # batch code of every distinct string this field of the places uses
+            strings = np.unique(self.places[places, column])
+            mapping = np.zeros(len(self.strings), dtype=np.uint32)
+            mapping[strings] = [batch.code(field, self.strings[code] or None) for code in strings.tolist()]
+            target = mapping[self.places[places, column]]
+            update = target != 0
+            if not overwrite:
+                update &= codes[rows] == 0
+            codes[rows[update]] = target[update]
+        return len(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Build or query an offline reverse-geocoding index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="index a gazetteer (GeoNames citiesNNN.txt or CSV)")
+    build.add_argument("gazetteer")
+    build.add_argument("output_path")
+    build.add_argument("--admin1", help="GeoNames admin1CodesASCII.txt, for region names")
+    build.add_argument("--countries", help="GeoNames countryInfo.txt, for country names")
+    query = sub.add_parser("reverse", help="nearest place of coordinates")
+    query.add_argument("index")
+    query.add_argument("coordinates", nargs="+", help="LAT,LON pairs")
+    query.add_argument("--max-km", type=float, default=DEFAULT_MAX_KM)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = CityIndex.from_gazetteer(args.gazetteer, args.admin1, args.countries)
+        index.save(args.output_path)
+        print(f"{len(index)} places indexed")
+    else:
+        index = CityIndex.load(args.index)
+        for pair in args.coordinates:
+            latitude, _, longitude = pair.partition(",")
+            print(json.dumps({"query": pair, **index.reverse(float(latitude), float(longitude), args.max_km)},
+                             ensure_ascii=False))
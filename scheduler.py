@@ -0,0 +1,262 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+# Lower numbers are served first
+INTERACTIVE = 0
+BATCH = 10
+
+# Seconds an INTERACTIVE do() waits for a request slot before giving up
+INTERACTIVE_WAIT = 10.0
+
+# (requests, per seconds) quotas of the free plans; every bucket of a host must have a token
+DEFAULT_LIMITS: Dict[str, Sequence[Tuple[int, float]]] = {
+    "ipapi.co": ((1000, 86400.0), (45, 60.0)),
+    "ip-api.com": ((45, 60.0),),
+    "ipwho.is": ((10000, 30 * 86400.0), (60, 60.0)),
+    "ipinfo.io": ((50000, 30 * 86400.0), (60, 60.0)),
+}
+
+
+class SlotTimeout(TimeoutError):
+    """
+    Raised by RequestScheduler.do() when no request slot for the host came free in time.
+    """
+
+
+class TokenBucket:
+    """
+    Holds up to `capacity` tokens and refills at capacity / `per` tokens per second.
+    """
+
+    def __init__(self, capacity: int, per: float):
+        self.capacity = float(capacity)
+        self.rate = capacity / per
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def delay(self, now: float) -> float:
+        """
+        Seconds until a token is available (0 if one is available now).
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+class _HostLimiter:
+    def __init__(self, limits: Sequence[Tuple[int, float]]):
+        self.buckets = [TokenBucket(requests, per) for requests, per in limits]
+        self.blocked_until = 0.0
+        # [priority, seq] tickets; lists so that a queued ticket can be promoted
+        self.waiters: List[List[int]] = []
+
+    def delay(self, now: float) -> float:
+        return max([self.blocked_until - now] + [bucket.delay(now) for bucket in self.buckets])
+
+    def take(self) -> None:
+        for bucket in self.buckets:
+            bucket.take()
+
+
+class _Flight:
+    """
+    One in-flight do() call: its shared result, its queue ticket and whether it
+    has got past the wait for a request slot.
+    """
+
+    def __init__(self, ticket: List[int]):
+        self.future = Future()
+        self.ticket = ticket
+        self.started = threading.Event()
+
+
+class RequestScheduler:
+    """
+    Paces outgoing lookups per host and merges duplicate in-flight requests.
+
+    Each host gets a set of token buckets (e.g. per-minute and per-day quotas); a
+    request may only start once every bucket of its host has a token. Callers
+    waiting on the same host queue by priority (INTERACTIVE before BATCH, FIFO
+    within a priority), so a UI lookup takes the next free token ahead of a
+    running batch job. Hosts without configured limits are not paced.
+
+    do() adds "singleflight" coalescing: while a call for a key is in flight,
+    further callers for the same key wait for and share its result instead of
+    issuing their own request. If a result shows the server rate-limited us
+    anyway, the host is paused for `penalty` seconds. An INTERACTIVE do() waits at
+    most `interactive_wait` seconds for its slot, so an exhausted daily quota fails
+    a UI lookup quickly instead of blocking it for hours.
+
+    Quotas are tracked per process; they are not persisted across restarts.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Sequence[Tuple[int, float]]]] = None, penalty: float = 60.0,
+                 interactive_wait: float = INTERACTIVE_WAIT):
+        self.penalty = penalty
+        self.interactive_wait = interactive_wait
+        self._cond = threading.Condition()
+        self._limiters: Dict[str, _HostLimiter] = {}
+        self._seq = itertools.count()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._flights_lock = threading.Lock()
+        self.acquired = 0
+        self.waited = 0.0
+        self.coalesced = 0
+        self.penalties = 0
+        for host, host_limits in (DEFAULT_LIMITS if limits is None else limits).items():
+            self.set_limits(host, host_limits)
+
+    def set_limits(self, host: str, limits: Sequence[Tuple[int, float]]) -> None:
+        """
+        Replaces the quotas of `host` with (requests, per seconds) pairs; an empty list removes pacing.
+        """
+        with self._cond:
+            limiter = self._limiters.get(host.lower())
+            if limiter is not None and not limits and not limiter.waiters:
+                del self._limiters[host.lower()]
+            elif limiter is not None:
+                limiter.buckets = _HostLimiter(limits).buckets
+            elif limits:
+                self._limiters[host.lower()] = _HostLimiter(limits)
+            self._cond.notify_all()
+
+    def acquire(self, host: str, priority: int = BATCH, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until a request to `host` may be sent and takes its token.
+        Returns False if that did not happen within `timeout` seconds (0 polls).
+        """
+        return self._acquire(host, [priority, next(self._seq)], timeout)
+
+    def _acquire(self, host: str, ticket: List[int], timeout: Optional[float]) -> bool:
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        with self._cond:
+            limiter = self._limiters.get(host.lower())
+            if limiter is None:
+                self.acquired += 1
+                return True
+            heapq.heappush(limiter.waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = None
+                    if limiter.waiters[0] is ticket:
+                        delay = limiter.delay(now)
+                        if delay <= 0:
+                            limiter.take()
+                            self.acquired += 1
+                            self.waited += now - started
+                            return True
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            return False
+                        delay = remaining if delay is None else min(delay, remaining)
+                    self._cond.wait(delay)
+            finally:
+                limiter.waiters.remove(ticket)
+                heapq.heapify(limiter.waiters)
+                self._cond.notify_all()
+
+    def _promote(self, host: Optional[str], ticket: List[int], priority: int) -> None:
+        """
+        Moves a queued (or not yet queued) ticket up to `priority`.
+        """
+        with self._cond:
+            ticket[0] = min(ticket[0], priority)
+            limiter = self._limiters.get(host.lower()) if host is not None else None
+            if limiter is not None:
+                heapq.heapify(limiter.waiters)
+            self._cond.notify_all()
+
+    def penalize(self, host: str, seconds: Optional[float] = None) -> None:
+        """
+        Pauses all requests to `host` for `seconds` (default: the scheduler's penalty).
+        """
+        with self._cond:
+            limiter = self._limiters.setdefault(host.lower(), _HostLimiter(()))
+            limiter.blocked_until = max(limiter.blocked_until, time.monotonic() + (seconds or self.penalty))
+            self.penalties += 1
+            self._cond.notify_all()
+
+    def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Any],
+        host: Optional[str] = None,
+        priority: int = BATCH,
+        rate_limited: Optional[Callable[[Any], bool]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        Runs fn() once per concurrent `key`, paced by `host`'s quotas, and returns its result.
+        Callers arriving while the call is in flight get the same result (or exception).
+        Raises SlotTimeout if no request slot came free within `timeout` seconds
+        (default: `interactive_wait` for INTERACTIVE callers, unbounded otherwise).
+        A caller joining a call that still waits for its slot is bound by its own
+        `timeout`, and a higher-priority caller moves that call up the queue.
+        """
+        if timeout is None and priority <= INTERACTIVE:
+            timeout = self.interactive_wait
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight([priority, next(self._seq)])
+            else:
+                self.coalesced += 1
+        if not leader:
+            if priority < flight.ticket[0]:
+                self._promote(host, flight.ticket, priority)
+            if not flight.started.wait(timeout):
+                raise SlotTimeout(f"no request slot for {host} within {timeout}s")
+            return flight.future.result()
+        try:
+            if host is not None and not self._acquire(host, flight.ticket, timeout):
+                raise SlotTimeout(f"no request slot for {host} within {timeout}s")
+            flight.started.set()
+            result = fn()
+            if host is not None and rate_limited is not None and rate_limited(result):
+                self.penalize(host)
+            flight.future.set_result(result)
+            return result
+        except BaseException as e:
+            flight.future.set_exception(e)
+            raise
+        finally:
+            flight.started.set()
+            with self._flights_lock:
+                self._flights.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "acquired": self.acquired,
+                "waited_seconds": round(self.waited, 3),
+                "coalesced": self.coalesced,
+                "penalties": self.penalties,
+                "queued": {host: len(limiter.waiters) for host, limiter in self._limiters.items() if limiter.waiters},
+            }
+
+
+_default_scheduler: Optional[RequestScheduler] = None
+_default_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """
+    The process-wide scheduler shared by every lookup path.
+    """
+    global _default_scheduler
+    if _default_scheduler is None:
+        with _default_lock:
+            if _default_scheduler is None:
+                _default_scheduler = RequestScheduler()
+    return _default_scheduler
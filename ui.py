@@ -1,258 +1,501 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-import threading
-import webbrowser
-import json
-import csv
-import os
-from network import get_ip_info, get_local_ips
-
-try:
-    import folium  # optional
-    FOLIUM_AVAILABLE = True
-except Exception:
-    FOLIUM_AVAILABLE = False
-
-
-class IPInfoApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("VLS-EM | Public & Local IP + Geolocation")
-        self.root.geometry("600x640")
-        self.root.resizable(False, False)
-        self.root.config(bg="#e0f2f7")
-
-        style = ttk.Style()
-        style.theme_use('clam')
-
-        style.configure("TLabel", font=("Segoe UI", 10), background="#e0f2f7", foreground="#333333")
-        style.configure("Header.TLabel", font=("Segoe UI", 16, "bold"), background="#e0f2f7", foreground="#004d66")
-        style.configure("Subheader.TLabel", font=("Segoe UI", 9, "italic"), background="#e0f2f7", foreground="#004d66")
-        style.configure("Field.TLabel", font=("Segoe UI", 10, "bold"), background="#e0f2f7", foreground="#007bff")
-        style.configure("Value.TLabel", font=("Segoe UI", 10), background="#e0f2f7", foreground="#555555", wraplength=350)
-        style.configure("TButton", font=("Segoe UI", 11, "bold"), background="#28a745", foreground="white", relief="flat")
-        style.map("TButton",
-                  background=[('active', '#218838'), ('pressed', '#1e7e34')],
-                  foreground=[('active', 'white'), ('pressed', 'white')])
-        style.configure("TFrame", background="#e0f2f7")
-        style.configure("Status.TLabel", font=("Segoe UI", 8, "italic"), background="#e0f2f7", foreground="#6c757d")
-
-        main_frame = ttk.Frame(self.root, padding="20", style="TFrame")
-        main_frame.pack(fill=tk.BOTH, expand=True)
-
-        title_label = ttk.Label(main_frame, text="🌎 VLS-EM IP & Geolocation", style="Header.TLabel", anchor="center")
-        title_label.grid(row=0, column=0, columnspan=3, pady=(0, 5), sticky="ew")
-
-        group_label = ttk.Label(main_frame, text="Shows local IPv4/IPv6 and public IP + geolocation.", style="Subheader.TLabel", anchor="center")
-        group_label.grid(row=1, column=0, columnspan=3, pady=(0, 10), sticky="ew")
-
-        ttk.Separator(main_frame, orient='horizontal').grid(row=2, column=0, columnspan=3, sticky="ew", pady=(0, 10))
-
-        self.info_vars = {}
-        fields = [
-            ("Local IPv4", "local_ipv4"),
-            ("Local IPv6", "local_ipv6"),
-            ("Public IP", "public_ip"),
-            ("IP Version", "version"),
-            ("City", "city"),
-            ("Region", "region"),
-            ("Country", "country"),
-            ("Latitude", "latitude"),
-            ("Longitude", "longitude"),
-            ("Timezone", "timezone"),
-            ("ISP / Org", "org"),
-            ("ASN", "asn"),
-        ]
-
-        for i, (label_text, key) in enumerate(fields):
-            label = ttk.Label(main_frame, text=f"{label_text}:", style="Field.TLabel")
-            label.grid(row=i + 3, column=0, sticky="w", padx=5, pady=4)
-            self.info_vars[key] = tk.StringVar(value="N/A")
-            value_label = ttk.Label(main_frame, textvariable=self.info_vars[key], style="Value.TLabel")
-            value_label.grid(row=i + 3, column=1, columnspan=2, sticky="w", padx=5, pady=4)
-
-        ttk.Separator(main_frame, orient='horizontal').grid(row=len(fields) + 3, column=0, columnspan=3, sticky="ew", pady=(15, 10))
-
-        fetch_button = ttk.Button(main_frame, text="🚀 Get My IP Info", command=self.start_fetch_thread, style="TButton")
-        fetch_button.grid(row=len(fields) + 4, column=0, sticky="ew", padx=3, pady=(0, 8))
-
-        export_csv_button = ttk.Button(main_frame, text="⬇️ Export CSV", command=self.export_csv, style="TButton")
-        export_csv_button.grid(row=len(fields) + 4, column=1, sticky="ew", padx=3, pady=(0, 8))
-
-        export_json_button = ttk.Button(main_frame, text="⬇️ Export JSON", command=self.export_json, style="TButton")
-        export_json_button.grid(row=len(fields) + 4, column=2, sticky="ew", padx=3, pady=(0, 8))
-
-        map_button = ttk.Button(main_frame, text="🗺️ Show Map", command=self.show_map, style="TButton")
-        map_button.grid(row=len(fields) + 5, column=0, columnspan=3, sticky="ew", padx=3, pady=(4, 8))
-
-        self.progress_bar = ttk.Progressbar(main_frame, orient="horizontal", mode="indeterminate")
-        self.progress_bar.grid(row=len(fields) + 6, column=0, columnspan=3, pady=(5, 5), sticky="ew")
-        self.progress_bar.grid_remove()
-
-        self.status_var = tk.StringVar(value="Ready. Click the button to fetch data.")
-        status_label = ttk.Label(main_frame, textvariable=self.status_var, style="Status.TLabel")
-        status_label.grid(row=len(fields) + 7, column=0, columnspan=3, pady=(5, 0), sticky="ew")
-
-        powered_by_label = ttk.Label(main_frame, text="Public data by ipapi.co • Map via folium or Google Maps", font=("Segoe UI", 7, "italic"), background="#e0f2f7", foreground="#999999")
-        powered_by_label.grid(row=len(fields) + 8, column=0, columnspan=3, pady=(12, 0), sticky="se")
-
-        main_frame.grid_columnconfigure(0, weight=1)
-        main_frame.grid_columnconfigure(1, weight=2)
-        main_frame.grid_columnconfigure(2, weight=2)
-
-        # store latest raw data
-        self.latest_data = {}
-
-    def update_ui_with_data(self, data: dict):
-        # combine fields coming from local + public responses
-        self.info_vars["local_ipv4"].set(data.get("local_ipv4", "N/A"))
-        self.info_vars["local_ipv6"].set(data.get("local_ipv6", "N/A"))
-
-        self.info_vars["public_ip"].set(data.get("public_ip", data.get("ip", "N/A")))
-        self.info_vars["version"].set(data.get("version", "N/A"))
-        self.info_vars["city"].set(data.get("city", "N/A"))
-        self.info_vars["region"].set(data.get("region", "N/A"))
-        country_name = data.get("country_name") or data.get("country", "N/A")
-        country_code = data.get("country_code", "")
-        if country_code:
-            self.info_vars["country"].set(f"{country_name} ({country_code})")
-        else:
-            self.info_vars["country"].set(country_name)
-        self.info_vars["latitude"].set(data.get("latitude", data.get("lat", "N/A")))
-        self.info_vars["longitude"].set(data.get("longitude", data.get("lon", "N/A")))
-        self.info_vars["timezone"].set(data.get("timezone", "N/A"))
-        self.info_vars["org"].set(data.get("org", "N/A"))
-        self.info_vars["asn"].set(data.get("asn", "N/A"))
-        self.status_var.set("Data updated successfully.")
-        self.latest_data = data.copy()
-
-    def fetch_and_display_info(self):
-        self.progress_bar.grid()
-        self.progress_bar.start()
-        self.status_var.set("Fetching data from API and local interfaces...")
-
-        # get local IPs quickly
-        local = get_local_ips()
-        # get remote / public data
-        public = get_ip_info()
-
-        merged = {}
-        merged.update(local)
-        merged.update(public if isinstance(public, dict) else {})
-
-        self.progress_bar.stop()
-        self.progress_bar.grid_remove()
-
-        if isinstance(public, dict) and "error" in public:
-            messagebox.showerror("Connection Error", public["error"])
-            self.status_var.set("Error! Could not fetch public data.")
-            # still display local IPs
-            self.update_ui_with_data(merged)
-        elif merged:
-            self.update_ui_with_data(merged)
-        else:
-            messagebox.showerror("Error", "Failed to retrieve data.")
-            self.status_var.set("Error! No data received.")
-
-    def start_fetch_thread(self):
-        thread = threading.Thread(target=self.fetch_and_display_info, daemon=True)
-        thread.start()
-
-    def _get_current_record(self) -> dict:
-        """
-        Return a normalized dictionary for export/map
-        """
-        d = {
-            "local_ipv4": self.info_vars.get("local_ipv4").get(),
-            "local_ipv6": self.info_vars.get("local_ipv6").get(),
-            "public_ip": self.info_vars.get("public_ip").get(),
-            "version": self.info_vars.get("version").get(),
-            "city": self.info_vars.get("city").get(),
-            "region": self.info_vars.get("region").get(),
-            "country": self.info_vars.get("country").get(),
-            "latitude": self.info_vars.get("latitude").get(),
-            "longitude": self.info_vars.get("longitude").get(),
-            "timezone": self.info_vars.get("timezone").get(),
-            "org": self.info_vars.get("org").get(),
-            "asn": self.info_vars.get("asn").get(),
-        }
-        return d
-
-    def export_json(self):
-        record = self._get_current_record()
-        if record["public_ip"] in ("N/A", "") and record["local_ipv4"] in ("N/A", ""):
-            messagebox.showwarning("No data", "No IP data to export. Fetch data first.")
-            return
-        file_path = filedialog.asksaveasfilename(
-            defaultextension=".json", filetypes=[("JSON file", "*.json")], title="Save as JSON"
-        )
-        if not file_path:
-            return
-        try:
-            with open(file_path, "w", encoding="utf-8") as f:
-                json.dump(record, f, indent=2)
-            messagebox.showinfo("Exported", f"Data exported to {file_path}")
-        except Exception as e:
-            messagebox.showerror("Export Error", f"Failed to export JSON: {e}")
-
-    def export_csv(self):
-        record = self._get_current_record()
-        if record["public_ip"] in ("N/A", "") and record["local_ipv4"] in ("N/A", ""):
-            messagebox.showwarning("No data", "No IP data to export. Fetch data first.")
-            return
-        file_path = filedialog.asksaveasfilename(
-            defaultextension=".csv", filetypes=[("CSV file", "*.csv")], title="Save as CSV"
-        )
-        if not file_path:
-            return
-        try:
-            # write a single-row CSV with headers
-            with open(file_path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=list(record.keys()))
-                writer.writeheader()
-                writer.writerow(record)
-            messagebox.showinfo("Exported", f"Data exported to {file_path}")
-        except Exception as e:
-            messagebox.showerror("Export Error", f"Failed to export CSV: {e}")
-
-    def show_map(self):
-        lat = self.info_vars.get("latitude").get()
-        lon = self.info_vars.get("longitude").get()
-        public_ip = self.info_vars.get("public_ip").get()
-
-        if not lat or lat in ("N/A", "") or not lon or lon in ("N/A", ""):
-            messagebox.showwarning("No coordinates", "No latitude/longitude available. Fetch data first.")
-            return
-
-        try:
-            lat_f = float(lat)
-            lon_f = float(lon)
-        except Exception:
-            messagebox.showerror("Invalid coordinates", "Latitude/Longitude are not valid numeric values.")
-            return
-
-        # Prefer folium if available
-        if FOLIUM_AVAILABLE:
-            try:
-                m = folium.Map(location=[lat_f, lon_f], zoom_start=10)
-                tooltip = f"Public IP: {public_ip}"
-                folium.Marker([lat_f, lon_f], popup=tooltip, tooltip=tooltip).add_to(m)
-                # Save to a temporary file near current working directory
-                path = os.path.join(os.getcwd(), "ip_map.html")
-                m.save(path)
-                webbrowser.open(f"file://{path}")
-                self.status_var.set(f"Map opened in browser (saved to {path})")
-                return
-            except Exception as e:
-                # fallback to google maps
-                print("Folium error:", e)
-
-        # Fallback: open Google Maps with lat,lon
-        gmaps_url = f"https://www.google.com/maps/search/?api=1&query={lat_f},{lon_f}"
-        webbrowser.open(gmaps_url)
-        self.status_var.set("Opened location in Google Maps.")
-
-if __name__ == "__main__":
-    root = tk.Tk()
-    app = IPInfoApp(root)
-    root.mainloop()
+import tkinter as tk
+from tkinter import ttk, messagebox, filedialog
+import threading
+import queue
+import asyncio
+import webbrowser
+import json
+import csv
+import os
+import tempfile
+import time
+import importlib.util
+import metrics
+from network import RECORD_FIELDS
+from network_async import discover_async
+from ip_cache import IPInfoCache, default_cache_path
+from history import HistoryStore, default_history_path
+from records import IPRecord
+from monitor import IPMonitor
+
+from map_generator import MapCache, generate_map
+
+# folium is optional: only check that it is installed here, map_generator imports it on first render
+FOLIUM_AVAILABLE = importlib.util.find_spec("folium") is not None
+
+# how long the "Get My IP Info" answer is reused before asking ipapi.co again
+SELF_LOOKUP_TTL = 10 * 60
+
+# the result queue is drained, and the fields refreshed, at most once per frame
+FRAME_MS = 16
+
+# queue tag of IPMonitor change events
+MONITOR_EVENT = "monitor"
+
+# export choices: None exports the displayed result, otherwise history of the last N seconds (0: all of it)
+EXPORT_WINDOWS = {
+    "Current result": None,
+    "History: last hour": 3600,
+    "History: last 24 hours": 86400,
+    "History: last 7 days": 7 * 86400,
+    "History: everything": 0,
+}
+
+
+class FetchJob:
+    """
+    One background discover_async() run on its own thread and event loop. The result
+    is posted to `results` as (job, merged); cancel() aborts the outstanding requests
+    and a cancelled job posts nothing.
+    """
+
+    def __init__(self, results: queue.Queue, **options):
+        self.results = results
+        self.options = options
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._task = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "FetchJob":
+        self.thread.start()
+        return self
+
+    async def _discover(self) -> dict:
+        with self._lock:
+            if self.cancelled.is_set():
+                raise asyncio.CancelledError
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.current_task()
+        return await discover_async(**self.options)
+
+    def _run(self):
+        try:
+            merged = asyncio.run(self._discover())
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            merged = {"error": f"Failed to retrieve data: {e}"}
+        if not self.cancelled.is_set():
+            self.results.put((self, merged))
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled.set()
+            if self._loop is not None:
+                try:
+                    self._loop.call_soon_threadsafe(self._task.cancel)
+                except RuntimeError:
+                    pass  # loop already finished
+
+
+class IPInfoApp:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("VLS-EM | Public & Local IP + Geolocation")
+        self.root.geometry("600x680")
+        self.root.resizable(False, False)
+        self.root.config(bg="#e0f2f7")
+
+        style = ttk.Style()
+        style.theme_use('clam')
+
+        style.configure("TLabel", font=("Segoe UI", 10), background="#e0f2f7", foreground="#333333")
+        style.configure("Header.TLabel", font=("Segoe UI", 16, "bold"), background="#e0f2f7", foreground="#004d66")
+        style.configure("Subheader.TLabel", font=("Segoe UI", 9, "italic"), background="#e0f2f7", foreground="#004d66")
+        style.configure("Field.TLabel", font=("Segoe UI", 10, "bold"), background="#e0f2f7", foreground="#007bff")
+        style.configure("Value.TLabel", font=("Segoe UI", 10), background="#e0f2f7", foreground="#555555", wraplength=350)
+        style.configure("TButton", font=("Segoe UI", 11, "bold"), background="#28a745", foreground="white", relief="flat")
+        style.map("TButton",
+                  background=[('active', '#218838'), ('pressed', '#1e7e34')],
+                  foreground=[('active', 'white'), ('pressed', 'white')])
+        style.configure("TFrame", background="#e0f2f7")
+        style.configure("Status.TLabel", font=("Segoe UI", 8, "italic"), background="#e0f2f7", foreground="#6c757d")
+
+        main_frame = ttk.Frame(self.root, padding="20", style="TFrame")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        title_label = ttk.Label(main_frame, text="🌎 VLS-EM IP & Geolocation", style="Header.TLabel", anchor="center")
+        title_label.grid(row=0, column=0, columnspan=3, pady=(0, 5), sticky="ew")
+
+        group_label = ttk.Label(main_frame, text="Shows local IPv4/IPv6 and public IP + geolocation.", style="Subheader.TLabel", anchor="center")
+        group_label.grid(row=1, column=0, columnspan=3, pady=(0, 10), sticky="ew")
+
+        ttk.Separator(main_frame, orient='horizontal').grid(row=2, column=0, columnspan=3, sticky="ew", pady=(0, 10))
+
+        self.info_vars = {}
+        fields = [
+            ("Local IPv4", "local_ipv4"),
+            ("Local IPv6", "local_ipv6"),
+            ("Public IP", "public_ip"),
+            ("IP Version", "version"),
+            ("City", "city"),
+            ("Region", "region"),
+            ("Country", "country"),
+            ("Latitude", "latitude"),
+            ("Longitude", "longitude"),
+            ("Timezone", "timezone"),
+            ("ISP / Org", "org"),
+            ("ASN", "asn"),
+        ]
+
+        for i, (label_text, key) in enumerate(fields):
+            label = ttk.Label(main_frame, text=f"{label_text}:", style="Field.TLabel")
+            label.grid(row=i + 3, column=0, sticky="w", padx=5, pady=4)
+            self.info_vars[key] = tk.StringVar(value="N/A")
+            value_label = ttk.Label(main_frame, textvariable=self.info_vars[key], style="Value.TLabel")
+            value_label.grid(row=i + 3, column=1, columnspan=2, sticky="w", padx=5, pady=4)
+
+        ttk.Separator(main_frame, orient='horizontal').grid(row=len(fields) + 3, column=0, columnspan=3, sticky="ew", pady=(15, 10))
+
+        fetch_button = ttk.Button(main_frame, text="🚀 Get My IP Info", command=self.start_fetch_thread, style="TButton")
+        fetch_button.grid(row=len(fields) + 4, column=0, sticky="ew", padx=3, pady=(0, 8))
+
+        export_csv_button = ttk.Button(main_frame, text="⬇️ Export CSV", command=self.export_csv, style="TButton")
+        export_csv_button.grid(row=len(fields) + 4, column=1, sticky="ew", padx=3, pady=(0, 8))
+
+        export_json_button = ttk.Button(main_frame, text="⬇️ Export JSON", command=self.export_json, style="TButton")
+        export_json_button.grid(row=len(fields) + 4, column=2, sticky="ew", padx=3, pady=(0, 8))
+
+        map_button = ttk.Button(main_frame, text="🗺️ Show Map", command=self.show_map, style="TButton")
+        map_button.grid(row=len(fields) + 5, column=0, columnspan=2, sticky="ew", padx=3, pady=(4, 8))
+
+        self.cancel_button = ttk.Button(main_frame, text="✖ Cancel", command=self.cancel_fetch, style="TButton", state="disabled")
+        self.cancel_button.grid(row=len(fields) + 5, column=2, sticky="ew", padx=3, pady=(4, 8))
+
+        export_label = ttk.Label(main_frame, text="Export:", style="Field.TLabel")
+        export_label.grid(row=len(fields) + 6, column=0, sticky="w", padx=5, pady=(0, 4))
+        self.export_window_var = tk.StringVar(value=next(iter(EXPORT_WINDOWS)))
+        export_window = ttk.Combobox(main_frame, textvariable=self.export_window_var, values=list(EXPORT_WINDOWS), state="readonly")
+        export_window.grid(row=len(fields) + 6, column=1, columnspan=2, sticky="ew", padx=3, pady=(0, 4))
+
+        self.progress_bar = ttk.Progressbar(main_frame, orient="horizontal", mode="indeterminate")
+        self.progress_bar.grid(row=len(fields) + 7, column=0, columnspan=3, pady=(5, 5), sticky="ew")
+        self.progress_bar.grid_remove()
+
+        self.status_var = tk.StringVar(value="Ready. Click the button to fetch data.")
+        status_label = ttk.Label(main_frame, textvariable=self.status_var, style="Status.TLabel")
+        status_label.grid(row=len(fields) + 8, column=0, columnspan=3, pady=(5, 0), sticky="ew")
+
+        powered_by_label = ttk.Label(main_frame, text="Public data by ipapi.co • Map via folium or Google Maps", font=("Segoe UI", 7, "italic"), background="#e0f2f7", foreground="#999999")
+        powered_by_label.grid(row=len(fields) + 9, column=1, columnspan=2, pady=(12, 0), sticky="se")
+
+        self.auto_refresh_var = tk.BooleanVar(value=False)
+        auto_refresh = ttk.Checkbutton(main_frame, text="Auto-refresh on IP change", variable=self.auto_refresh_var, command=self.toggle_auto_refresh)
+        auto_refresh.grid(row=len(fields) + 9, column=0, pady=(12, 0), sticky="sw")
+
+        main_frame.grid_columnconfigure(0, weight=1)
+        main_frame.grid_columnconfigure(1, weight=2)
+        main_frame.grid_columnconfigure(2, weight=2)
+
+        # store latest raw data, and its normalized form used by export and map
+        self.latest_data = {}
+        self.latest_record = IPRecord()
+        self.cache = self._open_cache()
+        self.history = self._open_history()
+        self.map_cache = None
+        # opt-in phase timings (VLSM_METRICS / VLSM_METRICS_FILE / VLSM_METRICS_PORT), shown in the status bar
+        metrics.enable_from_env()
+        self.metrics_file = os.environ.get("VLSM_METRICS_FILE")
+        self.prefix_table = self._open_prefix_table()
+        self.city_index = self._open_city_index()
+
+        # worker threads only ever touch this queue; Tk state is changed on the main thread
+        self._results = queue.Queue()
+        self._fetch = None
+        self.monitor = None
+        self.root.after(FRAME_MS, self._drain_results)
+
+    @staticmethod
+    def _open_cache() -> IPInfoCache:
+        """
+        Persistent lookup cache; falls back to memory-only when the cache dir is not writable.
+        """
+        try:
+            return IPInfoCache(default_cache_path(), max_entries=1000)
+        except Exception as e:
+            print("Cache error:", e)
+            return IPInfoCache(max_entries=1000)
+
+    @staticmethod
+    def _open_history() -> HistoryStore:
+        """
+        Lookup history on disk; falls back to memory-only when the data dir is not writable.
+        """
+        try:
+            return HistoryStore(default_history_path())
+        except Exception as e:
+            print("History error:", e)
+            return HistoryStore()
+
+    @staticmethod
+    def _open_prefix_table():
+        """
+        Routing table (a prefix_trie build, or a datasets directory that is reloaded
+        as new versions land) named by VLSM_PREFIX_TABLE, whose announcing ASN/org
+        replace ipapi.co's; None when unset or unreadable.
+        """
+        path = os.environ.get("VLSM_PREFIX_TABLE")
+        if not path:
+            return None
+        try:
+            from datasets import open_dataset
+            return open_dataset(path, extension=".vpfx")
+        except (OSError, ValueError) as e:
+            print("Prefix table error:", e)
+            return None
+
+    @staticmethod
+    def _open_city_index():
+        """
+        Gazetteer index (a reverse_geocode build) named by VLSM_CITY_INDEX, which fills
+        place fields ipapi.co left empty and labels the map; None when unset or unreadable.
+        """
+        path = os.environ.get("VLSM_CITY_INDEX")
+        if not path:
+            return None
+        try:
+            from reverse_geocode import CityIndex
+            return CityIndex.load(path)
+        except (ImportError, OSError, ValueError, KeyError) as e:
+            print("City index error:", e)
+            return None
+
+    def _get_map_cache(self):
+        if self.map_cache is None:
+            try:
+                self.map_cache = MapCache()
+            except OSError:
+                # cache dir not writable: per-process temp dir instead
+                self.map_cache = MapCache(tempfile.mkdtemp(prefix="vlsm-maps-"))
+        return self.map_cache
+
+    def update_ui_with_data(self, data: dict):
+        # combine fields coming from local + public responses; normalized once here
+        if self.prefix_table is not None and "error" not in data:
+            data = self.prefix_table.annotate(dict(data))
+        if self.city_index is not None and "error" not in data:
+            data = next(self.city_index.fill([dict(data)]))
+        self.latest_record = IPRecord.from_dict(data)
+        record = self.latest_record.as_record()
+        for key in RECORD_FIELDS:
+            # unchanged fields are skipped so a refresh only redraws what moved
+            if self.info_vars[key].get() != str(record[key]):
+                self.info_vars[key].set(record[key])
+        self.status_var.set(self._with_metrics("Data updated successfully."))
+        self.latest_data = data.copy()
+        try:
+            self.history.append(data)
+        except Exception as e:
+            print("History error:", e)
+
+    def _with_metrics(self, message: str) -> str:
+        """
+        Appends the latest lookup's phase timings to a status message when metrics
+        are enabled, and refreshes the Prometheus textfile if one is configured.
+        """
+        registry = metrics.get_metrics()
+        if registry is None:
+            return message
+        if self.metrics_file:
+            try:
+                registry.write_prometheus(self.metrics_file)
+            except OSError as e:
+                print("Metrics error:", e)
+        summary = registry.summary()
+        return f"{message} {summary}" if summary else message
+
+    def _set_busy(self, busy: bool):
+        if busy:
+            self.progress_bar.grid()
+            self.progress_bar.start()
+            self.cancel_button.state(["!disabled"])
+        else:
+            self.progress_bar.stop()
+            self.progress_bar.grid_remove()
+            self.cancel_button.state(["disabled"])
+
+    def _drain_results(self):
+        # only the newest result of the current job matters; older ones are dropped
+        latest = None
+        changed = False
+        while True:
+            try:
+                job, merged = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if job == MONITOR_EVENT:
+                changed = self._remember_self_lookup(merged) or changed
+            elif job is self._fetch:
+                latest = merged
+        if changed and self.monitor is not None:
+            # the new address is already geolocated and cached, so this refresh is cheap
+            self.start_fetch_thread()
+        if latest is not None:
+            self._fetch = None
+            self._set_busy(False)
+            self.display_result(latest)
+        self.root.after(FRAME_MS, self._drain_results)
+
+    def display_result(self, merged: dict):
+        if "error" in merged:
+            messagebox.showerror("Connection Error", merged["error"])
+            self.status_var.set("Error! Could not fetch public data.")
+            # still display local IPs
+            self.update_ui_with_data(merged)
+        elif merged:
+            self.update_ui_with_data(merged)
+        else:
+            messagebox.showerror("Error", "Failed to retrieve data.")
+            self.status_var.set("Error! No data received.")
+
+    def start_fetch_thread(self):
+        if self._fetch is not None:
+            # a fetch is already running: this click joins it instead of starting another
+            self.status_var.set("Still fetching... (Cancel to abort)")
+            return
+        self._set_busy(True)
+        self.status_var.set("Fetching data from API and local interfaces...")
+        # local probes and the public IPv4/IPv6 lookups run concurrently; cached
+        # public answers are re-checked every 10 minutes
+        self._fetch = FetchJob(self._results, cache=self.cache, ttl=SELF_LOOKUP_TTL).start()
+
+    def toggle_auto_refresh(self):
+        if self.auto_refresh_var.get():
+            self.monitor = IPMonitor(on_change=lambda event: self._results.put((MONITOR_EVENT, event))).start()
+            self.status_var.set("Auto-refresh on: watching for public IP changes.")
+        elif self.monitor is not None:
+            self.monitor.stop()
+            self.monitor = None
+            self.status_var.set("Auto-refresh off.")
+
+    def _remember_self_lookup(self, event: dict) -> bool:
+        """
+        Stores a monitor event's geolocation as the cached self lookup of its family.
+        Returns whether it is usable.
+        """
+        info = event["info"]
+        if "error" in info:
+            return False
+        family = "IPv6" if ":" in event["ip"] else "IPv4"
+        self.cache.put(f"self:{family}", info, SELF_LOOKUP_TTL)
+        return True
+
+    def cancel_fetch(self):
+        if self._fetch is None:
+            return
+        self._fetch.cancel()
+        self._fetch = None
+        self._set_busy(False)
+        self.status_var.set("Fetch cancelled.")
+
+    def _get_current_record(self) -> dict:
+        """
+        Return a normalized dictionary for export/map
+        """
+        return self.latest_record.as_record()
+
+    def _export_history(self, fmt: str) -> bool:
+        """
+        Streams the history window picked in the export box to a file.
+        Returns False when the box is set to the current result instead.
+        """
+        seconds = EXPORT_WINDOWS.get(self.export_window_var.get())
+        if seconds is None:
+            return False
+        if fmt == "csv":
+            file_path = filedialog.asksaveasfilename(
+                defaultextension=".csv", filetypes=[("CSV file", "*.csv")], title="Save history as CSV"
+            )
+        else:
+            file_path = filedialog.asksaveasfilename(
+                defaultextension=".jsonl", filetypes=[("JSON Lines file", "*.jsonl")], title="Save history as JSON Lines"
+            )
+        if not file_path:
+            return True
+        try:
+            with open(file_path, "w", newline="", encoding="utf-8") as f:
+                count = self.history.export(f, fmt, start=time.time() - seconds if seconds else None)
+            messagebox.showinfo("Exported", f"{count} lookups exported to {file_path}")
+        except Exception as e:
+            messagebox.showerror("Export Error", f"Failed to export history: {e}")
+        return True
+
+    def export_json(self):
+        if self._export_history("jsonl"):
+            return
+        record = self._get_current_record()
+        if record["public_ip"] in ("N/A", "") and record["local_ipv4"] in ("N/A", ""):
+            messagebox.showwarning("No data", "No IP data to export. Fetch data first.")
+            return
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".json", filetypes=[("JSON file", "*.json")], title="Save as JSON"
+        )
+        if not file_path:
+            return
+        try:
+            with open(file_path, "w", encoding="utf-8") as f:
+                json.dump(record, f, indent=2)
+            messagebox.showinfo("Exported", f"Data exported to {file_path}")
+        except Exception as e:
+            messagebox.showerror("Export Error", f"Failed to export JSON: {e}")
+
+    def export_csv(self):
+        if self._export_history("csv"):
+            return
+        record = self._get_current_record()
+        if record["public_ip"] in ("N/A", "") and record["local_ipv4"] in ("N/A", ""):
+            messagebox.showwarning("No data", "No IP data to export. Fetch data first.")
+            return
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".csv", filetypes=[("CSV file", "*.csv")], title="Save as CSV"
+        )
+        if not file_path:
+            return
+        try:
+            # write a single-row CSV with headers
+            with open(file_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=list(record.keys()))
+                writer.writeheader()
+                writer.writerow(record)
+            messagebox.showinfo("Exported", f"Data exported to {file_path}")
+        except Exception as e:
+            messagebox.showerror("Export Error", f"Failed to export CSV: {e}")
+
+    def show_map(self):
+        lat_f = self.latest_record.latitude
+        lon_f = self.latest_record.longitude
+        public_ip = self.latest_record.public_ip
+
+        if lat_f is None or lon_f is None:
+            messagebox.showwarning("No coordinates", "No latitude/longitude available. Fetch data first.")
+            return
+
+        tooltip = f"Public IP: {public_ip}"
+        if self.city_index is not None:
+            place = self.city_index.label(lat_f, lon_f)
+            if place:
+                tooltip = f"{tooltip} (near {place})"
+
+        # Prefer folium if available; identical requests reuse the cached HTML file
+        if FOLIUM_AVAILABLE:
+            with metrics.phase("map", "render"):
+                path = generate_map(lat_f, lon_f, tooltip=tooltip, cache=self._get_map_cache())
+            if path:
+                webbrowser.open(f"file://{path}")
+                self.status_var.set(f"Map opened in browser (saved to {path})")
+                return
+            # fallback to google maps
+            metrics.error("map", "render")
+            print("Folium error: map could not be rendered")
+
+        # Fallback: open Google Maps with lat,lon
+        gmaps_url = f"https://www.google.com/maps/search/?api=1&query={lat_f},{lon_f}"
+        webbrowser.open(gmaps_url)
+        self.status_var.set("Opened location in Google Maps.")
+
+if __name__ == "__main__":
+    root = tk.Tk()
+    app = IPInfoApp(root)
+    root.mainloop()